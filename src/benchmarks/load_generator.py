@@ -0,0 +1,78 @@
+"""Load generator for inference_server.py.
+
+Sends the same image from concurrent clients and reports throughput and
+p50/p99 latency for every server. Start one server with
+--max_batch_size 1 as the single-request baseline and one with dynamic
+batching, then run from the src directory:
+    python -m benchmarks.load_generator ../images/boys.jpg \
+        --url http://127.0.0.1:8000 --url http://127.0.0.1:8001
+"""
+import argparse
+import threading
+import time
+try:
+    from urllib.request import Request
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import Request
+    from urllib2 import urlopen
+
+import numpy as np
+
+
+def send_request(url, image_data):
+    request = Request(url + '/detect', data=image_data,
+                      headers={'Content-Type': 'application/octet-stream'})
+    response = urlopen(request)
+    response.read()
+    response.close()
+
+
+def run_load(url, image_data, concurrency, num_requests):
+    """Returns the total elapsed time and the latency of every request."""
+    latencies = []
+    lock = threading.Lock()
+    request_counter = [0]
+
+    def client():
+        while True:
+            with lock:
+                if request_counter[0] >= num_requests:
+                    return
+                request_counter[0] += 1
+            start_time = time.time()
+            send_request(url, image_data)
+            latency = time.time() - start_time
+            with lock:
+                latencies.append(latency)
+
+    # warm up the server before measuring
+    send_request(url, image_data)
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    start_time = time.time()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return time.time() - start_time, np.asarray(latencies)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('image_path')
+    parser.add_argument('--url', action='append', required=True)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--num_requests', type=int, default=500)
+    args = parser.parse_args()
+
+    image_data = open(args.image_path, 'rb').read()
+    print('{:<28} {:>10} {:>10} {:>10}'.format('server', 'req/s',
+                                              'p50 [ms]', 'p99 [ms]'))
+    for url in args.url:
+        elapsed_time, latencies = run_load(url, image_data,
+                                           args.concurrency,
+                                           args.num_requests)
+        print('{:<28} {:>10.1f} {:>10.1f} {:>10.1f}'.format(url,
+                    len(latencies) / elapsed_time,
+                    1000 * np.percentile(latencies, 50),
+                    1000 * np.percentile(latencies, 99)))
@@ -0,0 +1,73 @@
+"""Benchmark of the score ordered non-maximum suppression against the
+previous y_max ordered implementation.
+
+Run from the src directory:
+    python -m benchmarks.nms
+"""
+import time
+
+import numpy as np
+
+from utils.boxes import apply_non_max_suppression
+from utils.boxes import calculate_intersection_over_union
+from utils.synthetic import make_detections
+
+
+def legacy_non_max_suppression(boxes, iou_threshold=.2):
+    """Previous implementation of apply_non_max_suppression, which orders
+    boxes by y_max and deletes the suppressed boxes at every iteration."""
+    if len(boxes) == 0:
+            return []
+    selected_indices = []
+    x_min = boxes[:, 0]
+    y_min = boxes[:, 1]
+    x_max = boxes[:, 2]
+    y_max = boxes[:, 3]
+    classes = boxes[:, 4:]
+    sorted_box_indices = np.argsort(y_max)
+    while len(sorted_box_indices) > 0:
+            last = len(sorted_box_indices) - 1
+            i = sorted_box_indices[last]
+            selected_indices.append(i)
+            box = [x_min[i], y_min[i], x_max[i], y_max[i]]
+            box = np.asarray(box)
+            test_boxes = [x_min[sorted_box_indices[:last], None],
+                     y_min[sorted_box_indices[:last], None],
+                     x_max[sorted_box_indices[:last], None],
+                     y_max[sorted_box_indices[:last], None]]
+            test_boxes = np.concatenate(test_boxes, axis=-1)
+            iou = calculate_intersection_over_union(box, test_boxes)
+            current_class = np.argmax(classes[i])
+            box_classes = np.argmax(classes[sorted_box_indices[:last]], axis=-1)
+            class_mask = current_class == box_classes
+            overlap_mask = iou > iou_threshold
+            delete_mask = np.logical_and(overlap_mask, class_mask)
+            sorted_box_indices = np.delete(sorted_box_indices, np.concatenate(([last],
+                    np.where(delete_mask)[0])))
+    return boxes[selected_indices]
+
+
+def time_function(function, repetitions=3):
+    elapsed_times = []
+    for repetition in range(repetitions):
+        start_time = time.time()
+        function()
+        elapsed_times.append(time.time() - start_time)
+    return min(elapsed_times)
+
+
+if __name__ == '__main__':
+    iou_threshold = .45
+    print('{:>8} {:>12} {:>12} {:>8}'.format('boxes', 'legacy [ms]',
+                                             'scored [ms]', 'speedup'))
+    for num_boxes in [1000, 2000, 5000, 10000]:
+        detections = make_detections(num_boxes)
+        legacy_time = time_function(lambda: legacy_non_max_suppression(
+                                            detections, iou_threshold))
+        # the legacy implementation only suppresses boxes of one class
+        scored_time = time_function(lambda: apply_non_max_suppression(
+                                    detections, iou_threshold,
+                                    class_aware=True))
+        print('{:>8} {:>12.2f} {:>12.2f} {:>8.1f}'.format(num_boxes,
+                    1000 * legacy_time, 1000 * scored_time,
+                    legacy_time / scored_time))
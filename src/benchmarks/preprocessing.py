@@ -0,0 +1,52 @@
+"""Benchmark of the single-resize preprocessing into a preallocated batch
+buffer against the previous preprocessing chain of predict.
+
+Run from the src directory:
+    python -m benchmarks.preprocessing
+"""
+import numpy as np
+
+from utils.preprocessing import allocate_image_batch
+from utils.preprocessing import preprocess_image_into
+from utils.preprocessing import preprocess_images
+from utils.preprocessing import resize_image_array
+from benchmarks.nms import time_function
+
+
+def legacy_preprocessing(image_arrays, target_size):
+    """Previous chain: cast to float32, back to uint8 for the PIL resize,
+    again to float32 and a copy through preprocess_images."""
+    image_arrays = [resize_image_array(image_array.astype('float32'),
+                                       target_size)
+                    for image_array in image_arrays]
+    return preprocess_images(np.asarray(image_arrays))
+
+
+def single_resize_preprocessing(image_arrays, batch):
+    for image_array, output in zip(image_arrays, batch):
+        preprocess_image_into(image_array, output)
+    return batch
+
+
+if __name__ == '__main__':
+    target_size = (300, 300)
+    frame_shapes = [(480, 640), (720, 1280), (1080, 1920)]
+    random_state = np.random.RandomState(0)
+    print('{:>12} {:>6} {:>12} {:>12} {:>8} {:>10}'.format('frame',
+            'batch', 'legacy [ms]', 'new [ms]', 'speedup', 'max diff'))
+    for frame_shape in frame_shapes:
+        for batch_size in [1, 8]:
+            image_arrays = [random_state.randint(0, 256, frame_shape + (3,))
+                            .astype('uint8') for _ in range(batch_size)]
+            batch = allocate_image_batch(batch_size, target_size)
+            legacy_time = time_function(
+                lambda: legacy_preprocessing(image_arrays, target_size), 10)
+            new_time = time_function(
+                lambda: single_resize_preprocessing(image_arrays, batch), 10)
+            max_difference = np.max(np.abs(
+                legacy_preprocessing(image_arrays, target_size) -
+                single_resize_preprocessing(image_arrays, batch)))
+            print('{:>12} {:>6} {:>12.2f} {:>12.2f} {:>7.1f}x {:>10.2g}'
+                  .format('{}x{}'.format(*frame_shape), batch_size,
+                          1000 * legacy_time, 1000 * new_time,
+                          legacy_time / new_time, max_difference))
@@ -0,0 +1,34 @@
+"""Latency, prior box count and parameter count of every SSD preset of
+models.ssd_builder.
+
+Run from the src directory:
+    python -m benchmarks.presets
+"""
+import numpy as np
+
+from models.ssd_builder import PRESETS
+from models.ssd_builder import build_preset
+from utils.boxes import create_prior_boxes
+from benchmarks.nms import time_function
+
+
+if __name__ == '__main__':
+    batch_sizes = [1, 8]
+    print('{:<20} {:>8} {:>12} '.format('preset', 'priors', 'parameters') +
+          ' '.join(['{:>14}'.format('batch {} [ms]'.format(batch_size))
+                    for batch_size in batch_sizes]))
+    for preset_name in sorted(PRESETS):
+        model = build_preset(preset_name)
+        num_prior_boxes = len(create_prior_boxes(model))
+        latencies = []
+        for batch_size in batch_sizes:
+            images = np.random.uniform(-120, 130, (batch_size,) +
+                                       model.input_shape[1:])
+            images = images.astype('float32')
+            model.predict(images, batch_size=batch_size)
+            latencies.append(time_function(
+                lambda: model.predict(images, batch_size=batch_size), 10))
+        print('{:<20} {:>8} {:>12} '.format(preset_name, num_prior_boxes,
+                                            model.count_params()) +
+              ' '.join(['{:>14.1f}'.format(1000 * latency)
+                        for latency in latencies]))
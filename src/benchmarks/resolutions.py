@@ -0,0 +1,42 @@
+"""Latency and prior box count of SSD300 and SSD512 at several input
+resolutions, to choose the resolution of a deployment by its latency
+target.
+
+Run from the src directory:
+    python -m benchmarks.resolutions --sizes 240 300 384 512
+"""
+import argparse
+
+import numpy as np
+
+from models.ssd_builder import PRESETS
+from models.ssd_builder import build_preset
+from utils.prior_boxes import load_prior_box_set
+from benchmarks.nms import time_function
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--presets', nargs='+', default=['SSD300', 'SSD512'],
+                        choices=sorted(PRESETS))
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[240, 300, 384, 512])
+    parser.add_argument('--repetitions', type=int, default=10)
+    args = parser.parse_args()
+
+    print('{:<12} {:>10} {:>8} {:>14} {:>10}'.format('preset', 'input',
+          'priors', 'latency [ms]', 'frames/s'))
+    for preset_name in args.presets:
+        for size in args.sizes:
+            model = build_preset(preset_name, input_shape=(size, size, 3))
+            # priors are cached per resolution in trained_models/prior_boxes
+            num_prior_boxes = len(load_prior_box_set(model).boxes)
+            images = np.random.uniform(-120, 130, (1, size, size, 3))
+            images = images.astype('float32')
+            model.predict(images, batch_size=1)
+            latency = time_function(
+                    lambda: model.predict(images, batch_size=1),
+                    args.repetitions)
+            print('{:<12} {:>10} {:>8} {:>14.1f} {:>10.2f}'.format(
+                  preset_name, '{}x{}'.format(size, size), num_prior_boxes,
+                  1000 * latency, 1 / latency))
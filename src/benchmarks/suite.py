@@ -0,0 +1,206 @@
+"""Microbenchmarks of the box and data utilities on synthetic data at the
+scales of SSD300: 7308 prior boxes, 1 to 100 objects and 21 or 81
+classes.
+
+Every case reports its best time, throughput and peak memory traced by
+tracemalloc. The results are written as JSON and can be compared with
+the results of a previous run. Run from the src directory:
+    python -m benchmarks.suite --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from utils.boxes import apply_non_max_suppression
+from utils.boxes import assign_prior_boxes
+from utils.boxes import calculate_intersection_over_union
+from utils.boxes import calculate_pairwise_intersection_over_union
+from utils.boxes import decode_boxes
+from utils.datasets import XMLParser
+from utils.datasets import get_class_names
+from utils.synthetic import make_detections
+from utils.synthetic import make_ground_truth
+from utils.synthetic import make_predictions
+from utils.synthetic import make_prior_boxes
+
+BOX_SCALE_FACTORS = [.1, .1, .2, .2]
+
+
+def write_VOC_annotations(path, num_files, random_state=None):
+    """Writes num_files VOC2007 xml annotations with 1 to 10 objects."""
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    class_names = get_class_names('VOC2007')[1:]
+    for file_arg in range(num_files):
+        objects = []
+        for object_arg in range(random_state.randint(1, 11)):
+            x_min, y_min = random_state.randint(0, 250, 2)
+            x_max, y_max = random_state.randint(260, 500, 2)
+            objects.append(
+                '<object><name>{}</name><difficult>{}</difficult>'
+                '<bndbox><xmin>{}</xmin><ymin>{}</ymin><xmax>{}</xmax>'
+                '<ymax>{}</ymax></bndbox></object>'.format(
+                    random_state.choice(class_names),
+                    random_state.randint(0, 2), x_min, y_min, x_max, y_max))
+        annotation = ('<annotation><filename>{:06d}.jpg</filename><size>'
+                      '<width>500</width><height>375</height><depth>3'
+                      '</depth></size>{}</annotation>').format(
+                            file_arg, ''.join(objects))
+        with open(os.path.join(path, '{:06d}.xml'.format(file_arg)),
+                  'w') as xml_file:
+            xml_file.write(annotation)
+
+
+def measure(function, num_items, repetitions=5):
+    """Returns the best and mean time of function, the number of items
+    processed per second and the peak memory in bytes allocated by
+    one call."""
+    function()
+    elapsed_times = []
+    for repetition in range(repetitions):
+        start_time = time.time()
+        function()
+        elapsed_times.append(time.time() - start_time)
+    tracemalloc.start()
+    function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    best_time = min(elapsed_times)
+    return {'best_time': best_time,
+            'mean_time': float(np.mean(elapsed_times)),
+            'throughput': num_items / best_time,
+            'peak_memory': peak_memory}
+
+
+def iou_cases(prior_boxes):
+    box = make_ground_truth(1)[0, :4]
+    yield ('calculate_intersection_over_union', {'num_boxes': 1},
+           lambda: calculate_intersection_over_union(box, prior_boxes), 1)
+    for num_objects in [10, 100]:
+        boxes = make_ground_truth(num_objects)[:, :4]
+        yield ('calculate_pairwise_intersection_over_union',
+               {'num_boxes': num_objects},
+               lambda boxes=boxes: calculate_pairwise_intersection_over_union(
+                                                    boxes, prior_boxes),
+               num_objects)
+
+
+def assign_cases(prior_boxes):
+    for num_classes in [21, 81]:
+        for num_objects in [1, 10, 100]:
+            ground_truth_data = make_ground_truth(num_objects, num_classes)
+            yield ('assign_prior_boxes',
+                   {'num_objects': num_objects, 'num_classes': num_classes},
+                   lambda ground_truth_data=ground_truth_data,
+                   num_classes=num_classes: assign_prior_boxes(prior_boxes,
+                        ground_truth_data, num_classes, BOX_SCALE_FACTORS),
+                   1)
+
+
+def decode_cases(prior_boxes):
+    for num_classes in [21, 81]:
+        predictions = make_predictions(prior_boxes, num_classes)
+        yield ('decode_boxes', {'num_classes': num_classes},
+               lambda predictions=predictions: decode_boxes(predictions,
+                                        prior_boxes, BOX_SCALE_FACTORS),
+               1)
+
+
+def non_max_suppression_cases(prior_boxes):
+    for num_classes in [21, 81]:
+        for num_boxes in [1000, 5000]:
+            detections = make_detections(num_boxes, num_classes)
+            yield ('apply_non_max_suppression',
+                   {'num_boxes': num_boxes, 'num_classes': num_classes},
+                   lambda detections=detections: apply_non_max_suppression(
+                                        detections, .45, class_aware=True),
+                   1)
+
+
+def transform_cases(prior_boxes):
+    from utils.data_augmentation import ImageGenerator
+    image_generator = ImageGenerator({}, prior_boxes, 21, BOX_SCALE_FACTORS,
+                                     32, (300, 300), [], [])
+    random_state = np.random.RandomState(0)
+    for image_shape in [(300, 300), (375, 500)]:
+        image_array = random_state.uniform(0, 255, image_shape + (3,))
+        box_corners = make_ground_truth(10)[:, :4]
+        yield ('ImageGenerator.transform',
+               {'image_shape': list(image_shape)},
+               lambda image_array=image_array, box_corners=box_corners:
+                    image_generator.transform(image_array,
+                                              box_corners.copy()),
+               1)
+
+
+def XML_parser_cases(prior_boxes, path):
+    num_files = 200
+    write_VOC_annotations(path, num_files)
+    yield ('XMLParser', {'num_files': num_files},
+           lambda: XMLParser(path + os.sep), num_files)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='results of a previous run')
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--skip_transform', action='store_true',
+                        help='skip ImageGenerator, which imports keras')
+    args = parser.parse_args()
+
+    prior_boxes = make_prior_boxes()
+    annotations_path = tempfile.mkdtemp()
+    case_generators = [iou_cases(prior_boxes), assign_cases(prior_boxes),
+                       decode_cases(prior_boxes),
+                       non_max_suppression_cases(prior_boxes),
+                       XML_parser_cases(prior_boxes, annotations_path)]
+    if not args.skip_transform:
+        case_generators.append(transform_cases(prior_boxes))
+
+    previous_results = dict()
+    if args.compare is not None:
+        with open(args.compare) as json_file:
+            for result in json.load(json_file)['results']:
+                key = (result['name'], json.dumps(result['parameters'],
+                                                  sort_keys=True))
+                previous_results[key] = result
+
+    results = []
+    print('{:<44} {:>36} {:>12} {:>12} {:>10} {:>9}'.format('benchmark',
+          'parameters', 'best [ms]', 'items/s', 'peak [MB]', 'speedup'))
+    try:
+        for cases in case_generators:
+            for name, parameters, function, num_items in cases:
+                result = measure(function, num_items, args.repetitions)
+                result['name'] = name
+                result['parameters'] = parameters
+                results.append(result)
+                key = (name, json.dumps(parameters, sort_keys=True))
+                speedup = ''
+                if key in previous_results:
+                    speedup = '{:.2f}x'.format(
+                            previous_results[key]['best_time'] /
+                            result['best_time'])
+                print('{:<44} {:>36} {:>12.3f} {:>12.1f} {:>10.2f} {:>9}'
+                      .format(name, json.dumps(parameters, sort_keys=True),
+                              1000 * result['best_time'],
+                              result['throughput'],
+                              result['peak_memory'] / 2.**20, speedup))
+    finally:
+        shutil.rmtree(annotations_path)
+
+    with open(args.output, 'w') as json_file:
+        json.dump({'numpy_version': np.__version__,
+                   'python_version': platform.python_version(),
+                   'platform': platform.platform(),
+                   'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'results': results}, json_file, indent=2)
+    print('Results written to {}'.format(args.output))
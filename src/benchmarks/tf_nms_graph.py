@@ -0,0 +1,38 @@
+"""Long run check that repeated calls to the TensorFlow non-maximum
+suppression do not grow the graph.
+
+Run from the src directory:
+    python -m benchmarks.tf_nms_graph
+"""
+import time
+
+import numpy as np
+
+from utils import tf_boxes
+from utils.synthetic import make_detections
+
+
+def count_operations(graph):
+    return len(graph.get_operations())
+
+
+if __name__ == '__main__':
+    num_calls = 10000
+    random_state = np.random.RandomState(0)
+    # the first call with a threshold builds its op set
+    tf_boxes.apply_non_max_suppression(make_detections(10), .45)
+    initial_num_operations = count_operations(tf_boxes.graph)
+    start_time = time.time()
+    for call_arg in range(num_calls):
+        num_boxes = random_state.randint(0, 500)
+        detections = make_detections(num_boxes, random_state=random_state)
+        tf_boxes.apply_non_max_suppression(detections, .45)
+        num_operations = count_operations(tf_boxes.graph)
+        if call_arg % 1000 == 0:
+            print('call {:>6} graph operations {:>4}'.format(call_arg,
+                                                             num_operations))
+    elapsed_time = time.time() - start_time
+    num_added_operations = num_operations - initial_num_operations
+    print('{} calls in {:.1f} s, {} operations added'.format(
+                        num_calls, elapsed_time, num_added_operations))
+    assert num_added_operations == 0, 'graph grew during repeated calls'
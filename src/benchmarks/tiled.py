@@ -0,0 +1,66 @@
+"""Throughput of tiled inference on 1920x1200 dashcam sized frames against
+predict on the whole frame.
+
+Run from the src directory, optionally with a frame and the weights:
+    python -m benchmarks.tiled --image_path frame.jpg \
+        --weights_path ../trained_models/weights_SSD300.hdf5
+"""
+import argparse
+
+import numpy as np
+
+from models.ssd import SSD300
+from utils.boxes import calculate_box_centers
+from utils.inference import calculate_tiles
+from utils.inference import predict
+from utils.inference import predict_tiled
+from utils.preprocessing import load_pil_image
+from utils.prior_boxes import load_prior_box_set
+from benchmarks.nms import time_function
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--image_path')
+    parser.add_argument('--weights_path')
+    parser.add_argument('--repetitions', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.image_path is None:
+        random_state = np.random.RandomState(0)
+        image_array = random_state.randint(0, 256, (1200, 1920, 3))
+        image_array = image_array.astype('uint8')
+    else:
+        image_array = np.asarray(load_pil_image(args.image_path))
+    model = SSD300()
+    prior_boxes = load_prior_box_set(model).boxes
+    if args.weights_path is not None:
+        model.load_weights(args.weights_path)
+    prior_box_centers = calculate_box_centers(prior_boxes)
+    image_shape = image_array.shape[0:2]
+
+    print('{:<24} {:>6} {:>12} {:>10} {:>8}'.format('mode', 'tiles',
+          'latency [ms]', 'frames/s', 'boxes'))
+    boxes = predict(model, image_array, prior_boxes, image_shape,
+                    prior_box_centers=prior_box_centers)
+    latency = time_function(lambda: predict(model, image_array, prior_boxes,
+                            image_shape, prior_box_centers=prior_box_centers),
+                            args.repetitions)
+    print('{:<24} {:>6} {:>12.1f} {:>10.2f} {:>8}'.format('whole frame', 1,
+          1000 * latency, 1 / latency, 0 if boxes is None else len(boxes)))
+    for tile_size, overlap in [((600, 600), .2), ((450, 450), .2),
+                               ((300, 300), .25)]:
+        num_tiles = len(calculate_tiles(image_shape, tile_size, overlap)) + 1
+
+        def run_tiled():
+            return predict_tiled(model, image_array, prior_boxes, tile_size,
+                                 overlap, pre_nms_top_k=400,
+                                 prior_box_centers=prior_box_centers)
+
+        boxes = run_tiled()
+        latency = time_function(run_tiled, args.repetitions)
+        print('{:<24} {:>6} {:>12.1f} {:>10.2f} {:>8}'.format(
+              'tiles {}x{} overlap {}'.format(tile_size[0], tile_size[1],
+                                              overlap),
+              num_tiles, 1000 * latency, 1 / latency,
+              0 if boxes is None else len(boxes)))
@@ -4,15 +4,11 @@ from utils.datasets import DataManager
 from utils.datasets import get_class_names
 from utils.inference import predict
 from utils.preprocessing import load_image
-from utils.boxes import create_prior_boxes
-from utils.preprocessing import image_to_array
-from utils.preprocessing import load_pil_image
+from utils.prior_boxes import load_prior_box_set
 from utils.preprocessing import get_image_size
-from utils.boxes import calculate_intersection_over_union
+from utils.boxes import calculate_pairwise_intersection_over_union
 from utils.boxes import denormalize_box
-from models.ssd import SSD300
 #from utils.visualizer import draw_image_boxes
-from utils.datasets import get_arg_to_class
 
 def compute_precision_and_recall(scores, labels, num_gt):
     sorted_indices = np.argsort(scores)
@@ -42,92 +38,109 @@ def compute_average_precision(precision, recall):
             (recall[indices] - recall[indices - 1]) * precision[indices])
     return average_precision
 
-dataset_name = 'VOC2007'
-data_prefix = '../datasets/VOCtest/VOCdevkit/VOC2007/Annotations/'
-image_prefix = '../datasets/VOCtest/VOCdevkit/VOC2007/JPEGImages/'
-weights_path = '../trained_models/weights_SSD300.hdf5'
-model = SSD300(weights_path=weights_path)
-prior_boxes = create_prior_boxes(model)
-input_shape = model.input_shape[1:3]
-class_threshold = .1
-iou_threshold = .5
-
-
-average_precisions = []
-for ground_truth_class_arg in range(1, 21):
-    labels = []
-    scores = []
+def evaluate(model, prior_boxes, dataset_name='VOC2007', data_prefix=None,
+             image_prefix=None, class_threshold=.1, iou_threshold=.5,
+             num_images=None):
+    """Computes the VOC average precision of every class and their mean
+    for the detections of model, which needs the input_shape and predict
+    of a Keras model. The predictions of every image are computed once
+    and reused for every class. If num_images is given only the first
+    num_images images of every class are evaluated.
+    """
+    input_shape = model.input_shape[1:3]
     class_names = get_class_names(dataset_name)
-    #ground_truth_class_arg = class_arg
-    selected_classes = [class_names[0]] + [class_names[ground_truth_class_arg]]
-    num_ground_truth_boxes = 0
-    class_decoder = get_arg_to_class(class_names)
     num_classes = len(class_names)
-    data_manager = DataManager(dataset_name, selected_classes,
-                                data_prefix, image_prefix)
-    ground_truth_data = data_manager.load_data()
-    difficult_data_flags = data_manager.parser.difficult_objects
-
-    image_names = sorted(list(ground_truth_data.keys()))
-    print('Number of images found:', len(image_names))
-    for image_name in image_names:
-        ground_truth_sample = ground_truth_data[image_name]
-        image_prefix = data_manager.image_prefix
-        image_path = image_prefix + image_name
-        image_array = load_image(image_path, input_shape)
-        original_image_array = image_to_array(load_pil_image(image_path))
-        original_image_size = get_image_size(image_path)
-        predicted_data = predict(model, image_array, prior_boxes, original_image_size,
-                                        21, class_threshold, iou_threshold)
-        ground_truth_sample = denormalize_box(ground_truth_sample, original_image_size)
-        ground_truth_boxes_in_image = len(ground_truth_sample)
-        difficult_objects = difficult_data_flags[image_name]
-        difficult_objects = np.asarray(difficult_objects, dtype=bool)
-        num_ground_truth_boxes += np.sum(np.logical_not(difficult_objects))
-        if predicted_data is None:
-            print('Zero predictions given for image:', image_name)
-            continue
-        #plt.imshow(original_image_array.astype('uint8'))
-        #plt.show()
-        #draw_image_boxes(predicted_data, original_image_array, class_decoder, normalized=False)
-        num_predictions = len(predicted_data)
-        for prediction_arg in range(num_predictions):
-            predicted_box = predicted_data[prediction_arg]
-            predicted_class_probabilities = predicted_box[4:]
-            predicted_class_arg = np.argmax(predicted_class_probabilities)
-            predicted_score = np.max(predicted_class_probabilities)
-            ious = calculate_intersection_over_union(predicted_box, ground_truth_sample)
-            num_objects = len(ground_truth_sample)
-            for object_arg in range(num_objects):
-                #ground_truth_classes = ground_truth_sample[object_arg][4:]
-                #ground_truth_class_arg = np.argmax(ground_truth_classes)
-                difficult = difficult_objects[object_arg]
-                if difficult:
-                    #num_ground_truth_boxes = num_ground_truth_boxes - 1
-                    continue
-                iou = ious[object_arg]
-                if iou >= iou_threshold and predicted_class_arg == ground_truth_class_arg:
-                    #print('True positive:', box_arg)
-                    scores.append(predicted_score)
-                    labels.append(True)
-
-                if iou >= iou_threshold and predicted_class_arg != ground_truth_class_arg:
-                    #print('False positive:', box_arg)
-                    scores.append(predicted_score)
-                    labels.append(False)
-
-    scores = np.asarray(scores)
-    labels = np.asarray(labels)
-    precision, recall = compute_precision_and_recall(scores, labels,
-                                            num_ground_truth_boxes)
-    average_precision = compute_average_precision(precision, recall)
-    average_precisions.append(average_precision)
-    print('Class:', selected_classes[-1])
-    print('AP:', average_precision)
-    print('Number of ground_truth_boxes:', num_ground_truth_boxes)
-
-average_precisions = np.asarray(average_precisions)
-mean_average_precision = np.mean(average_precisions)
-print('mAP:', mean_average_precision)
-
-
+    image_predictions = dict()
+    average_precisions = []
+    for ground_truth_class_arg in range(1, num_classes):
+        labels = []
+        scores = []
+        #ground_truth_class_arg = class_arg
+        selected_classes = ([class_names[0]] +
+                            [class_names[ground_truth_class_arg]])
+        num_ground_truth_boxes = 0
+        data_manager = DataManager(dataset_name, selected_classes,
+                                    data_prefix, image_prefix)
+        ground_truth_data = data_manager.load_data()
+        difficult_data_flags = data_manager.parser.difficult_objects
+
+        image_names = sorted(list(ground_truth_data.keys()))
+        if num_images is not None:
+            image_names = image_names[:num_images]
+        print('Number of images found:', len(image_names))
+        for image_name in image_names:
+            ground_truth_sample = ground_truth_data[image_name]
+            image_path = data_manager.image_prefix + image_name
+            original_image_size = get_image_size(image_path)
+            if image_name not in image_predictions:
+                image_array = load_image(image_path, input_shape)
+                image_predictions[image_name] = predict(model, image_array,
+                                prior_boxes, original_image_size,
+                                num_classes, class_threshold, iou_threshold)
+            predicted_data = image_predictions[image_name]
+            ground_truth_sample = denormalize_box(ground_truth_sample,
+                                                  original_image_size)
+            difficult_objects = difficult_data_flags[image_name]
+            difficult_objects = np.asarray(difficult_objects, dtype=bool)
+            num_ground_truth_boxes += np.sum(
+                                    np.logical_not(difficult_objects))
+            if predicted_data is None:
+                print('Zero predictions given for image:', image_name)
+                continue
+            #plt.imshow(original_image_array.astype('uint8'))
+            #plt.show()
+            #draw_image_boxes(predicted_data, original_image_array, class_decoder, normalized=False)
+            num_predictions = len(predicted_data)
+            prediction_ious = calculate_pairwise_intersection_over_union(
+                                        predicted_data, ground_truth_sample)
+            for prediction_arg in range(num_predictions):
+                predicted_box = predicted_data[prediction_arg]
+                predicted_class_probabilities = predicted_box[4:]
+                predicted_class_arg = np.argmax(
+                                        predicted_class_probabilities)
+                predicted_score = np.max(predicted_class_probabilities)
+                ious = prediction_ious[prediction_arg]
+                num_objects = len(ground_truth_sample)
+                for object_arg in range(num_objects):
+                    difficult = difficult_objects[object_arg]
+                    if difficult:
+                        continue
+                    iou = ious[object_arg]
+                    if (iou >= iou_threshold and
+                            predicted_class_arg == ground_truth_class_arg):
+                        scores.append(predicted_score)
+                        labels.append(True)
+
+                    if (iou >= iou_threshold and
+                            predicted_class_arg != ground_truth_class_arg):
+                        scores.append(predicted_score)
+                        labels.append(False)
+
+        scores = np.asarray(scores)
+        labels = np.asarray(labels)
+        precision, recall = compute_precision_and_recall(scores, labels,
+                                                num_ground_truth_boxes)
+        average_precision = compute_average_precision(precision, recall)
+        average_precisions.append(average_precision)
+        print('Class:', selected_classes[-1])
+        print('AP:', average_precision)
+        print('Number of ground_truth_boxes:', num_ground_truth_boxes)
+
+    average_precisions = np.asarray(average_precisions)
+    return np.mean(average_precisions), average_precisions
+
+
+if __name__ == '__main__':
+    from models.ssd import SSD300
+    dataset_name = 'VOC2007'
+    data_prefix = '../datasets/VOCtest/VOCdevkit/VOC2007/Annotations/'
+    image_prefix = '../datasets/VOCtest/VOCdevkit/VOC2007/JPEGImages/'
+    weights_path = '../trained_models/weights_SSD300.hdf5'
+    model = SSD300(weights_path=weights_path)
+    prior_boxes = load_prior_box_set(model).boxes
+    class_threshold = .1
+    iou_threshold = .5
+    mean_average_precision, average_precisions = evaluate(model,
+                            prior_boxes, dataset_name, data_prefix,
+                            image_prefix, class_threshold, iou_threshold)
+    print('mAP:', mean_average_precision)
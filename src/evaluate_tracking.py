@@ -0,0 +1,109 @@
+"""Accuracy of detecting every N frames and tracking in between against
+detecting every frame of a recorded clip.
+
+The detector runs once on every frame of the clip and its detections
+are the reference. For every stride the detections of every N-th frame
+are fed to utils.tracking.BoxTracker and its propagated boxes are
+matched with the reference boxes of every frame. Run from the src
+directory:
+    python evaluate_tracking.py clip.mp4 --strides 1 2 3 5 10
+"""
+import argparse
+
+import numpy as np
+
+from utils.boxes import calculate_box_centers
+from utils.boxes import split_boxes_batch
+from utils.inference import detect_boxes_batch
+from utils.tracking import BoxTracker
+from utils.tracking import DetectionScheduler
+from utils.tracking import match_boxes
+from utils.video import FrameDecoder
+
+
+def detect_clip(model, video_path, prior_boxes, num_classes=21,
+                batch_size=16, lower_probability_threshold=.1,
+                iou_threshold=.5):
+    """Returns the detected boxes of every frame of a video file."""
+    prior_box_centers = calculate_box_centers(prior_boxes)
+    decoder = FrameDecoder(video_path, model.input_shape[1:3], batch_size)
+    frame_boxes = []
+    for (frame_indices, timestamps, image_arrays,
+         original_image_shapes) in decoder:
+        predictions = model.predict(image_arrays,
+                                    batch_size=len(image_arrays))
+        boxes, offsets = detect_boxes_batch(predictions, prior_boxes,
+                original_image_shapes, num_classes,
+                lower_probability_threshold, iou_threshold,
+                prior_box_centers=prior_box_centers)
+        frame_boxes.extend(split_boxes_batch(boxes, offsets))
+    return frame_boxes
+
+
+def evaluate_stride(frame_boxes, scheduler, tracker=None,
+                    iou_threshold=.5):
+    """Matches the boxes tracked between the detections scheduled by
+    scheduler with the reference boxes of every frame.
+
+    Returns a dictionary with the detection_rate, the precision and
+    recall of the tracked boxes, the mean intersection over union of
+    their matches and the number of track ids."""
+    if tracker is None:
+        tracker = BoxTracker()
+    num_tracked, num_reference, num_matches = 0, 0, 0
+    matched_ious = []
+    track_ids = set()
+    for reference_boxes in frame_boxes:
+        boxes, frame_track_ids = tracker.predict()
+        if scheduler.should_detect():
+            boxes, frame_track_ids = tracker.update(reference_boxes)
+            scheduler.report_agreement(tracker.agreement)
+        matches, ious = match_boxes(boxes, reference_boxes, iou_threshold)
+        num_tracked = num_tracked + len(boxes)
+        num_reference = num_reference + len(reference_boxes)
+        num_matches = num_matches + len(matches)
+        matched_ious.append(ious)
+        track_ids.update(frame_track_ids.tolist())
+    matched_ious = np.concatenate(matched_ious)
+    return {'detection_rate': scheduler.detection_rate,
+            'precision': num_matches / float(max(num_tracked, 1)),
+            'recall': num_matches / float(max(num_reference, 1)),
+            'mean_iou': float(np.mean(matched_ious))
+                        if len(matched_ious) > 0 else 0.,
+            'num_tracks': len(track_ids)}
+
+
+if __name__ == '__main__':
+    from models.ssd import SSD300
+    from utils.datasets import get_class_names
+    from utils.prior_boxes import load_prior_box_set
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('video_path')
+    parser.add_argument('--strides', nargs='+', type=int,
+                        default=[1, 2, 3, 5, 10])
+    parser.add_argument('--weights_path',
+                        default='../trained_models/weights_SSD300.hdf5')
+    parser.add_argument('--dataset_name', default='VOC2007')
+    parser.add_argument('--no_kalman', action='store_true',
+                        help='keep the boxes at their last detection')
+    args = parser.parse_args()
+
+    class_names = get_class_names(args.dataset_name)
+    model = SSD300(num_classes=len(class_names))
+    prior_boxes = load_prior_box_set(model).boxes
+    model.load_weights(args.weights_path)
+    frame_boxes = detect_clip(model, args.video_path, prior_boxes,
+                              len(class_names))
+
+    schedulers = [('stride {}'.format(stride), DetectionScheduler(stride))
+                  for stride in args.strides]
+    schedulers.append(('adaptive', DetectionScheduler(adaptive=True)))
+    print('{} frames'.format(len(frame_boxes)))
+    print('{:<12} {:>10} {:>10} {:>8} {:>9} {:>7}'.format('schedule',
+          'detected', 'precision', 'recall', 'mean IoU', 'tracks'))
+    for name, scheduler in schedulers:
+        tracker = BoxTracker(use_kalman=not args.no_kalman)
+        result = evaluate_stride(frame_boxes, scheduler, tracker)
+        print('{:<12} {:>10.1%} {:>10.3f} {:>8.3f} {:>9.3f} {:>7}'.format(
+              name, result['detection_rate'], result['precision'],
+              result['recall'], result['mean_iou'], result['num_tracks']))
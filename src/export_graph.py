@@ -0,0 +1,165 @@
+"""Export SSD300 as a frozen TensorFlow graph whose outputs are the final
+detections, with the box decoding, thresholding, denormalization and
+non-maximum suppression of utils.inference.predict done in the graph.
+
+The graph takes the preprocessed images ('images', the input of the
+model) and their original (height, width) ('image_shapes') and returns
+'detections' with shape (batch_size, keep_top_k, 4 + num_classes) and
+'num_detections' with shape (batch_size).
+
+Run from the src directory:
+    python export_graph.py
+    python export_graph.py --check ../images
+The second command compares the frozen graph with predict on every
+image of the directory.
+"""
+import argparse
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from utils.preprocessing import allocate_image_batch
+from utils.preprocessing import load_pil_image
+from utils.preprocessing import preprocess_image_into
+from utils.tf_boxes import detect_boxes
+
+INPUT_NAMES = ['images', 'image_shapes']
+OUTPUT_NAMES = ['detections', 'num_detections']
+
+
+def build_detection_graph(model, prior_boxes, num_classes=21,
+                          lower_probability_threshold=.1, iou_threshold=.5,
+                          background_index=0,
+                          box_scale_factors=[.1, .1, .2, .2],
+                          keep_top_k=100, class_aware=False):
+    """Adds the detection inputs and outputs around model to the graph of
+    the Keras session."""
+    images = tf.placeholder('float32', (None,) + model.input_shape[1:],
+                            name=INPUT_NAMES[0])
+    image_shapes = tf.placeholder('float32', (None, 2),
+                                  name=INPUT_NAMES[1])
+    predictions = model(images)
+    detections, num_detections = detect_boxes(predictions, prior_boxes,
+                            image_shapes, num_classes,
+                            lower_probability_threshold, iou_threshold,
+                            background_index, box_scale_factors, keep_top_k,
+                            class_aware)
+    detections = tf.identity(detections, name=OUTPUT_NAMES[0])
+    num_detections = tf.identity(num_detections, name=OUTPUT_NAMES[1])
+    return detections, num_detections
+
+
+def export_frozen_graph(model, prior_boxes, output_path, **kwargs):
+    """Writes the detection graph of model with its weights as constants
+    to output_path. kwargs are passed to build_detection_graph."""
+    import keras.backend as K
+    build_detection_graph(model, prior_boxes, **kwargs)
+    session = K.get_session()
+    graph_def = tf.graph_util.convert_variables_to_constants(session,
+                            session.graph.as_graph_def(), OUTPUT_NAMES)
+    output_directory, filename = os.path.split(output_path)
+    tf.train.write_graph(graph_def, output_directory, filename,
+                         as_text=False)
+    return graph_def
+
+
+class FrozenDetector(object):
+    """Runs a graph written by export_frozen_graph in its own session.
+
+    # Arguments
+        graph_path: Path of the frozen graph.
+        input_size: (height, width) of the model input.
+    """
+    def __init__(self, graph_path, input_size=(300, 300)):
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(graph_path, 'rb') as graph_file:
+            graph_def.ParseFromString(graph_file.read())
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.session = tf.Session(graph=self.graph)
+        self.input_size = input_size
+        self.images = self.graph.get_tensor_by_name(INPUT_NAMES[0] + ':0')
+        self.image_shapes = self.graph.get_tensor_by_name(
+                                                INPUT_NAMES[1] + ':0')
+        self.detections = self.graph.get_tensor_by_name(
+                                                OUTPUT_NAMES[0] + ':0')
+        self.num_detections = self.graph.get_tensor_by_name(
+                                                OUTPUT_NAMES[1] + ':0')
+
+    def predict(self, image_arrays):
+        """Returns a list with the detected boxes of every RGB image array,
+        in the format of utils.inference.predict."""
+        batch = allocate_image_batch(len(image_arrays), self.input_size)
+        for image_array, output in zip(image_arrays, batch):
+            preprocess_image_into(image_array, output)
+        image_shapes = [image_array.shape[0:2]
+                        for image_array in image_arrays]
+        detections, num_detections = self.session.run(
+                    [self.detections, self.num_detections],
+                    feed_dict={self.images: batch,
+                               self.image_shapes: image_shapes})
+        return [image_detections[:image_num_detections]
+                for image_detections, image_num_detections
+                in zip(detections, num_detections)]
+
+
+def check_parity(model, prior_boxes, detector, image_paths,
+                 num_classes=21, tolerance=1e-2):
+    """Compares the detections of the frozen graph with the ones of
+    predict and returns the largest absolute difference. Raises an
+    AssertionError if they differ by more than tolerance."""
+    from utils.inference import predict
+    max_difference = 0.
+    for image_path in image_paths:
+        image_array = np.asarray(load_pil_image(image_path))
+        expected_boxes = predict(model, image_array, prior_boxes,
+                                 image_array.shape[0:2], num_classes)
+        if expected_boxes is None:
+            expected_boxes = np.zeros((0, 4 + num_classes))
+        boxes = detector.predict([image_array])[0]
+        if boxes.shape != expected_boxes.shape:
+            raise AssertionError('{}: {} boxes instead of {}'.format(
+                        image_path, len(boxes), len(expected_boxes)))
+        if len(boxes) > 0:
+            max_difference = max(max_difference,
+                                 np.max(np.abs(boxes - expected_boxes)))
+        if max_difference > tolerance:
+            raise AssertionError('{}: detections differ by {}'.format(
+                                            image_path, max_difference))
+    return max_difference
+
+
+if __name__ == '__main__':
+    import keras.backend as K
+    from models.ssd import SSD300
+    from utils.datasets import get_class_names
+    from utils.datasets import list_files_in_directory
+    from utils.prior_boxes import load_prior_box_set
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--weights_path',
+                        default='../trained_models/weights_SSD300.hdf5')
+    parser.add_argument('--output_path',
+                        default='../trained_models/SSD300_detections.pb')
+    parser.add_argument('--dataset_name', default='VOC2007')
+    parser.add_argument('--check', metavar='IMAGE_DIRECTORY',
+                        help='compare the exported graph with predict')
+    args = parser.parse_args()
+
+    K.set_learning_phase(0)
+    num_classes = len(get_class_names(args.dataset_name))
+    model = SSD300(num_classes=num_classes)
+    prior_boxes = load_prior_box_set(model).boxes
+    model.load_weights(args.weights_path)
+    export_frozen_graph(model, prior_boxes, args.output_path,
+                        num_classes=num_classes)
+    print('Frozen graph written to {}'.format(args.output_path))
+    if args.check is not None:
+        detector = FrozenDetector(args.output_path, model.input_shape[1:3])
+        image_paths = list_files_in_directory(
+                            os.path.join(args.check, '*.jpg'))
+        max_difference = check_parity(model, prior_boxes, detector,
+                                      image_paths, num_classes)
+        print('Parity with predict on {} images, max difference {}'.format(
+                                        len(image_paths), max_difference))
@@ -0,0 +1,244 @@
+"""HTTP inference server that holds one SSD300 model and groups concurrent
+requests into dynamic batches.
+
+POST an encoded image (JPEG, PNG...) to /detect and the detections are
+returned as JSON. Run from the src directory:
+    python inference_server.py --port 8000 --max_batch_size 16
+Run with --max_batch_size 1 to serve every request on its own.
+"""
+import argparse
+import json
+import threading
+import time
+from io import BytesIO
+try:
+    import queue
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    import Queue as queue
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image as pil_image
+
+from utils.boxes import calculate_box_centers
+from utils.boxes import split_boxes_batch
+from utils.datasets import get_arg_to_class
+from utils.datasets import get_class_names
+from utils.inference import detect_boxes_batch
+from utils.preprocessing import allocate_image_batch
+from utils.preprocessing import preprocess_image_into
+
+
+# errors of PIL on undecodable, corrupt or oversized images
+IMAGE_ERRORS = (IOError, ValueError, SyntaxError,
+                pil_image.DecompressionBombError)
+
+
+class DetectionRequest(object):
+    def __init__(self, image_array, original_image_shape):
+        self.image_array = image_array
+        self.original_image_shape = original_image_shape
+        self.event = threading.Event()
+        self.boxes = None
+        self.error = None
+
+
+class MicroBatcher(object):
+    """Collects the requests of concurrent clients into batches of up to
+    max_batch_size images and runs them through the model in a single
+    worker thread. A batch is closed when it is full or max_latency
+    seconds after its first request arrived.
+    """
+    def __init__(self, model, prior_boxes, num_classes=21,
+                 max_batch_size=16, max_latency=.01,
+                 lower_probability_threshold=.1, iou_threshold=.5,
+                 background_index=0, box_scale_factors=[.1, .1, .2, .2],
+                 keep_top_k=100):
+        self.model = model
+        self.prior_boxes = prior_boxes
+        self.prior_box_centers = calculate_box_centers(prior_boxes)
+        self.num_classes = num_classes
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.lower_probability_threshold = lower_probability_threshold
+        self.iou_threshold = iou_threshold
+        self.background_index = background_index
+        self.box_scale_factors = box_scale_factors
+        self.keep_top_k = keep_top_k
+        self.input_size = model.input_shape[1:3]
+        # the model is called from the worker thread
+        self.model._make_predict_function()
+        self.graph = tf.get_default_graph()
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self._run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def detect(self, image):
+        """Detect the boxes of a PIL image, blocking until its batch has
+        been processed."""
+        original_image_shape = image.size[::-1]
+        image_array = allocate_image_batch(1, self.input_size)[0]
+        preprocess_image_into(image, image_array)
+        request = DetectionRequest(image_array, original_image_shape)
+        self.requests.put(request)
+        request.event.wait()
+        if request.error is not None:
+            raise request.error
+        return request.boxes
+
+    def _collect_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.time() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._process_batch(batch)
+            except Exception as error:
+                for request in batch:
+                    request.error = error
+            finally:
+                for request in batch:
+                    request.event.set()
+
+    def _process_batch(self, batch):
+        image_arrays = np.asarray([request.image_array
+                                   for request in batch])
+        original_image_shapes = [request.original_image_shape
+                                 for request in batch]
+        with self.graph.as_default():
+            predictions = self.model.predict(image_arrays,
+                                             batch_size=len(batch))
+        selected_boxes, offsets = detect_boxes_batch(predictions,
+                self.prior_boxes, original_image_shapes, self.num_classes,
+                self.lower_probability_threshold, self.iou_threshold,
+                self.background_index, self.box_scale_factors,
+                keep_top_k=self.keep_top_k,
+                prior_box_centers=self.prior_box_centers)
+        for request, boxes in zip(batch,
+                                  split_boxes_batch(selected_boxes, offsets)):
+            request.boxes = boxes
+
+
+def boxes_to_dictionaries(box_data, arg_to_class):
+    detections = []
+    for box in box_data:
+        class_arg = int(np.argmax(box[4:]))
+        detections.append({'x_min': float(box[0]), 'y_min': float(box[1]),
+                           'x_max': float(box[2]), 'y_max': float(box[3]),
+                           'class': arg_to_class[class_arg],
+                           'score': float(box[4 + class_arg])})
+    return detections
+
+
+class DetectionRequestHandler(BaseHTTPRequestHandler):
+    batcher = None
+    arg_to_class = None
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': 'unknown path'})
+
+    def do_POST(self):
+        if self.path != '/detect':
+            self._send_json(404, {'error': 'unknown path'})
+            return
+        image = self._read_image()
+        if image is None:
+            return
+        try:
+            boxes = self.batcher.detect(image)
+            detections = boxes_to_dictionaries(boxes, self.arg_to_class)
+        except Exception as error:
+            self._send_json(500, {'error': 'detection failed: {}'.format(
+                                                                    error)})
+            return
+        self._send_json(200, {'detections': detections})
+
+    def _read_image(self):
+        """Returns the RGB PIL image of the request body, or None after
+        sending the error response of an invalid request."""
+        content_length = self.headers.get('Content-Length')
+        if content_length is None:
+            self._send_json(411, {'error': 'missing Content-Length'})
+            return None
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            content_length = -1
+        if content_length <= 0:
+            self._send_json(400, {'error': 'invalid Content-Length'})
+            return None
+        try:
+            image = pil_image.open(BytesIO(self.rfile.read(content_length)))
+            # open only reads the header, truncated data fails on load
+            image.load()
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+        except IMAGE_ERRORS:
+            self._send_json(400, {'error': 'invalid image'})
+            return None
+        return image
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+if __name__ == '__main__':
+    from models.ssd import SSD300
+    from utils.prior_boxes import load_prior_box_set
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max_batch_size', type=int, default=16)
+    parser.add_argument('--max_latency', type=float, default=.01,
+                        help='seconds a batch waits for more requests')
+    parser.add_argument('--weights_path',
+                        default='../trained_models/weights_SSD300.hdf5')
+    parser.add_argument('--dataset_name', default='VOC2007')
+    args = parser.parse_args()
+
+    class_names = get_class_names(args.dataset_name)
+    model = SSD300(num_classes=len(class_names))
+    prior_boxes = load_prior_box_set(model).boxes
+    model.load_weights(args.weights_path)
+    DetectionRequestHandler.batcher = MicroBatcher(model, prior_boxes,
+                                        len(class_names),
+                                        args.max_batch_size,
+                                        args.max_latency)
+    DetectionRequestHandler.arg_to_class = get_arg_to_class(class_names)
+    server = ThreadedHTTPServer((args.host, args.port),
+                                DetectionRequestHandler)
+    print('Serving on {}:{}'.format(args.host, args.port))
+    server.serve_forever()
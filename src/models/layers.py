@@ -3,6 +3,8 @@ import keras.backend as K
 from keras.engine.topology import InputSpec
 from keras.engine.topology import Layer
 
+from utils.boxes import create_layer_prior_boxes
+
 class Normalize(Layer):
     """Normalization layer as described in ParseNet paper.
 
@@ -122,46 +124,11 @@ class PriorBox(Layer):
             input_shape = K.int_shape(x)
         layer_width = input_shape[self.waxis]
         layer_height = input_shape[self.haxis]
-        img_width = self.img_size[0]
-        img_height = self.img_size[1]
-        # define prior boxes shapes
-        box_widths = []
-        box_heights = []
-        for ar in self.aspect_ratios:
-            if ar == 1 and len(box_widths) == 0:
-                box_widths.append(self.min_size)
-                box_heights.append(self.min_size)
-            elif ar == 1 and len(box_widths) > 0:
-                box_widths.append(np.sqrt(self.min_size * self.max_size))
-                box_heights.append(np.sqrt(self.min_size * self.max_size))
-            elif ar != 1:
-                box_widths.append(self.min_size * np.sqrt(ar))
-                box_heights.append(self.min_size / np.sqrt(ar))
-        box_widths = 0.5 * np.array(box_widths)
-        box_heights = 0.5 * np.array(box_heights)
-        # define centers of prior boxes
-        step_x = img_width / layer_width
-        step_y = img_height / layer_height
-        linx = np.linspace(0.5 * step_x, img_width - 0.5 * step_x,
-                           layer_width)
-        liny = np.linspace(0.5 * step_y, img_height - 0.5 * step_y,
-                           layer_height)
-        centers_x, centers_y = np.meshgrid(linx, liny)
-        centers_x = centers_x.reshape(-1, 1)
-        centers_y = centers_y.reshape(-1, 1)
         # define xmin, ymin, xmax, ymax of prior boxes
-        num_priors_ = len(self.aspect_ratios)
-        prior_boxes = np.concatenate((centers_x, centers_y), axis=1)
-        prior_boxes = np.tile(prior_boxes, (1, 2 * num_priors_))
-        prior_boxes[:, ::4] -= box_widths
-        prior_boxes[:, 1::4] -= box_heights
-        prior_boxes[:, 2::4] += box_widths
-        prior_boxes[:, 3::4] += box_heights
-        prior_boxes[:, ::2] /= img_width
-        prior_boxes[:, 1::2] /= img_height
-        prior_boxes = prior_boxes.reshape(-1, 4)
-        if self.clip:
-            prior_boxes = np.minimum(np.maximum(prior_boxes, 0.0), 1.0)
+        prior_boxes = create_layer_prior_boxes(self.img_size,
+                                        (layer_width, layer_height),
+                                        self.aspect_ratios, self.min_size,
+                                        self.max_size, self.clip)
         # define variances
         num_boxes = len(prior_boxes)
         if len(self.variances) == 1:
@@ -20,8 +20,10 @@ def SSD300(input_shape=(300, 300, 3), num_classes=21, weights_path=None,
     """SSD300 architecture.
 
     # Arguments
-        input_shape: Shape of the input image,
-            expected to be either (300, 300, 3) or (3, 300, 300)(not tested).
+        input_shape: Shape of the input image, (300, 300, 3) or any
+            other size such as (512, 512, 3) or (240, 240, 3), for which
+            the prior box sizes are scaled by the smaller input side.
+            (3, 300, 300) is not tested.
         num_classes: Number of classes including background.
 
     # References
@@ -169,6 +171,8 @@ def SSD300(input_shape=(300, 300, 3), num_classes=21, weights_path=None,
     # Prediction from conv4_3
     num_priors = 3
     img_size = (input_shape[1], input_shape[0])
+    # prior box sizes are given in pixels of a 300x300 input
+    size_scale = min(img_size) / 300.0
     name = 'conv4_3_norm_mbox_conf'
     if num_classes != 21:
         name += '_{}'.format(num_classes)
@@ -182,7 +186,7 @@ def SSD300(input_shape=(300, 300, 3), num_classes=21, weights_path=None,
                                     name=name,
                                     padding='same')(conv4_3_norm)
     conv4_3_norm_mbox_conf_flat = Flatten(name='conv4_3_norm_mbox_conf_flat')(conv4_3_norm_mbox_conf)
-    conv4_3_norm_mbox_priorbox = PriorBox(img_size, 30.0,
+    conv4_3_norm_mbox_priorbox = PriorBox(img_size, 30.0 * size_scale,
                                           name='conv4_3_norm_mbox_priorbox',
                                           aspect_ratios=[2],
                                           variances=[0.1, 0.1, 0.2, 0.2])(conv4_3_norm)
@@ -201,9 +205,9 @@ def SSD300(input_shape=(300, 300, 3), num_classes=21, weights_path=None,
                           name='fc7_mbox_loc',
                           padding='same')(fc7)
     fc7_mbox_loc_flat = Flatten(name='fc7_mbox_loc_flat')(fc7_mbox_loc)
-    fc7_mbox_priorbox = PriorBox(img_size, 60.0,
+    fc7_mbox_priorbox = PriorBox(img_size, 60.0 * size_scale,
                                  name='fc7_mbox_priorbox',
-                                 max_size=114.0,
+                                 max_size=114.0 * size_scale,
                                  aspect_ratios=[2, 3],
                                  variances=[0.1, 0.1, 0.2, 0.2]
                                  )(fc7)
@@ -221,8 +225,8 @@ def SSD300(input_shape=(300, 300, 3), num_classes=21, weights_path=None,
                               name='conv6_2_mbox_loc',
                               padding='same')(conv6_2)
     conv6_2_mbox_loc_flat = Flatten(name='conv6_2_mbox_loc_flat')(conv6_2_mbox_loc)
-    conv6_2_mbox_priorbox = PriorBox(img_size, 114.0,
-                                     max_size=168.0,
+    conv6_2_mbox_priorbox = PriorBox(img_size, 114.0 * size_scale,
+                                     max_size=168.0 * size_scale,
                                      aspect_ratios=[2, 3],
                                      variances=[0.1, 0.1, 0.2, 0.2],
                                      name='conv6_2_mbox_priorbox')(conv6_2)
@@ -239,8 +243,8 @@ def SSD300(input_shape=(300, 300, 3), num_classes=21, weights_path=None,
                               padding='same',
                               name='conv7_2_mbox_loc')(conv7_2)
     conv7_2_mbox_loc_flat = Flatten(name='conv7_2_mbox_loc_flat')(conv7_2_mbox_loc)
-    conv7_2_mbox_priorbox = PriorBox(img_size, 168.0,
-                                     max_size=222.0,
+    conv7_2_mbox_priorbox = PriorBox(img_size, 168.0 * size_scale,
+                                     max_size=222.0 * size_scale,
                                      aspect_ratios=[2, 3],
                                      variances=[0.1, 0.1, 0.2, 0.2],
                                      name='conv7_2_mbox_priorbox')(conv7_2)
@@ -257,8 +261,8 @@ def SSD300(input_shape=(300, 300, 3), num_classes=21, weights_path=None,
                               padding='same',
                               name='conv8_2_mbox_loc')(conv8_2)
     conv8_2_mbox_loc_flat = Flatten(name='conv8_2_mbox_loc_flat')(conv8_2_mbox_loc)
-    conv8_2_mbox_priorbox = PriorBox(img_size, 222.0,
-                                     max_size=276.0,
+    conv8_2_mbox_priorbox = PriorBox(img_size, 222.0 * size_scale,
+                                     max_size=276.0 * size_scale,
                                      aspect_ratios=[2, 3],
                                      variances=[0.1, 0.1, 0.2, 0.2],
                                      name='conv8_2_mbox_priorbox')(conv8_2)
@@ -276,7 +280,9 @@ def SSD300(input_shape=(300, 300, 3), num_classes=21, weights_path=None,
     pool6_mbox_conf_flat = Dense(num_priors * num_classes, name=name)(pool6)
     pool6_reshaped = Reshape(target_shape,
                              name='pool6_reshaped')(pool6)
-    pool6_mbox_priorbox = PriorBox(img_size, 276.0, max_size=330.0, aspect_ratios=[2, 3],
+    pool6_mbox_priorbox = PriorBox(img_size, 276.0 * size_scale,
+                                   max_size=330.0 * size_scale,
+                                   aspect_ratios=[2, 3],
                                    variances=[0.1, 0.1, 0.2, 0.2],
                                    name='pool6_mbox_priorbox')(pool6_reshaped)
     # Gather all predictions
@@ -0,0 +1,369 @@
+import copy
+
+import keras.backend as K
+from keras.layers import Activation
+from keras.layers import Conv2D
+from keras.layers import Dense
+from keras.layers import Flatten
+from keras.layers import GlobalAveragePooling2D
+from keras.layers import Input
+from keras.layers import MaxPooling2D
+from keras.layers import Reshape
+from keras.layers import ZeroPadding2D
+from keras.layers import concatenate
+from keras.models import Model
+
+from .layers import Normalize
+from .layers import PriorBox
+
+# Same architecture, layer names and prior boxes as models.ssd.SSD300.
+SSD300_CONFIGURATION = {
+    'input_shape': (300, 300, 3),
+    'fc_channels': 1024,
+    'extra_layers': [
+        {'name': 'conv6', 'channels': (256, 512), 'zero_padding': False},
+        {'name': 'conv7', 'channels': (128, 256), 'zero_padding': True},
+        {'name': 'conv8', 'channels': (128, 256), 'zero_padding': False}],
+    'global_pooling': True,
+    'variances': [0.1, 0.1, 0.2, 0.2],
+    'source_layers': [
+        {'name': 'conv4_3', 'normalization': 20, 'min_size': 30.0,
+         'max_size': None, 'aspect_ratios': [2]},
+        {'name': 'fc7', 'min_size': 60.0, 'max_size': 114.0,
+         'aspect_ratios': [2, 3]},
+        {'name': 'conv6_2', 'min_size': 114.0, 'max_size': 168.0,
+         'aspect_ratios': [2, 3]},
+        {'name': 'conv7_2', 'min_size': 168.0, 'max_size': 222.0,
+         'aspect_ratios': [2, 3]},
+        {'name': 'conv8_2', 'min_size': 222.0, 'max_size': 276.0,
+         'aspect_ratios': [2, 3]},
+        {'name': 'pool6', 'min_size': 276.0, 'max_size': 330.0,
+         'aspect_ratios': [2, 3]}]}
+
+# Drops the global pooling head and the aspect ratio 3 of every layer.
+SSD300_LITE_CONFIGURATION = {
+    'input_shape': (300, 300, 3),
+    'fc_channels': 1024,
+    'extra_layers': [
+        {'name': 'conv6', 'channels': (256, 512), 'zero_padding': False},
+        {'name': 'conv7', 'channels': (128, 256), 'zero_padding': True},
+        {'name': 'conv8', 'channels': (128, 256), 'zero_padding': False}],
+    'global_pooling': False,
+    'variances': [0.1, 0.1, 0.2, 0.2],
+    'source_layers': [
+        {'name': 'conv4_3', 'normalization': 20, 'min_size': 30.0,
+         'max_size': None, 'aspect_ratios': [2]},
+        {'name': 'fc7', 'min_size': 60.0, 'max_size': 114.0,
+         'aspect_ratios': [2]},
+        {'name': 'conv6_2', 'min_size': 114.0, 'max_size': 168.0,
+         'aspect_ratios': [2]},
+        {'name': 'conv7_2', 'min_size': 168.0, 'max_size': 222.0,
+         'aspect_ratios': [2]},
+        {'name': 'conv8_2', 'min_size': 222.0, 'max_size': 330.0,
+         'aspect_ratios': [2]}]}
+
+# Drops the 38x38 conv4_3 head, halves the fully connected and extra
+# layer widths and stops at conv7_2. Only its VGG16 convolutions can be
+# initialized from SSD300 weights.
+SSD300_LITE_SMALL_CONFIGURATION = {
+    'input_shape': (300, 300, 3),
+    'fc_channels': 512,
+    'extra_layers': [
+        {'name': 'conv6', 'channels': (128, 256), 'zero_padding': False},
+        {'name': 'conv7', 'channels': (64, 128), 'zero_padding': True}],
+    'global_pooling': False,
+    'variances': [0.1, 0.1, 0.2, 0.2],
+    'source_layers': [
+        {'name': 'fc7', 'min_size': 30.0, 'max_size': 105.0,
+         'aspect_ratios': [2]},
+        {'name': 'conv6_2', 'min_size': 105.0, 'max_size': 180.0,
+         'aspect_ratios': [2]},
+        {'name': 'conv7_2', 'min_size': 180.0, 'max_size': 330.0,
+         'aspect_ratios': [2]}]}
+
+# SSD512 prior box sizes with an extra conv9 layer before the global
+# pooling, the conv4_3 head keeps the priors of SSD300.
+SSD512_CONFIGURATION = {
+    'input_shape': (512, 512, 3),
+    'fc_channels': 1024,
+    'extra_layers': [
+        {'name': 'conv6', 'channels': (256, 512), 'zero_padding': False},
+        {'name': 'conv7', 'channels': (128, 256), 'zero_padding': True},
+        {'name': 'conv8', 'channels': (128, 256), 'zero_padding': False},
+        {'name': 'conv9', 'channels': (128, 256), 'zero_padding': False}],
+    'global_pooling': True,
+    'variances': [0.1, 0.1, 0.2, 0.2],
+    'source_layers': [
+        {'name': 'conv4_3', 'normalization': 20, 'min_size': 35.84,
+         'max_size': None, 'aspect_ratios': [2]},
+        {'name': 'fc7', 'min_size': 76.8, 'max_size': 153.6,
+         'aspect_ratios': [2, 3]},
+        {'name': 'conv6_2', 'min_size': 153.6, 'max_size': 230.4,
+         'aspect_ratios': [2, 3]},
+        {'name': 'conv7_2', 'min_size': 230.4, 'max_size': 307.2,
+         'aspect_ratios': [2, 3]},
+        {'name': 'conv8_2', 'min_size': 307.2, 'max_size': 384.0,
+         'aspect_ratios': [2, 3]},
+        {'name': 'conv9_2', 'min_size': 384.0, 'max_size': 460.8,
+         'aspect_ratios': [2, 3]},
+        {'name': 'pool6', 'min_size': 460.8, 'max_size': 537.6,
+         'aspect_ratios': [2, 3]}]}
+
+PRESETS = {'SSD300': SSD300_CONFIGURATION,
+           'SSD300_lite': SSD300_LITE_CONFIGURATION,
+           'SSD300_lite_small': SSD300_LITE_SMALL_CONFIGURATION,
+           'SSD512': SSD512_CONFIGURATION}
+
+
+def scale_configuration(configuration, input_shape):
+    """Returns a copy of configuration for another input shape, in which
+    the prior box sizes, given in pixels of the configuration input, are
+    scaled by the ratio of the smaller input sides."""
+    configuration = copy.deepcopy(configuration)
+    size_scale = (float(min(input_shape[0:2])) /
+                  min(configuration['input_shape'][0:2]))
+    configuration['input_shape'] = tuple(input_shape)
+    for source in configuration['source_layers']:
+        source['min_size'] = source['min_size'] * size_scale
+        if source.get('max_size') is not None:
+            source['max_size'] = source['max_size'] * size_scale
+    return configuration
+
+
+def _build_VGG16(input_layer, fc_channels=1024):
+    """VGG16 convolutional blocks with fc6 and fc7 as convolutions, as in
+    SSD300. Returns a dictionary of the output of every layer."""
+    layers = {}
+    x = input_layer
+    blocks = [(1, 64, 2), (2, 128, 2), (3, 256, 3), (4, 512, 3), (5, 512, 3)]
+    for block_arg, num_filters, num_convolutions in blocks:
+        for convolution_arg in range(1, num_convolutions + 1):
+            name = 'conv{}_{}'.format(block_arg, convolution_arg)
+            x = Conv2D(num_filters, (3, 3),
+                       name=name,
+                       padding='same',
+                       activation='relu')(x)
+            layers[name] = x
+        name = 'pool{}'.format(block_arg)
+        if block_arg == 5:
+            x = MaxPooling2D(name=name,
+                             pool_size=(3, 3),
+                             strides=(1, 1),
+                             padding='same')(x)
+        else:
+            x = MaxPooling2D(name=name,
+                             pool_size=(2, 2),
+                             strides=(2, 2),
+                             padding='same')(x)
+        layers[name] = x
+
+    layers['fc6'] = Conv2D(fc_channels, (3, 3),
+                           name='fc6',
+                           dilation_rate=(6, 6),
+                           padding='same',
+                           activation='relu')(x)
+    layers['fc7'] = Conv2D(fc_channels, (1, 1),
+                           name='fc7',
+                           padding='same',
+                           activation='relu')(layers['fc6'])
+    return layers
+
+
+def _build_extra_layer(x, name, channels, zero_padding=False):
+    x = Conv2D(channels[0], (1, 1),
+               name=name + '_1',
+               padding='same',
+               activation='relu')(x)
+    if zero_padding:
+        x = ZeroPadding2D(name=name + '_1z')(x)
+        padding = 'valid'
+    else:
+        padding = 'same'
+    return Conv2D(channels[1], (3, 3),
+                  name=name + '_2',
+                  padding=padding,
+                  strides=(2, 2),
+                  activation='relu')(x)
+
+
+def _build_head(x, source, num_classes, img_size, variances):
+    """Returns the flat box regressions, flat class scores and prior boxes
+    of a source layer."""
+    name = source['name']
+    if source.get('normalization') is not None:
+        name = name + '_norm'
+        x = Normalize(source['normalization'], name=name)(x)
+    # the class layers of SSD300 are renamed for other number of classes
+    conf_suffix = ''
+    if num_classes != 21:
+        conf_suffix = '_{}'.format(num_classes)
+    prior_box = PriorBox(img_size, source['min_size'],
+                         max_size=source.get('max_size'),
+                         aspect_ratios=source['aspect_ratios'],
+                         variances=variances,
+                         name=name + '_mbox_priorbox')
+    num_priors = len(prior_box.aspect_ratios)
+
+    if len(K.int_shape(x)) == 2:
+        # globally pooled features are predicted with dense layers
+        mbox_loc_flat = Dense(num_priors * 4,
+                              name=name + '_mbox_loc_flat')(x)
+        mbox_conf_flat = Dense(num_priors * num_classes,
+                               name=name + '_mbox_conf_flat' +
+                               conf_suffix)(x)
+        if K.image_dim_ordering() == 'tf':
+            target_shape = (1, 1, K.int_shape(x)[-1])
+        else:
+            target_shape = (K.int_shape(x)[-1], 1, 1)
+        x = Reshape(target_shape, name=name + '_reshaped')(x)
+    else:
+        mbox_loc = Conv2D(num_priors * 4, (3, 3),
+                          name=name + '_mbox_loc',
+                          padding='same')(x)
+        mbox_loc_flat = Flatten(name=name + '_mbox_loc_flat')(mbox_loc)
+        mbox_conf = Conv2D(num_priors * num_classes, (3, 3),
+                           name=name + '_mbox_conf' + conf_suffix,
+                           padding='same')(x)
+        mbox_conf_flat = Flatten(name=name + '_mbox_conf_flat')(mbox_conf)
+    mbox_priorbox = prior_box(x)
+    return mbox_loc_flat, mbox_conf_flat, mbox_priorbox
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf8')
+    return value
+
+
+def load_matching_weights(model, weights_path):
+    """Loads by layer name the weights of the layers of model whose weight
+    shapes match the ones stored in weights_path, e.g. the VGG16 layers of
+    a lite preset from the weights of SSD300.
+
+    # Returns
+        skipped_layer_names: Names of the layers found in weights_path
+            that were not loaded because their shapes differ.
+    """
+    import h5py
+    from keras.engine.topology import preprocess_weights_for_loading
+    layers = dict((layer.name, layer) for layer in model.layers
+                  if len(layer.weights) > 0)
+    weight_value_tuples = []
+    skipped_layer_names = []
+    with h5py.File(weights_path, mode='r') as weights_file:
+        group = weights_file
+        if 'layer_names' not in group.attrs and 'model_weights' in group:
+            group = group['model_weights']
+        original_keras_version = _decode(group.attrs.get('keras_version',
+                                                         '1'))
+        original_backend = group.attrs.get('backend')
+        if original_backend is not None:
+            original_backend = _decode(original_backend)
+        for layer_name in group.attrs['layer_names']:
+            layer_name = _decode(layer_name)
+            if layer_name not in layers:
+                continue
+            layer = layers[layer_name]
+            layer_group = group[layer_name]
+            weight_values = [layer_group[_decode(weight_name)][()]
+                             for weight_name
+                             in layer_group.attrs['weight_names']]
+            weight_values = preprocess_weights_for_loading(layer,
+                                weight_values, original_keras_version,
+                                original_backend)
+            shapes = [K.int_shape(weight) for weight in layer.weights]
+            if [weight_value.shape for weight_value in weight_values] != (
+                                                                shapes):
+                skipped_layer_names.append(layer_name)
+                continue
+            weight_value_tuples.extend(zip(layer.weights, weight_values))
+    K.batch_set_value(weight_value_tuples)
+    return skipped_layer_names
+
+
+def build_SSD(configuration, num_classes=21, weights_path=None,
+              frozen_layers=None, input_shape=None):
+    """SSD with a VGG16 base built from a declarative configuration.
+
+    # Arguments
+        configuration: Dictionary with the input_shape, the number of
+            channels of fc6 and fc7 (fc_channels), the extra_layers built
+            after fc7 with their (1x1, 3x3) channels, whether a
+            global_pooling layer 'pool6' is added after them, the prior
+            box variances and the source_layers on which boxes are
+            predicted with their min_size, max_size and aspect_ratios.
+            See SSD300_CONFIGURATION and PRESETS.
+        num_classes: Number of classes including background.
+        weights_path: Weights loaded by layer name with
+            load_matching_weights, the layers whose shapes differ from
+            the stored ones, e.g. the narrower fc6 and fc7 of
+            SSD300_lite_small, keep their initial weights.
+        frozen_layers: Names of the layers that are not trained.
+        input_shape: If given the model is built for this input shape
+            instead of the one of configuration, with its prior box
+            sizes scaled by scale_configuration.
+
+    # References
+        https://arxiv.org/abs/1512.02325
+    """
+    if input_shape is not None:
+        configuration = scale_configuration(configuration, input_shape)
+    input_shape = configuration['input_shape']
+    input_layer = Input(shape=input_shape)
+    layers = _build_VGG16(input_layer, configuration['fc_channels'])
+    x = layers['fc7']
+    for extra_layer in configuration['extra_layers']:
+        x = _build_extra_layer(x, extra_layer['name'],
+                               extra_layer['channels'],
+                               extra_layer.get('zero_padding', False))
+        layers[extra_layer['name'] + '_2'] = x
+    if configuration.get('global_pooling', False):
+        layers['pool6'] = GlobalAveragePooling2D(name='pool6')(x)
+
+    img_size = (input_shape[1], input_shape[0])
+    mbox_locs, mbox_confs, mbox_priorboxes = [], [], []
+    for source in configuration['source_layers']:
+        mbox_loc, mbox_conf, mbox_priorbox = _build_head(
+                            layers[source['name']], source, num_classes,
+                            img_size, configuration['variances'])
+        mbox_locs.append(mbox_loc)
+        mbox_confs.append(mbox_conf)
+        mbox_priorboxes.append(mbox_priorbox)
+
+    mbox_loc = concatenate(mbox_locs, axis=1, name='mbox_loc')
+    mbox_conf = concatenate(mbox_confs, axis=1, name='mbox_conf')
+    mbox_priorbox = concatenate(mbox_priorboxes, axis=1,
+                                name='mbox_priorbox')
+    num_boxes = K.int_shape(mbox_loc)[-1] // 4
+    mbox_loc = Reshape((num_boxes, 4),
+                       name='mbox_loc_final')(mbox_loc)
+    mbox_conf = Reshape((num_boxes, num_classes),
+                        name='mbox_conf_logits')(mbox_conf)
+    mbox_conf = Activation('softmax',
+                           name='mbox_conf_final')(mbox_conf)
+    predictions = concatenate([mbox_loc,
+                               mbox_conf,
+                               mbox_priorbox],
+                              axis=2,
+                              name='predictions')
+    model = Model(inputs=input_layer, outputs=predictions)
+
+    if weights_path is not None:
+        load_matching_weights(model, weights_path)
+
+    if frozen_layers is not None:
+        for layer in model.layers:
+            if layer.name in frozen_layers:
+                layer.trainable = False
+
+    return model
+
+
+def build_preset(preset_name, num_classes=21, weights_path=None,
+                 frozen_layers=None, input_shape=None):
+    """Builds one of the PRESETS by name, optionally for another
+    input_shape."""
+    if preset_name not in PRESETS:
+        raise ValueError('Invalid preset name: {}'.format(preset_name))
+    return build_SSD(PRESETS[preset_name], num_classes, weights_path,
+                     frozen_layers, input_shape)
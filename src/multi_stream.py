@@ -0,0 +1,277 @@
+"""Detection on several video streams, files or devices, with one shared
+model.
+
+Every stream is read in its own thread into a small queue of frames and
+the frames of all streams are batched together in round-robin order, so
+that memory grows with the number of streams and not with copies of the
+model. Run from the src directory:
+    python multi_stream.py 0 1 dashcam.mp4 --max_batch_size 8
+"""
+import argparse
+import os
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import cv2
+import numpy as np
+
+from utils.boxes import calculate_box_centers
+from utils.boxes import split_boxes_batch
+from utils.inference import detect_boxes_batch
+from utils.preprocessing import allocate_image_batch
+from utils.preprocessing import preprocess_image_into
+from utils.timing import null_timer
+from utils.video import DROP_POLICIES
+from utils.video import put_frame
+from utils.video import read_frames_per_second
+from utils.video import read_timestamp
+
+
+class VideoStream(object):
+    """Reads the frames of a video source in a background thread.
+
+    # Arguments
+        stream_id: Name of the stream used to route its detections.
+        video_source: Device index or path of a video file.
+        queue_size: Maximum number of frames waiting for the model.
+        drop_policy: One of utils.video.DROP_POLICIES, 'latest' for live
+            cameras and 'block' to process every frame of a file.
+    """
+    def __init__(self, stream_id, video_source, queue_size=2,
+                 drop_policy='latest'):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError('Invalid drop policy: {}'.format(drop_policy))
+        self.stream_id = stream_id
+        self.video_source = video_source
+        self.drop_policy = drop_policy
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.finished = False
+        self.error = None
+        self.num_frames = 0
+        self.num_dropped = 0
+        self.num_processed = 0
+        self._thread = None
+
+    def start(self, stop_event):
+        self._thread = threading.Thread(target=self._read,
+                                        args=(stop_event,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _read(self, stop_event):
+        camera = cv2.VideoCapture(self.video_source)
+        try:
+            frames_per_second = read_frames_per_second(camera)
+            while not stop_event.is_set():
+                grabbed, frame = camera.read()
+                if not grabbed:
+                    break
+                timestamp = read_timestamp(camera, self.num_frames,
+                                           frames_per_second)
+                num_dropped = put_frame(self.frames,
+                                        (self.num_frames, timestamp, frame),
+                                        self.drop_policy, stop_event)
+                if num_dropped is None:
+                    break
+                self.num_dropped = self.num_dropped + num_dropped
+                self.num_frames = self.num_frames + 1
+        except Exception as error:
+            self.error = error
+        finally:
+            camera.release()
+            self.finished = True
+
+    def get_frame(self):
+        """Returns the next (frame_index, timestamp, frame) of the stream
+        or None if no frame is waiting."""
+        try:
+            return self.frames.get_nowait()
+        except queue.Empty:
+            return None
+
+    @property
+    def done(self):
+        return self.finished and self.frames.empty()
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+
+
+class MultiStreamDetector(object):
+    """Runs one model on the frames of several VideoStreams.
+
+    Batches take at most one frame of every stream, visiting the streams
+    in round-robin order from where the previous batch stopped, so that
+    every stream gets the same share of the model when there are more
+    streams than max_batch_size. The detections of every frame are routed
+    to callback(stream_id, frame_index, timestamp, frame, boxes).
+
+    # Arguments
+        model: SSD model shared by all streams.
+        prior_boxes: Prior boxes of model.
+        max_batch_size: Maximum number of frames per model call.
+    """
+    def __init__(self, model, prior_boxes, num_classes=21, max_batch_size=8,
+                 lower_probability_threshold=.1, iou_threshold=.5,
+                 background_index=0, box_scale_factors=[.1, .1, .2, .2],
+                 keep_top_k=100, timer=None):
+        self.model = model
+        self.prior_boxes = prior_boxes
+        self.prior_box_centers = calculate_box_centers(prior_boxes)
+        self.num_classes = num_classes
+        self.max_batch_size = max_batch_size
+        self.lower_probability_threshold = lower_probability_threshold
+        self.iou_threshold = iou_threshold
+        self.background_index = background_index
+        self.box_scale_factors = box_scale_factors
+        self.keep_top_k = keep_top_k
+        self.timer = timer
+        if self.timer is None:
+            self.timer = null_timer
+        self.input_size = model.input_shape[1:3]
+        self._image_arrays = allocate_image_batch(max_batch_size,
+                                                  self.input_size)
+        self._cursor = 0
+
+    def _collect_batch(self, streams):
+        batch = []
+        num_streams = len(streams)
+        for offset in range(num_streams):
+            stream = streams[(self._cursor + offset) % num_streams]
+            item = stream.get_frame()
+            if item is not None:
+                batch.append((stream, item))
+                if len(batch) == self.max_batch_size:
+                    break
+        self._cursor = (self._cursor + offset + 1) % num_streams
+        return batch
+
+    def _process_batch(self, batch, callback):
+        with self.timer.stage('preprocess'):
+            image_arrays = self._image_arrays[:len(batch)]
+            for (stream, (frame_index, timestamp, frame)), output in zip(
+                                                    batch, image_arrays):
+                preprocess_image_into(frame, output, True)
+        with self.timer.stage('model'):
+            predictions = self.model.predict(image_arrays,
+                                             batch_size=len(batch))
+        original_image_shapes = [frame.shape[0:2]
+                                 for stream, (frame_index, timestamp, frame)
+                                 in batch]
+        boxes, offsets = detect_boxes_batch(predictions, self.prior_boxes,
+                original_image_shapes, self.num_classes,
+                self.lower_probability_threshold, self.iou_threshold,
+                self.background_index, self.box_scale_factors,
+                keep_top_k=self.keep_top_k,
+                prior_box_centers=self.prior_box_centers, timer=self.timer)
+        for (stream, (frame_index, timestamp, frame)), frame_boxes in zip(
+                                    batch, split_boxes_batch(boxes, offsets)):
+            stream.num_processed = stream.num_processed + 1
+            callback(stream.stream_id, frame_index, timestamp, frame,
+                     frame_boxes)
+
+    def run(self, streams, callback, stop_event=None):
+        """Processes the frames of streams until all of them are finished
+        or stop_event is set."""
+        if stop_event is None:
+            stop_event = threading.Event()
+        for stream in streams:
+            stream.start(stop_event)
+        try:
+            while not stop_event.is_set():
+                if all(stream.done for stream in streams):
+                    break
+                batch = self._collect_batch(streams)
+                if len(batch) == 0:
+                    time.sleep(.001)
+                    continue
+                self._process_batch(batch, callback)
+        finally:
+            stop_event.set()
+            for stream in streams:
+                stream.join()
+
+
+if __name__ == '__main__':
+    from models.ssd import SSD300
+    from utils.datasets import get_arg_to_class
+    from utils.datasets import get_class_names
+    from utils.prior_boxes import load_prior_box_set
+    from utils.video import DetectionWriter
+    from utils.visualizer import draw_video_boxes
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('video_sources', nargs='+',
+                        help='device indices or video files')
+    parser.add_argument('--max_batch_size', type=int, default=8)
+    parser.add_argument('--drop_policy', default=None, choices=DROP_POLICIES,
+                        help="default 'latest' for devices and 'block' for "
+                        "files")
+    parser.add_argument('--output_path', default=None,
+                        help='write the detections of every stream instead '
+                        'of displaying them')
+    parser.add_argument('--weights_path',
+                        default='../trained_models/weights_SSD300.hdf5')
+    parser.add_argument('--dataset_name', default='VOC2007')
+    args = parser.parse_args()
+
+    class_names = get_class_names(args.dataset_name)
+    model = SSD300(num_classes=len(class_names))
+    prior_boxes = load_prior_box_set(model).boxes
+    model.load_weights(args.weights_path)
+
+    streams = []
+    for stream_arg, video_source in enumerate(args.video_sources):
+        drop_policy = args.drop_policy
+        if video_source.isdigit():
+            video_source = int(video_source)
+            if drop_policy is None:
+                drop_policy = 'latest'
+        elif drop_policy is None:
+            drop_policy = 'block'
+        streams.append(VideoStream('stream_{}'.format(stream_arg),
+                                   video_source, drop_policy=drop_policy))
+
+    stop_event = threading.Event()
+    writers = dict()
+    if args.output_path is not None:
+        if not os.path.exists(args.output_path):
+            os.makedirs(args.output_path)
+        for stream in streams:
+            writers[stream.stream_id] = DetectionWriter(
+                    os.path.join(args.output_path, stream.stream_id))
+    arg_to_class = get_arg_to_class(class_names)
+    colors = np.asarray([(0, 255, 0)] * len(class_names))
+
+    def route_detections(stream_id, frame_index, timestamp, frame, boxes):
+        if stream_id in writers:
+            writers[stream_id].write([frame_index], [timestamp], boxes,
+                                     [0, len(boxes)])
+            return
+        draw_video_boxes(boxes, frame, arg_to_class, colors,
+                         cv2.FONT_HERSHEY_SIMPLEX)
+        cv2.imshow(stream_id, frame)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            stop_event.set()
+
+    detector = MultiStreamDetector(model, prior_boxes, len(class_names),
+                                   args.max_batch_size)
+    start_time = time.time()
+    try:
+        detector.run(streams, route_detections, stop_event)
+    finally:
+        for writer in writers.values():
+            writer.close()
+        cv2.destroyAllWindows()
+    elapsed_time = time.time() - start_time
+    for stream in streams:
+        print('{} ({}): {} frames processed, {} dropped, {:.1f} '
+              'frames/s'.format(stream.stream_id, stream.video_source,
+                                stream.num_processed, stream.num_dropped,
+                                stream.num_processed / elapsed_time))
+        if stream.error is not None:
+            print('{} stopped: {}'.format(stream.stream_id, stream.error))
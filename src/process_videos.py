@@ -0,0 +1,89 @@
+"""Headless detection of every frame of recorded video files.
+
+Frames are decoded and preprocessed in a background thread, batched
+through the model and the detections of every frame are written with
+its index and timestamp to npz shards or JSON lines, see
+utils.video.DetectionWriter. Run from the src directory:
+    python process_videos.py videos/*.mp4 --output_path detections
+"""
+import argparse
+import os
+import time
+
+from utils.boxes import calculate_box_centers
+from utils.datasets import get_class_names
+from utils.inference import detect_boxes_batch
+from utils.timing import null_timer
+from utils.video import DetectionWriter
+from utils.video import FrameDecoder
+
+
+def process_video(model, video_path, output_prefix, prior_boxes,
+                  num_classes=21, batch_size=16, output_format='npz',
+                  frames_per_shard=10000, lower_probability_threshold=.1,
+                  iou_threshold=.5, background_index=0,
+                  box_scale_factors=[.1, .1, .2, .2], pre_nms_top_k=None,
+                  keep_top_k=100, prior_box_centers=None, timer=None):
+    """Detects the boxes of every frame of a video file and writes them
+    to output_prefix. Returns the number of processed frames and the
+    names of the written files."""
+    if timer is None:
+        timer = null_timer
+    if prior_box_centers is None:
+        prior_box_centers = calculate_box_centers(prior_boxes)
+    input_size = model.input_shape[1:3]
+    decoder = FrameDecoder(video_path, input_size, batch_size)
+    writer = DetectionWriter(output_prefix, output_format, frames_per_shard)
+    try:
+        for (frame_indices, timestamps, image_arrays,
+             original_image_shapes) in decoder:
+            with timer.stage('model'):
+                predictions = model.predict(image_arrays,
+                                            batch_size=len(image_arrays))
+            boxes, offsets = detect_boxes_batch(predictions, prior_boxes,
+                    original_image_shapes, num_classes,
+                    lower_probability_threshold, iou_threshold,
+                    background_index, box_scale_factors, pre_nms_top_k,
+                    keep_top_k, prior_box_centers, timer=timer)
+            with timer.stage('write'):
+                writer.write(frame_indices, timestamps, boxes, offsets)
+    finally:
+        writer.close()
+    return decoder.num_frames, writer.filenames
+
+
+if __name__ == '__main__':
+    from models.ssd import SSD300
+    from utils.prior_boxes import load_prior_box_set
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('video_paths', nargs='+')
+    parser.add_argument('--output_path', default='detections')
+    parser.add_argument('--output_format', default='npz',
+                        choices=['npz', 'jsonl'])
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--frames_per_shard', type=int, default=10000)
+    parser.add_argument('--weights_path',
+                        default='../trained_models/weights_SSD300.hdf5')
+    parser.add_argument('--dataset_name', default='VOC2007')
+    args = parser.parse_args()
+
+    class_names = get_class_names(args.dataset_name)
+    model = SSD300(num_classes=len(class_names))
+    prior_boxes = load_prior_box_set(model).boxes
+    model.load_weights(args.weights_path)
+    prior_box_centers = calculate_box_centers(prior_boxes)
+    if not os.path.exists(args.output_path):
+        os.makedirs(args.output_path)
+
+    for video_path in args.video_paths:
+        video_name = os.path.splitext(os.path.basename(video_path))[0]
+        output_prefix = os.path.join(args.output_path, video_name)
+        start_time = time.time()
+        num_frames, filenames = process_video(model, video_path,
+                output_prefix, prior_boxes, len(class_names),
+                args.batch_size, args.output_format, args.frames_per_shard,
+                prior_box_centers=prior_box_centers)
+        elapsed_time = time.time() - start_time
+        print('{}: {} frames in {:.1f} s ({:.1f} frames/s), {} files'.format(
+              video_path, num_frames, elapsed_time,
+              num_frames / max(elapsed_time, 1e-9), len(filenames)))
@@ -0,0 +1,176 @@
+"""Post-training quantization of SSD300 for CPU inference.
+
+Converts the trained model to TensorFlow Lite in float32, float16 and
+int8, the int8 ranges being calibrated on images of the DataManager
+training set. Every converted model is written to the output directory
+and its latency and VOC2007 test mAP, computed with evaluate.py, are
+reported next to the ones of the Keras float32 model.
+
+Requires TensorFlow >= 1.15. Run from the src directory:
+    python quantize.py --num_eval_images 500
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from utils.preprocessing import allocate_image_batch
+from utils.preprocessing import load_pil_image
+from utils.preprocessing import preprocess_image_into
+
+PRECISIONS = ['float32', 'float16', 'int8']
+
+
+class TFLiteModel(object):
+    """TensorFlow Lite interpreter with the input_shape and predict of a
+    Keras model, so that it can be used by utils.inference.predict and
+    evaluate.evaluate.
+
+    # Arguments
+        model_content: Serialized TensorFlow Lite model.
+    """
+    def __init__(self, model_content):
+        self.interpreter = tf.lite.Interpreter(model_content=model_content)
+        self.interpreter.allocate_tensors()
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+        self.input_index = input_details['index']
+        self.output_index = output_details['index']
+        self.input_shape = (None,) + tuple(input_details['shape'][1:])
+
+    def predict(self, image_arrays, batch_size=None):
+        """The converted model has a batch size of one, therefore the
+        images are run one at a time."""
+        predictions = []
+        for image_array in image_arrays:
+            self.interpreter.set_tensor(self.input_index,
+                    np.asarray(image_array[None], dtype='float32'))
+            self.interpreter.invoke()
+            predictions.append(self.interpreter.get_tensor(
+                                                self.output_index)[0])
+        return np.asarray(predictions)
+
+
+def load_calibration_images(data_manager, input_size, num_images=100,
+                            random_state=None):
+    """Returns num_images preprocessed images sampled from the images
+    with ground truth of data_manager."""
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    image_names = sorted(data_manager.load_data().keys())
+    num_images = min(num_images, len(image_names))
+    image_names = random_state.choice(image_names, num_images,
+                                      replace=False)
+    images = allocate_image_batch(num_images, input_size)
+    for image_name, image in zip(image_names, images):
+        image_path = data_manager.image_prefix + image_name
+        preprocess_image_into(load_pil_image(image_path), image)
+    return images
+
+
+def convert_model(model, precision='float32', calibration_images=None):
+    """Converts a Keras model to a serialized TensorFlow Lite model.
+
+    # Arguments
+        model: Keras model built in the Keras session.
+        precision: 'float32', 'float16' for float16 weights or 'int8'
+            for int8 weights and activations.
+        calibration_images: numpy array of preprocessed images used to
+            calibrate the int8 activation ranges.
+    """
+    import keras.backend as K
+    converter = tf.lite.TFLiteConverter.from_session(K.get_session(),
+                                            [model.input], [model.output])
+    if precision == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif precision == 'int8':
+        if calibration_images is None:
+            raise ValueError('int8 quantization needs calibration_images')
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        def representative_dataset():
+            for image in calibration_images:
+                yield [image[None]]
+
+        converter.representative_dataset = representative_dataset
+    elif precision != 'float32':
+        raise ValueError('Invalid precision: {}'.format(precision))
+    return converter.convert()
+
+
+def measure_latency(model, images, num_warmup_images=2):
+    """Returns the mean time in seconds of model.predict on single
+    images."""
+    for image in images[:num_warmup_images]:
+        model.predict(image[None])
+    start_time = time.time()
+    for image in images:
+        model.predict(image[None])
+    return (time.time() - start_time) / len(images)
+
+
+if __name__ == '__main__':
+    import keras.backend as K
+    from evaluate import evaluate
+    from models.ssd import SSD300
+    from utils.datasets import DataManager
+    from utils.datasets import get_class_names
+    from utils.prior_boxes import load_prior_box_set
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--weights_path',
+                        default='../trained_models/weights_SSD300.hdf5')
+    parser.add_argument('--output_directory', default='../trained_models/')
+    parser.add_argument('--num_calibration_images', type=int, default=100)
+    parser.add_argument('--num_latency_images', type=int, default=50)
+    parser.add_argument('--num_eval_images', type=int, default=None,
+                        help='images per class evaluated, all if not given')
+    args = parser.parse_args()
+
+    dataset_name = 'VOC2007'
+    data_prefix = '../datasets/VOCtest/VOCdevkit/VOC2007/Annotations/'
+    image_prefix = '../datasets/VOCtest/VOCdevkit/VOC2007/JPEGImages/'
+    K.set_learning_phase(0)
+    class_names = get_class_names(dataset_name)
+    model = SSD300(num_classes=len(class_names))
+    prior_boxes = load_prior_box_set(model).boxes
+    model.load_weights(args.weights_path)
+    input_size = model.input_shape[1:3]
+    # calibrate on the training set and evaluate on the test set
+    calibration_images = load_calibration_images(
+                DataManager(dataset_name, class_names), input_size,
+                args.num_calibration_images)
+    latency_images = calibration_images[:args.num_latency_images]
+
+    results = []
+    latency = measure_latency(model, latency_images)
+    mean_average_precision = evaluate(model, prior_boxes, dataset_name,
+                                      data_prefix, image_prefix,
+                                      num_images=args.num_eval_images)[0]
+    results.append(('keras float32', None, latency, mean_average_precision))
+    for precision in PRECISIONS:
+        model_content = convert_model(model, precision, calibration_images)
+        model_path = os.path.join(args.output_directory,
+                                  'SSD300_{}.tflite'.format(precision))
+        with open(model_path, 'wb') as model_file:
+            model_file.write(model_content)
+        tflite_model = TFLiteModel(model_content)
+        latency = measure_latency(tflite_model, latency_images)
+        mean_average_precision = evaluate(tflite_model, prior_boxes,
+                                          dataset_name, data_prefix,
+                                          image_prefix,
+                                          num_images=args.num_eval_images)[0]
+        results.append(('tflite ' + precision, len(model_content),
+                        latency, mean_average_precision))
+
+    _, _, base_latency, base_mean_average_precision = results[0]
+    print('{:<16} {:>10} {:>14} {:>10} {:>8} {:>8}'.format('model',
+            'size [MB]', 'latency [ms]', 'speedup', 'mAP', 'delta'))
+    for name, size, latency, mean_average_precision in results:
+        size = '-' if size is None else '{:.1f}'.format(size / 2.**20)
+        print('{:<16} {:>10} {:>14.1f} {:>9.2f}x {:>8.4f} {:>+8.4f}'.format(
+                name, size, 1000 * latency, base_latency / latency,
+                mean_average_precision,
+                mean_average_precision - base_mean_average_precision))
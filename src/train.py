@@ -7,7 +7,7 @@ from utils.train import MultiboxLoss
 from utils.train import scheduler
 from utils.train import split_data
 from models.ssd import SSD300
-from utils.boxes import create_prior_boxes
+from utils.prior_boxes import load_prior_box_set
 from utils.datasets import DataManager
 
 # parameters
@@ -40,7 +40,7 @@ multibox_loss = MultiboxLoss(num_classes, neg_pos_ratio=2.0).compute_loss
 model.compile(optimizer, loss=multibox_loss, metrics=['acc'])
 
 # setting parameters for data augmentation generator
-prior_boxes = create_prior_boxes(model)
+prior_boxes = load_prior_box_set(model).boxes
 image_generator = ImageGenerator(ground_truth_data,
                                  prior_boxes,
                                  num_classes,
@@ -43,6 +43,88 @@ def calculate_intersection_over_union(box_data, prior_boxes):
     intersection_over_union = intersections / unions
     return intersection_over_union
 
+def calculate_pairwise_intersection_over_union(boxes_a, boxes_b,
+                                               max_chunk_elements=2 ** 22,
+                                               dtype='float32'):
+    """Calculate the intersection over union of every box in boxes_a with
+    respect to every box in boxes_b.
+
+    Arguments:
+        boxes_a: numpy array with shape (num_boxes_a, 4 + ...) indicating
+        x_min, y_min, x_max and y_max in its first four columns.
+        boxes_b: numpy array with shape (num_boxes_b, 4 + ...) indicating
+        x_min, y_min, x_max and y_max in its first four columns.
+        max_chunk_elements: Maximum number of pairwise elements computed at
+        once. Rows of boxes_a are processed in chunks so that the temporary
+        arrays never exceed this size.
+        dtype: Floating point type of the computation.
+
+    Returns:
+        intersections_over_unions: numpy array of dtype with shape
+        (num_boxes_a, num_boxes_b). Pairs with an empty union have an
+        intersection over union of zero.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=dtype).reshape(-1,
+                                            np.shape(boxes_a)[-1])[:, :4]
+    boxes_b = np.asarray(boxes_b, dtype=dtype).reshape(-1,
+                                            np.shape(boxes_b)[-1])[:, :4]
+    num_boxes_a = len(boxes_a)
+    num_boxes_b = len(boxes_b)
+    intersections_over_unions = np.zeros((num_boxes_a, num_boxes_b),
+                                                        dtype=dtype)
+    if num_boxes_a == 0 or num_boxes_b == 0:
+        return intersections_over_unions
+
+    areas_a = ((boxes_a[:, 2] - boxes_a[:, 0]) *
+               (boxes_a[:, 3] - boxes_a[:, 1]))
+    areas_b = ((boxes_b[:, 2] - boxes_b[:, 0]) *
+               (boxes_b[:, 3] - boxes_b[:, 1]))
+    chunk_size = max(1, int(max_chunk_elements // num_boxes_b))
+    for chunk_start in range(0, num_boxes_a, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, num_boxes_a)
+        chunk = boxes_a[chunk_start:chunk_end, None, :]
+        # calculating the intersection
+        intersected_widths = (np.minimum(chunk[:, :, 2], boxes_b[:, 2]) -
+                              np.maximum(chunk[:, :, 0], boxes_b[:, 0]))
+        intersected_heights = (np.minimum(chunk[:, :, 3], boxes_b[:, 3]) -
+                               np.maximum(chunk[:, :, 1], boxes_b[:, 1]))
+        np.maximum(intersected_widths, 0, out=intersected_widths)
+        np.maximum(intersected_heights, 0, out=intersected_heights)
+        intersections = intersected_widths
+        intersections *= intersected_heights
+        # calculating the union
+        unions = areas_a[chunk_start:chunk_end, None] + areas_b
+        unions -= intersections
+        np.divide(intersections, unions,
+                  out=intersections_over_unions[chunk_start:chunk_end],
+                  where=unions > 0)
+    return intersections_over_unions
+
+def _calculate_elementwise_intersection_over_union(boxes_a, boxes_b,
+                                                   dtype='float32'):
+    """Calculate the intersection over union of every box in boxes_a
+    with respect to the box in the same row of boxes_b, with the same
+    arithmetic as calculate_pairwise_intersection_over_union.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=dtype)
+    boxes_b = np.asarray(boxes_b, dtype=dtype)
+    intersected_widths = (np.minimum(boxes_a[:, 2], boxes_b[:, 2]) -
+                          np.maximum(boxes_a[:, 0], boxes_b[:, 0]))
+    intersected_heights = (np.minimum(boxes_a[:, 3], boxes_b[:, 3]) -
+                           np.maximum(boxes_a[:, 1], boxes_b[:, 1]))
+    intersections = (np.maximum(intersected_widths, 0) *
+                     np.maximum(intersected_heights, 0))
+    areas_a = ((boxes_a[:, 2] - boxes_a[:, 0]) *
+               (boxes_a[:, 3] - boxes_a[:, 1]))
+    areas_b = ((boxes_b[:, 2] - boxes_b[:, 0]) *
+               (boxes_b[:, 3] - boxes_b[:, 1]))
+    unions = areas_a + areas_b
+    unions -= intersections
+    intersections_over_unions = np.zeros(len(boxes_a), dtype=dtype)
+    np.divide(intersections, unions, out=intersections_over_unions,
+                                                    where=unions > 0)
+    return intersections_over_unions
+
 def regress_boxes(assigned_prior_boxes, ground_truth_box, box_scale_factors):
     """Regress assigned_prior_boxes to ground_truth_box as mentioned in
     Faster-RCNN and Single-shot Multi-box Detector papers.
@@ -51,7 +133,9 @@ def regress_boxes(assigned_prior_boxes, ground_truth_box, box_scale_factors):
         assigned_prior_boxes: numpy array with shape (num_assigned_priors, 4)
         indicating x_min, y_min, x_max and y_max for every prior box.
         ground_truth_box: numpy array with shape (4) indicating
-        x_min, y_min, x_max and y_max of the ground truth box.
+        x_min, y_min, x_max and y_max of the ground truth box, or with
+        shape (num_assigned_priors, 4) containing the ground truth box
+        of every assigned prior box.
         box_scale_factors: numpy array with shape (4) containing
         the values for scaling the localization gradient.
         (https://github.com/weiliu89/caffe/issues/155)
@@ -73,10 +157,10 @@ def regress_boxes(assigned_prior_boxes, ground_truth_box, box_scale_factors):
     d_height = d_y_max - d_y_min
 
     g_box_coordinates = ground_truth_box
-    g_x_min = g_box_coordinates[0]
-    g_y_min = g_box_coordinates[1]
-    g_x_max = g_box_coordinates[2]
-    g_y_max = g_box_coordinates[3]
+    g_x_min = g_box_coordinates[..., 0]
+    g_y_min = g_box_coordinates[..., 1]
+    g_x_max = g_box_coordinates[..., 2]
+    g_y_max = g_box_coordinates[..., 3]
     g_width =  g_x_max - g_x_min
     g_height = g_y_max - g_y_min
     g_center_x = 0.5 * (g_x_min + g_x_max)
@@ -126,20 +210,47 @@ def decode_boxes(predicted_boxes, prior_boxes, box_scale_factors):
         raise ValueError(
                 'Mismatch between predicted_boxes and prior_boxes length')
 
-    prior_x_min = prior_boxes[:, 0]
-    prior_y_min = prior_boxes[:, 1]
-    prior_x_max = prior_boxes[:, 2]
-    prior_y_max = prior_boxes[:, 3]
+    prior_box_centers = calculate_box_centers(prior_boxes)
+    decoded_boxes = _decode_box_centers(predicted_boxes, prior_box_centers,
+                                        box_scale_factors)
+    if predicted_boxes.shape[1] > 4:
+        decoded_boxes = np.concatenate([decoded_boxes,
+                            predicted_boxes[:, 4:]], axis=-1)
+    return decoded_boxes
+
+def calculate_box_centers(boxes):
+    """
+    Arguments:
+        boxes: numpy array with shape (num_boxes, 4) indicating
+        x_min, y_min, x_max and y_max for every box.
+
+    Returns:
+        box_centers: numpy array with shape (num_boxes, 4) indicating
+        center_x, center_y, width and height for every box.
+    """
+    x_min = boxes[:, 0]
+    y_min = boxes[:, 1]
+    x_max = boxes[:, 2]
+    y_max = boxes[:, 3]
+
+    width = x_max - x_min
+    height = y_max - y_min
+    center_x = 0.5 * (x_max + x_min)
+    center_y = 0.5 * (y_max + y_min)
+    return np.concatenate((center_x[:, None], center_y[:, None],
+                           width[:, None], height[:, None]), axis=-1)
 
-    prior_width = prior_x_max - prior_x_min
-    prior_height = prior_y_max - prior_y_min
-    prior_center_x = 0.5 * (prior_x_max + prior_x_min)
-    prior_center_y = 0.5 * (prior_y_max + prior_y_min)
+def _decode_box_centers(predicted_boxes, prior_box_centers,
+                        box_scale_factors):
+    prior_center_x = prior_box_centers[..., 0]
+    prior_center_y = prior_box_centers[..., 1]
+    prior_width = prior_box_centers[..., 2]
+    prior_height = prior_box_centers[..., 3]
 
-    pred_center_x = predicted_boxes[:, 0]
-    pred_center_y = predicted_boxes[:, 1]
-    pred_width = predicted_boxes[:, 2]
-    pred_height = predicted_boxes[:, 3]
+    pred_center_x = predicted_boxes[..., 0]
+    pred_center_y = predicted_boxes[..., 1]
+    pred_width = predicted_boxes[..., 2]
+    pred_height = predicted_boxes[..., 3]
 
     scale_center_x = box_scale_factors[0]
     scale_center_y = box_scale_factors[1]
@@ -161,19 +272,160 @@ def decode_boxes(predicted_boxes, prior_boxes, box_scale_factors):
     decoded_x_max = decoded_center_x + (0.5 * decoded_width)
     decoded_y_max = decoded_center_y + (0.5 * decoded_height)
 
-    decoded_boxes = np.concatenate((decoded_x_min[:, None],
-                                  decoded_y_min[:, None],
-                                  decoded_x_max[:, None],
-                                  decoded_y_max[:, None]), axis=-1)
+    decoded_boxes = np.concatenate((decoded_x_min[..., None],
+                                  decoded_y_min[..., None],
+                                  decoded_x_max[..., None],
+                                  decoded_y_max[..., None]), axis=-1)
     decoded_boxes = np.clip(decoded_boxes, 0.0, 1.0)
-    if predicted_boxes.shape[1] > 4:
+    return decoded_boxes
+
+def _calculate_filter_mask(box_classes, background_index=0,
+                           lower_probability_threshold=.4):
+    best_classes = np.argmax(box_classes, axis=-1)
+    best_probabilities = np.max(box_classes, axis=-1)
+    background_mask = best_classes != background_index
+    lower_bound_mask = lower_probability_threshold < best_probabilities
+    return np.logical_and(background_mask, lower_bound_mask)
+
+def decode_boxes_batch(predicted_boxes, prior_boxes, box_scale_factors):
+    """Decode the regressed coordinates of a batch of predictions.
+
+    Arguments:
+        predicted_boxes: numpy array with shape
+        (batch_size, num_prior_boxes, 4 + ...).
+        prior_boxes: numpy array with shape (num_prior_boxes, 4)
+        indicating x_min, y_min, x_max and y_max for every prior box.
+        box_scale_factors: numpy array with shape (4)
+        Which represents a scaling of the localization gradient.
+
+    Returns:
+        decoded_boxes: numpy array with the same shape as predicted_boxes
+        with the decoded box coordinates in its first four channels.
+    """
+    if predicted_boxes.shape[1] != len(prior_boxes):
+        raise ValueError(
+                'Mismatch between predicted_boxes and prior_boxes length')
+    prior_box_centers = calculate_box_centers(prior_boxes)
+    decoded_boxes = _decode_box_centers(predicted_boxes, prior_box_centers,
+                                        box_scale_factors)
+    if predicted_boxes.shape[2] > 4:
         decoded_boxes = np.concatenate([decoded_boxes,
-                            predicted_boxes[:, 4:]], axis=-1)
+                            predicted_boxes[:, :, 4:]], axis=-1)
     return decoded_boxes
 
+def filter_boxes_batch(predictions, num_classes, background_index=0,
+                       lower_probability_threshold=.4):
+    """Filter a batch of predictions as filter_boxes does for every image.
+
+    Arguments:
+        predictions: numpy array with shape
+        (batch_size, num_prior_boxes, 4 + num_classes + ...).
+
+    Returns:
+        selected_boxes: numpy array with shape (num_selected_boxes,
+        4 + num_classes) with the selected boxes of all images.
+        offsets: numpy array with shape (batch_size + 1). The boxes of
+        image i are selected_boxes[offsets[i]:offsets[i + 1]].
+    """
+    box_classes = predictions[:, :, 4:(4 + num_classes)]
+    mask = _calculate_filter_mask(box_classes, background_index,
+                                  lower_probability_threshold)
+    selected_boxes = predictions[mask][:, :(4 + num_classes)]
+    return selected_boxes, _calculate_offsets(mask.sum(axis=1))
+
+def decode_and_filter_boxes_batch(predictions, prior_boxes,
+                                  box_scale_factors, num_classes,
+                                  background_index=0,
+                                  lower_probability_threshold=.4,
+                                  prior_box_centers=None):
+    """Batch version of decode_and_filter_boxes.
+
+    Arguments:
+        predictions: numpy array with shape
+        (batch_size, num_prior_boxes, 4 + num_classes + ...).
+
+    Returns:
+        selected_boxes: numpy array with shape (num_selected_boxes,
+        4 + num_classes) with the decoded boxes of all images.
+        offsets: numpy array with shape (batch_size + 1). The boxes of
+        image i are selected_boxes[offsets[i]:offsets[i + 1]].
+    """
+    if predictions.shape[1] != len(prior_boxes):
+        raise ValueError(
+                'Mismatch between predicted_boxes and prior_boxes length')
+    box_classes = predictions[:, :, 4:(4 + num_classes)]
+    mask = _calculate_filter_mask(box_classes, background_index,
+                                  lower_probability_threshold)
+    image_args, prior_args = np.nonzero(mask)
+    if prior_box_centers is None:
+        selected_prior_box_centers = calculate_box_centers(
+                                            prior_boxes[prior_args])
+    else:
+        selected_prior_box_centers = prior_box_centers[prior_args]
+    decoded_boxes = _decode_box_centers(predictions[image_args, prior_args],
+                                        selected_prior_box_centers,
+                                        box_scale_factors)
+    selected_boxes = np.concatenate([decoded_boxes,
+                            box_classes[image_args, prior_args]], axis=-1)
+    return selected_boxes, _calculate_offsets(mask.sum(axis=1))
+
+def _calculate_offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=int)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+def split_boxes_batch(boxes, offsets):
+    """Split ragged batch results into a list with the boxes of every
+    image."""
+    return [boxes[offsets[image_arg]:offsets[image_arg + 1]]
+            for image_arg in range(len(offsets) - 1)]
+
+def decode_and_filter_boxes(predictions, prior_boxes, box_scale_factors,
+                            num_classes, background_index=0,
+                            lower_probability_threshold=.4,
+                            prior_box_centers=None):
+    """Select the predictions whose best class is not the background and
+    passes lower_probability_threshold, and decode only those. The result
+    is the same as applying filter_boxes to the output of decode_boxes.
+
+    Arguments:
+        predictions: numpy array with shape (num_prior_boxes,
+        4 + num_classes + ...) containing the regressed coordinates and
+        the class probabilities of every prior box.
+        prior_boxes: numpy array with shape (num_prior_boxes, 4)
+        indicating x_min, y_min, x_max and y_max for every prior box.
+        box_scale_factors: numpy array with shape (4)
+        Which represents a scaling of the localization gradient.
+        (https://github.com/weiliu89/caffe/issues/155)
+        prior_box_centers: Optional numpy array with shape
+        (num_prior_boxes, 4) as returned by calculate_box_centers for
+        prior_boxes, to avoid computing it on every call.
+
+    Returns:
+        selected_boxes: numpy array with shape (num_selected_boxes,
+        4 + num_classes) with the decoded box coordinates.
+    """
+    if len(predictions) != len(prior_boxes):
+        raise ValueError(
+                'Mismatch between predicted_boxes and prior_boxes length')
+    box_classes = predictions[:, 4:(4 + num_classes)]
+    mask = _calculate_filter_mask(box_classes, background_index,
+                                  lower_probability_threshold)
+    if prior_box_centers is None:
+        selected_prior_box_centers = calculate_box_centers(prior_boxes[mask])
+    else:
+        selected_prior_box_centers = prior_box_centers[mask]
+    decoded_boxes = _decode_box_centers(predictions[mask],
+                                        selected_prior_box_centers,
+                                        box_scale_factors)
+    selected_boxes = np.concatenate([decoded_boxes,
+                            box_classes[mask]], axis=-1)
+    return selected_boxes
+
 def assign_prior_boxes_to_ground_truth(ground_truth_box, prior_boxes,
                             box_scale_factors, regress=True,
-                            overlap_threshold=.5, return_iou=True):
+                            overlap_threshold=.5, return_iou=True,
+                            ious=None):
     """ Assigns and regresses prior boxes to a single ground_truth_box
     data sample.
     TODO: Change this function so that it does not regress the boxes
@@ -186,13 +438,18 @@ def assign_prior_boxes_to_ground_truth(ground_truth_box, prior_boxes,
         box_scale_factors: numpy array with shape (num_boxes, 4)
         Which represents a scaling of the localization gradient.
         (https://github.com/weiliu89/caffe/issues/155)
+        ious: Optional numpy array with shape (num_prior_boxes) with the
+        precomputed intersection over unions of ground_truth_box with
+        respect to all prior_boxes.
 
     Returns:
         regressed_boxes: numpy array with shape (num_assigned_boxes)
         which correspond to the regressed values of all
         assigned_prior_boxes to the ground_truth_box
     """
-    ious = calculate_intersection_over_union(ground_truth_box, prior_boxes)
+    if ious is None:
+        ious = calculate_intersection_over_union(ground_truth_box,
+                                                 prior_boxes)
     regressed_boxes = np.zeros((len(prior_boxes), 4 + return_iou))
     assign_mask = ious > overlap_threshold
     if not assign_mask.any():
@@ -209,9 +466,292 @@ def assign_prior_boxes_to_ground_truth(ground_truth_box, prior_boxes,
         regressed_boxes[assign_mask, 0:4] = assigned_prior_boxes[:, 0:4]
         return regressed_boxes.ravel()
 
+def pad_ground_truth_data(ground_truth_data, max_num_objects=None):
+    """ Stack the ground truth samples of a batch into a single array
+    padded to a maximum number of objects.
+
+    Arguments:
+        ground_truth_data: list of numpy arrays with shape
+        (num_objects, 4 + num_classes), one for every image.
+        max_num_objects: Number of object slots of the padded array.
+        If None the largest number of objects in the batch is used.
+
+    Returns:
+        padded_data: numpy array with shape
+        (batch_size, max_num_objects, 4 + num_classes).
+        object_mask: boolean numpy array with shape
+        (batch_size, max_num_objects) which is True for real objects.
+    """
+    num_objects = [len(sample) for sample in ground_truth_data]
+    if max_num_objects is None:
+        max_num_objects = max(num_objects + [0])
+    sample_shapes = [np.shape(sample) for sample in ground_truth_data
+                                        if np.ndim(sample) == 2]
+    num_columns = sample_shapes[0][1] if len(sample_shapes) > 0 else 4
+    batch_size = len(ground_truth_data)
+    padded_data = np.zeros((batch_size, max_num_objects, num_columns))
+    object_mask = np.zeros((batch_size, max_num_objects), dtype=bool)
+    for sample_arg, sample in enumerate(ground_truth_data):
+        if num_objects[sample_arg] > max_num_objects:
+            raise ValueError('Sample has more objects than max_num_objects')
+        if num_objects[sample_arg] == 0:
+            continue
+        padded_data[sample_arg, :num_objects[sample_arg]] = sample
+        object_mask[sample_arg, :num_objects[sample_arg]] = True
+    return padded_data, object_mask
+
+
+# bound of the error of the float32 intersection over unions of boxes
+# with normalized coordinates, closer overlaps to a threshold are compared
+# with it in float64
+IOU_ROUNDING_ERROR = 1e-4
+
+
+def _match_prior_boxes(prior_boxes, ground_truth_data, object_mask,
+                       overlap_threshold=.5, prior_box_index=None):
+    """ Match every prior box to the ground truth object with the highest
+    overlap. If a PriorBoxIndex is given only the candidate prior boxes
+    found by grid arithmetic are compared against every object.
+
+    Overlaps are computed in float32, but the ones within rounding error
+    of overlap_threshold are compared with it again in float64, and the
+    best prior box of the objects without any overlap above
+    overlap_threshold is found with float64 overlaps, as in the per-image
+    assign_prior_boxes_to_ground_truth. In float32 boxes whose overlap
+    is the threshold would flip assignment and symmetric neighbouring
+    prior boxes often tie, in which case the first one would be kept.
+
+    Returns:
+        positive_batch_args: numpy array with the batch index of every
+        matched prior box.
+        positive_prior_args: numpy array with the prior box index of every
+        matched prior box.
+        matched_data: numpy array with shape (num_positives, 4 + num_classes)
+        containing the ground truth sample of every matched prior box.
+    """
+    if prior_box_index is not None:
+        return _match_prior_boxes_with_index(prior_boxes, ground_truth_data,
+                                object_mask, overlap_threshold,
+                                prior_box_index)
+    batch_size, max_num_objects = object_mask.shape
+    num_prior_boxes = len(prior_boxes)
+    ground_truth_boxes = ground_truth_data[:, :, :4]
+    ious = calculate_pairwise_intersection_over_union(
+                            ground_truth_boxes.reshape(-1, 4), prior_boxes)
+    ious = ious.reshape(batch_size, max_num_objects, num_prior_boxes)
+    ious[np.logical_not(object_mask)] = 0
+
+    assign_mask = ious > overlap_threshold
+    near_args = np.nonzero(np.abs(ious - overlap_threshold) <=
+                           IOU_ROUNDING_ERROR)
+    assign_mask[near_args] = _calculate_elementwise_intersection_over_union(
+                    ground_truth_boxes[near_args[0], near_args[1]],
+                    prior_boxes[near_args[2], :4],
+                    dtype='float64') > overlap_threshold
+
+    # every object keeps at least its best prior box
+    unassigned_batch_args, unassigned_object_args = np.nonzero(
+                    np.logical_and(object_mask, np.logical_not(
+                                            assign_mask.any(axis=-1))))
+    best_prior_args = calculate_pairwise_intersection_over_union(
+                    ground_truth_boxes[unassigned_batch_args,
+                                       unassigned_object_args],
+                    prior_boxes, dtype='float64').argmax(axis=-1)
+    assign_mask[unassigned_batch_args, unassigned_object_args,
+                                        best_prior_args] = True
+    ious[np.logical_not(assign_mask)] = 0
+
+    # every prior box is matched to the object with the highest overlap
+    best_object_args = ious.argmax(axis=1)
+    best_ious = ious.max(axis=1)
+    positive_batch_args, positive_prior_args = np.nonzero(best_ious > 0)
+    positive_object_args = best_object_args[positive_batch_args,
+                                            positive_prior_args]
+    matched_data = ground_truth_data[positive_batch_args,
+                                     positive_object_args]
+    return positive_batch_args, positive_prior_args, matched_data
+
+def _match_prior_boxes_with_index(prior_boxes, ground_truth_data,
+                                  object_mask, overlap_threshold,
+                                  prior_box_index):
+    num_prior_boxes = len(prior_boxes)
+    if prior_box_index.num_prior_boxes != num_prior_boxes:
+        raise ValueError(
+                'Mismatch between prior_box_index and prior_boxes length')
+    batch_args, object_args = np.nonzero(object_mask)
+    ground_truth_boxes = ground_truth_data[batch_args, object_args, :4]
+    # candidates within rounding error of the threshold are kept for the
+    # float64 comparison
+    box_args, prior_args = prior_box_index.find_candidates(
+                ground_truth_boxes, overlap_threshold - IOU_ROUNDING_ERROR)
+    ious = _calculate_elementwise_intersection_over_union(
+            ground_truth_boxes[box_args], prior_boxes[prior_args, :4])
+    assign_mask = ious > overlap_threshold
+    near_args = np.nonzero(np.abs(ious - overlap_threshold) <=
+                           IOU_ROUNDING_ERROR)[0]
+    assign_mask[near_args] = _calculate_elementwise_intersection_over_union(
+                    ground_truth_boxes[box_args[near_args]],
+                    prior_boxes[prior_args[near_args], :4],
+                    dtype='float64') > overlap_threshold
+    box_args = box_args[assign_mask]
+    prior_args = prior_args[assign_mask]
+    ious = ious[assign_mask]
+
+    # objects without candidates above the threshold keep their best prior
+    num_assigned = np.bincount(box_args, minlength=len(ground_truth_boxes))
+    unassigned_box_args = np.nonzero(num_assigned == 0)[0]
+    if len(unassigned_box_args) > 0:
+        unassigned_ious = calculate_pairwise_intersection_over_union(
+                        ground_truth_boxes[unassigned_box_args], prior_boxes,
+                        dtype='float64')
+        best_prior_args = unassigned_ious.argmax(axis=-1)
+        best_ious = unassigned_ious[np.arange(len(unassigned_box_args)),
+                                    best_prior_args].astype('float32')
+        box_args = np.concatenate([box_args, unassigned_box_args])
+        prior_args = np.concatenate([prior_args, best_prior_args])
+        ious = np.concatenate([ious, best_ious])
+    positive_mask = ious > 0
+    box_args = box_args[positive_mask]
+    prior_args = prior_args[positive_mask]
+    ious = ious[positive_mask]
+
+    # every prior box is matched to the object with the highest overlap
+    prior_keys = batch_args[box_args] * num_prior_boxes + prior_args
+    sorted_args = np.lexsort((box_args, -ious, prior_keys))
+    sorted_keys = prior_keys[sorted_args]
+    first_mask = np.ones(len(sorted_keys), dtype=bool)
+    first_mask[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    selected_args = sorted_args[first_mask]
+    selected_box_args = box_args[selected_args]
+    positive_batch_args = batch_args[selected_box_args]
+    positive_prior_args = prior_args[selected_args]
+    matched_data = ground_truth_data[positive_batch_args,
+                                     object_args[selected_box_args]]
+    return positive_batch_args, positive_prior_args, matched_data
+
+def _encode_matched_boxes(prior_boxes, matched_data, box_scale_factors,
+                          regress=True):
+    if regress:
+        return regress_boxes(prior_boxes, matched_data[:, :4],
+                                            box_scale_factors)
+    return prior_boxes[:, :4]
+
+def assign_prior_boxes_batch(prior_boxes, ground_truth_data, object_mask,
+                             num_classes, box_scale_factors, regress=True,
+                             overlap_threshold=.5, background_id=0,
+                             prior_box_index=None):
+    """ Assign and regress prior boxes to the ground truth samples of
+    a whole batch at once.
+
+    Arguments:
+        prior_boxes: numpy array with shape (num_prior_boxes, 4)
+        indicating x_min, y_min, x_max and y_max for every prior box.
+        ground_truth_data: numpy array with shape
+        (batch_size, max_num_objects, 4 + num_classes) as returned by
+        pad_ground_truth_data.
+        object_mask: boolean numpy array with shape
+        (batch_size, max_num_objects) which is True for real objects.
+        box_scale_factors: numpy array with shape (num_boxes, 4)
+        Which represents a scaling of the localization gradient.
+        (https://github.com/weiliu89/caffe/issues/155)
+        prior_box_index: Optional PriorBoxIndex of prior_boxes used to
+        compare every object only against its candidate prior boxes.
+
+    Returns:
+        assignments: numpy array with shape
+        (batch_size, num_prior_boxes, 4 + num_classes)
+        which correspond to the regressed values of all
+        assigned_prior_boxes to the ground_truth_box
+    """
+    batch_size, max_num_objects = object_mask.shape
+    num_prior_boxes = len(prior_boxes)
+    assignments = np.zeros((batch_size, num_prior_boxes, 4 + num_classes))
+    assignments[:, :, 4 + background_id] = 1.0
+    if max_num_objects == 0 or not object_mask.any():
+        return assignments
+
+    positive_batch_args, positive_prior_args, matched_data = (
+                    _match_prior_boxes(prior_boxes, ground_truth_data,
+                                       object_mask, overlap_threshold,
+                                       prior_box_index))
+    assignments[positive_batch_args, positive_prior_args, :4] = (
+                    _encode_matched_boxes(prior_boxes[positive_prior_args],
+                                matched_data, box_scale_factors, regress))
+    assignments[positive_batch_args, positive_prior_args,
+                                            4:] = matched_data[:, 4:]
+    return assignments
+
+def assign_prior_boxes_batch_sparse(prior_boxes, ground_truth_data,
+                                    object_mask, box_scale_factors,
+                                    regress=True, overlap_threshold=.5,
+                                    background_id=0, prior_box_index=None):
+    """ Assign and regress prior boxes to the ground truth samples of
+    a whole batch, returning the targets in a compact format.
+
+    Arguments:
+        prior_boxes: numpy array with shape (num_prior_boxes, 4)
+        indicating x_min, y_min, x_max and y_max for every prior box.
+        ground_truth_data: numpy array with shape
+        (batch_size, max_num_objects, 4 + num_classes) as returned by
+        pad_ground_truth_data.
+        object_mask: boolean numpy array with shape
+        (batch_size, max_num_objects) which is True for real objects.
+        box_scale_factors: numpy array with shape (num_boxes, 4)
+        Which represents a scaling of the localization gradient.
+        (https://github.com/weiliu89/caffe/issues/155)
+        prior_box_index: Optional PriorBoxIndex of prior_boxes used to
+        compare every object only against its candidate prior boxes.
+
+    Returns:
+        class_args: int16 numpy array with shape
+        (batch_size, num_prior_boxes) containing the class index assigned
+        to every prior box.
+        regressed_boxes: float32 numpy array with shape (num_positives, 4)
+        containing the regressed values of the positive prior boxes in the
+        order given by np.nonzero(class_args != background_id).
+    """
+    batch_size, max_num_objects = object_mask.shape
+    num_prior_boxes = len(prior_boxes)
+    class_args = np.full((batch_size, num_prior_boxes), background_id,
+                                                        dtype='int16')
+    if max_num_objects == 0 or not object_mask.any():
+        return class_args, np.zeros((0, 4), dtype='float32')
+
+    positive_batch_args, positive_prior_args, matched_data = (
+                    _match_prior_boxes(prior_boxes, ground_truth_data,
+                                       object_mask, overlap_threshold,
+                                       prior_box_index))
+    regressed_boxes = _encode_matched_boxes(prior_boxes[positive_prior_args],
+                                matched_data, box_scale_factors, regress)
+    class_args[positive_batch_args, positive_prior_args] = np.argmax(
+                                            matched_data[:, 4:], axis=-1)
+    return class_args, regressed_boxes.astype('float32')
+
+def pack_sparse_targets(class_args, regressed_boxes, background_id=0):
+    """ Pack sparse targets into the array consumed by MultiboxLoss
+    with sparse_labels=True.
+
+    Arguments:
+        class_args: numpy array with shape (batch_size, num_prior_boxes)
+        as returned by assign_prior_boxes_batch_sparse.
+        regressed_boxes: numpy array with shape (num_positives, 4)
+        as returned by assign_prior_boxes_batch_sparse.
+
+    Returns:
+        targets: float32 numpy array with shape
+        (batch_size, num_prior_boxes, 5) with the regressed values in the
+        first four channels and the class index in the last one.
+    """
+    targets = np.zeros(class_args.shape + (5,), dtype='float32')
+    targets[:, :, 4] = class_args
+    positive_mask = class_args != background_id
+    targets[positive_mask, :4] = regressed_boxes
+    return targets
+
 def assign_prior_boxes(prior_boxes, ground_truth_data, num_classes,
                         box_scale_factors, regress=True,
-                        overlap_threshold=.5, background_id=0):
+                        overlap_threshold=.5, background_id=0,
+                        prior_box_index=None):
     """ Assign and regress prior boxes to all ground truth samples.
     Arguments:
         prior_boxes: numpy array with shape (num_prior_boxes, 4)
@@ -221,6 +761,7 @@ def assign_prior_boxes(prior_boxes, ground_truth_data, num_classes,
         box_scale_factors: numpy array with shape (num_boxes, 4)
         Which represents a scaling of the localization gradient.
         (https://github.com/weiliu89/caffe/issues/155)
+        prior_box_index: Optional PriorBoxIndex of prior_boxes.
 
     Returns:
         assignments: numpy array with shape
@@ -228,32 +769,14 @@ def assign_prior_boxes(prior_boxes, ground_truth_data, num_classes,
         which correspond to the regressed values of all
         assigned_prior_boxes to the ground_truth_box
     """
-    #assignments = np.zeros((len(prior_boxes), 4 + num_classes + 8))
-    assignments = np.zeros((len(prior_boxes), 4 + num_classes))
-    assignments[:, 4 + background_id] = 1.0
-    num_objects_in_image = len(ground_truth_data)
-    if num_objects_in_image == 0:
-        return assignments
-    encoded_boxes = np.apply_along_axis(assign_prior_boxes_to_ground_truth, 1,
-                                        ground_truth_data[:, :4], prior_boxes,
-                                        box_scale_factors, regress,
-                                        overlap_threshold)
-    encoded_boxes = encoded_boxes.reshape(-1, len(prior_boxes), 5)
-    best_iou = encoded_boxes[:, :, -1].max(axis=0)
-    best_iou_indices = encoded_boxes[:, :, -1].argmax(axis=0)
-    best_iou_mask = best_iou > 0
-    best_iou_indices = best_iou_indices[best_iou_mask]
-    num_assigned_boxes = len(best_iou_indices)
-    encoded_boxes = encoded_boxes[:, best_iou_mask, :]
-    assignments[best_iou_mask, :4] = encoded_boxes[best_iou_indices,
-                                            np.arange(num_assigned_boxes),
-                                            :4]
-
-    assignments[:, 4][best_iou_mask] = 0
-    #assignments[:, 5:-8][best_iou_mask] = ground_truth_data[best_iou_indices, 5:]
-    assignments[:, 5:][best_iou_mask] = ground_truth_data[best_iou_indices, 5:]
-    #assignments[:, -8][best_iou_mask] = 1
-    return assignments
+    ground_truth_data, object_mask = pad_ground_truth_data(
+                                                [ground_truth_data])
+    assignments = assign_prior_boxes_batch(prior_boxes, ground_truth_data,
+                                    object_mask, num_classes,
+                                    box_scale_factors, regress,
+                                    overlap_threshold, background_id,
+                                    prior_box_index)
+    return assignments[0]
 
 def load_model_configurations(model):
     """
@@ -269,85 +792,265 @@ def load_model_configurations(model):
         layer_type = layer.__class__.__name__
         if layer_type == 'PriorBox':
             layer_data = {}
-            layer_data['layer_width'] = layer.input_shape[1]
-            layer_data['layer_height'] = layer.input_shape[2]
+            layer_data['layer_width'] = layer.input_shape[layer.waxis]
+            layer_data['layer_height'] = layer.input_shape[layer.haxis]
             layer_data['min_size'] = layer.min_size
             layer_data['max_size'] = layer.max_size
             layer_data['aspect_ratios'] = layer.aspect_ratios
             layer_data['num_prior'] = len(layer.aspect_ratios)
+            layer_data['variances'] = list(np.ravel(layer.variances))
+            layer_data['clip'] = layer.clip
             model_configurations.append(layer_data)
     return model_configurations
 
-def create_prior_boxes(model):
+def calculate_prior_box_sizes(aspect_ratios, min_size, max_size=None):
+    """
+    Arguments:
+        aspect_ratios: List of aspect ratios of a PriorBox layer.
+        min_size: Minimum box size in pixels.
+        max_size: Maximum box size in pixels.
+
+    Returns:
+        box_widths: numpy array with the width of every prior box of
+        a location in pixels.
+        box_heights: numpy array with the height of every prior box of
+        a location in pixels.
+    """
+    box_widths = []
+    box_heights = []
+    for aspect_ratio in aspect_ratios:
+        if aspect_ratio == 1 and len(box_widths) == 0:
+            box_widths.append(min_size)
+            box_heights.append(min_size)
+        elif aspect_ratio == 1 and len(box_widths) > 0:
+            box_widths.append(np.sqrt(min_size * max_size))
+            box_heights.append(np.sqrt(min_size * max_size))
+        elif aspect_ratio != 1:
+            box_widths.append(min_size * np.sqrt(aspect_ratio))
+            box_heights.append(min_size / np.sqrt(aspect_ratio))
+    return np.array(box_widths), np.array(box_heights)
+
+def create_layer_prior_boxes(image_size, layer_size, aspect_ratios,
+                             min_size, max_size=None, clip=True):
+    """
+    Arguments:
+        image_size: The image size (width, height) of the input model.
+        layer_size: The size (width, height) of the feature map of the
+        PriorBox layer.
+        aspect_ratios: List of aspect ratios of the PriorBox layer.
+        min_size: Minimum box size in pixels.
+        max_size: Maximum box size in pixels.
+        clip: Whether to clip the prior boxes to 0-1.
+
+    Returns:
+        prior_boxes: A numpy array with shape
+        (layer_width * layer_height * num_aspect_ratios, 4) containing the
+        normalized prior boxes of the layer.
+    """
+    image_width, image_height = image_size
+    layer_width, layer_height = layer_size
+    num_priors = len(aspect_ratios)
+
+    # .5 is to locate every step in the center of the bounding box
+    step_x = 0.5 * (float(image_width) / float(layer_width))
+    step_y = 0.5 * (float(image_height) / float(layer_height))
+
+    linspace_x = np.linspace(step_x, image_width - step_x, layer_width)
+    linspace_y = np.linspace(step_y, image_height - step_y, layer_height)
+
+    centers_x, centers_y = np.meshgrid(linspace_x, linspace_y)
+    centers_x = centers_x.reshape(-1, 1)
+    centers_y = centers_y.reshape(-1, 1)
+
+    prior_boxes = np.concatenate((centers_x, centers_y), axis=1)
+    prior_boxes = np.tile(prior_boxes, (1, 2 * num_priors))
+
+    box_widths, box_heights = calculate_prior_box_sizes(aspect_ratios,
+                                                        min_size,
+                                                        max_size)
+    # we take half of the widths and heights since we are at the center
+    box_widths = 0.5 * box_widths
+    box_heights = 0.5 * box_heights
+
+    # Normalize to 0-1
+    prior_boxes[:, ::4] -= box_widths
+    prior_boxes[:, 1::4] -= box_heights
+    prior_boxes[:, 2::4] += box_widths
+    prior_boxes[:, 3::4] += box_heights
+    prior_boxes[:, ::2] /= image_width
+    prior_boxes[:, 1::2] /= image_height
+    prior_boxes = prior_boxes.reshape(-1, 4)
+
+    # clip to 0-1
+    if clip:
+        prior_boxes = np.minimum(np.maximum(prior_boxes, 0.0), 1.0)
+    return prior_boxes
+
+def create_prior_boxes_from_configurations(model_configurations,
+                                           image_size):
     """
     Arguments:
-        image_shape: The image shape (width, height) to the
-        input model.
         model_configurations: The model configurations created by
         load_model_configurations that indicate the parameters
         inside the PriorBox layers.
+        image_size: The image size (width, height) of the input model.
 
     Returns:
         prior_boxes: A numpy array containing all prior boxes
     """
-    image_width, image_height = model.input_shape[1:3]
-    model_configurations = load_model_configurations(model)
-
     boxes_parameters = []
     for layer_config in model_configurations:
-        layer_width = layer_config["layer_width"]
-        layer_height = layer_config["layer_height"]
+        layer_size = (layer_config["layer_width"],
+                      layer_config["layer_height"])
         # RENAME: to num_aspect_ratios
         num_priors = layer_config["num_prior"]
         aspect_ratios = layer_config["aspect_ratios"]
-        min_size = layer_config["min_size"]
-        max_size = layer_config["max_size"]
+        assert(num_priors == len(aspect_ratios))
+        layer_prior_boxes = create_layer_prior_boxes(image_size, layer_size,
+                                        aspect_ratios,
+                                        layer_config["min_size"],
+                                        layer_config["max_size"],
+                                        layer_config.get("clip", True))
+        boxes_parameters.append(layer_prior_boxes)
 
-        # .5 is to locate every step in the center of the bounding box
-        step_x = 0.5 * (float(image_width) / float(layer_width))
-        step_y = 0.5 * (float(image_height) / float(layer_height))
+    return np.concatenate(boxes_parameters, axis=0)
 
-        linspace_x = np.linspace(step_x, image_width - step_x, layer_width)
-        linspace_y = np.linspace(step_y, image_height - step_y, layer_height)
+def create_prior_boxes(model):
+    """
+    Arguments:
+        model: A SSD model with PriorBox layers that indicate the
+        parameters of the prior boxes to be created.
 
-        centers_x, centers_y = np.meshgrid(linspace_x, linspace_y)
-        centers_x = centers_x.reshape(-1, 1)
-        centers_y = centers_y.reshape(-1, 1)
+    Returns:
+        prior_boxes: A numpy array containing all prior boxes
+    """
+    image_height, image_width = model.input_shape[1:3]
+    model_configurations = load_model_configurations(model)
+    return create_prior_boxes_from_configurations(model_configurations,
+                                                  (image_width, image_height))
 
-        assert(num_priors == len(aspect_ratios))
-        prior_boxes = np.concatenate((centers_x, centers_y), axis=1)
-        prior_boxes = np.tile(prior_boxes, (1, 2 * num_priors))
-
-        box_widths = []
-        box_heights = []
-        for aspect_ratio in aspect_ratios:
-            if aspect_ratio == 1 and len(box_widths) == 0:
-                box_widths.append(min_size)
-                box_heights.append(min_size)
-            elif aspect_ratio == 1 and len(box_widths) > 0:
-                box_widths.append(np.sqrt(min_size * max_size))
-                box_heights.append(np.sqrt(min_size * max_size))
-            elif aspect_ratio != 1:
-                box_widths.append(min_size * np.sqrt(aspect_ratio))
-                box_heights.append(min_size / np.sqrt(aspect_ratio))
-        # we take half of the widths and heights since we are at the center
-        box_widths = 0.5 * np.array(box_widths)
-        box_heights = 0.5 * np.array(box_heights)
-
-        # Normalize to 0-1
-        prior_boxes[:, ::4] -= box_widths
-        prior_boxes[:, 1::4] -= box_heights
-        prior_boxes[:, 2::4] += box_widths
-        prior_boxes[:, 3::4] += box_heights
-        prior_boxes[:, ::2] /= image_width
-        prior_boxes[:, 1::2] /= image_height
-        prior_boxes = prior_boxes.reshape(-1, 4)
-
-        # clip to 0-1
-        layer_prior_boxes = np.minimum(np.maximum(prior_boxes, 0.0), 1.0)
-        boxes_parameters.append(layer_prior_boxes)
+class PriorBoxIndex(object):
+    """Grid arithmetic lookup of the prior boxes created by
+    create_prior_boxes.
 
-    return np.concatenate(boxes_parameters, axis=0)
+    Prior boxes of every PriorBox layer lie on a regular grid, therefore
+    the locations at which a prior box of a given size can overlap a
+    ground truth box above a threshold form a rectangle of grid cells
+    that is computed directly instead of scanning all prior boxes.
+
+    # Arguments
+        model_configurations: List of PriorBox layer parameters as
+            returned by load_model_configurations.
+        image_size: Size of the input image as tuple (width, height).
+    """
+    def __init__(self, model_configurations, image_size):
+        image_width, image_height = image_size
+        self.layers = []
+        offset = 0
+        for layer_config in model_configurations:
+            layer_width = layer_config['layer_width']
+            layer_height = layer_config['layer_height']
+            box_widths, box_heights = calculate_prior_box_sizes(
+                                            layer_config['aspect_ratios'],
+                                            layer_config['min_size'],
+                                            layer_config['max_size'])
+            box_widths = box_widths / float(image_width)
+            box_heights = box_heights / float(image_height)
+            self.layers.append((offset, layer_width, layer_height,
+                                box_widths, box_heights))
+            offset = offset + layer_width * layer_height * len(box_widths)
+        self.num_prior_boxes = offset
+
+    def find_candidates(self, ground_truth_boxes, overlap_threshold=.5,
+                        margin=1e-4):
+        """Find all (box, prior box) pairs whose intersection over union
+        could be above overlap_threshold.
+
+        # Arguments
+            ground_truth_boxes: numpy array with shape (num_boxes, 4)
+                indicating x_min, y_min, x_max and y_max of every box.
+            overlap_threshold: Intersection over union threshold.
+            margin: Slack in grid cells added to every candidate range.
+
+        # Returns
+            box_args: numpy array with the index of the ground truth box
+                of every candidate pair.
+            prior_args: numpy array with the index of the prior box
+                of every candidate pair.
+        """
+        x_min = ground_truth_boxes[:, 0]
+        y_min = ground_truth_boxes[:, 1]
+        x_max = ground_truth_boxes[:, 2]
+        y_max = ground_truth_boxes[:, 3]
+        widths = np.maximum(x_max - x_min, 0)
+        heights = np.maximum(y_max - y_min, 0)
+        areas = widths * heights
+        box_args = []
+        prior_args = []
+        for offset, layer_width, layer_height, box_widths, box_heights in (
+                                                                self.layers):
+            num_priors = len(box_widths)
+            for prior_arg in range(num_priors):
+                box_width = box_widths[prior_arg]
+                box_height = box_heights[prior_arg]
+                # iou > t requires intersection > t * area, and every
+                # side of the intersection is bounded by the shortest side
+                min_x_overlap = (overlap_threshold * areas /
+                                 np.maximum(np.minimum(heights, box_height),
+                                                        np.finfo(float).tiny))
+                min_y_overlap = (overlap_threshold * areas /
+                                 np.maximum(np.minimum(widths, box_width),
+                                                        np.finfo(float).tiny))
+                valid = np.logical_and(
+                            min_x_overlap <= np.minimum(widths, box_width),
+                            min_y_overlap <= np.minimum(heights, box_height))
+                center_x_min = x_min - 0.5 * box_width + min_x_overlap
+                center_x_max = x_max + 0.5 * box_width - min_x_overlap
+                center_y_min = y_min - 0.5 * box_height + min_y_overlap
+                center_y_max = y_max + 0.5 * box_height - min_y_overlap
+                # grid centers are located at (arg + .5) / layer_size
+                arg_x_min = np.ceil(center_x_min * layer_width - .5 - margin)
+                arg_x_max = np.floor(center_x_max * layer_width - .5 + margin)
+                arg_y_min = np.ceil(center_y_min * layer_height - .5 - margin)
+                arg_y_max = np.floor(center_y_max * layer_height - .5 + margin)
+                arg_x_min = np.maximum(arg_x_min, 0).astype(int)
+                arg_y_min = np.maximum(arg_y_min, 0).astype(int)
+                arg_x_max = np.minimum(arg_x_max, layer_width - 1).astype(int)
+                arg_y_max = np.minimum(arg_y_max, layer_height - 1).astype(int)
+                num_x = np.maximum(arg_x_max - arg_x_min + 1, 0) * valid
+                num_y = np.maximum(arg_y_max - arg_y_min + 1, 0) * valid
+                num_cells = num_x * num_y
+                total_cells = num_cells.sum()
+                if total_cells == 0:
+                    continue
+                layer_box_args = np.repeat(np.arange(len(num_cells)),
+                                                            num_cells)
+                cell_starts = np.cumsum(num_cells) - num_cells
+                cell_args = (np.arange(total_cells) -
+                             np.repeat(cell_starts, num_cells))
+                row_lengths = num_x[layer_box_args]
+                x_args = arg_x_min[layer_box_args] + cell_args % row_lengths
+                y_args = arg_y_min[layer_box_args] + cell_args // row_lengths
+                box_args.append(layer_box_args)
+                prior_args.append(offset + (y_args * layer_width + x_args) *
+                                                    num_priors + prior_arg)
+        if len(box_args) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        return np.concatenate(box_args), np.concatenate(prior_args)
+
+def create_prior_box_index(model):
+    """
+    Arguments:
+        model: A SSD model with PriorBox layers that indicate the
+        parameters of the prior boxes to be created.
+
+    Returns:
+        prior_box_index: A PriorBoxIndex of the prior boxes returned by
+        create_prior_boxes for the same model.
+    """
+    image_height, image_width = model.input_shape[1:3]
+    model_configurations = load_model_configurations(model)
+    return PriorBoxIndex(model_configurations, (image_width, image_height))
 
 def denormalize_box(box_data, original_image_shape):
     """
@@ -379,36 +1082,320 @@ def denormalize_box(box_data, original_image_shape):
                                             box_data[:, 4:]], axis=-1)
     return denormalized_box_data
 
-def apply_non_max_suppression(boxes, iou_threshold=.2):
+def _select_top_k_per_class(scores, class_args, top_k):
+    sorted_args = np.lexsort((-scores, class_args))
+    sorted_classes = class_args[sorted_args]
+    class_starts = np.searchsorted(sorted_classes, sorted_classes)
+    ranks = np.arange(len(sorted_args)) - class_starts
+    return np.sort(sorted_args[ranks < top_k])
+
+def calculate_non_max_suppression_args(coordinates, scores,
+                                       iou_threshold=.45,
+                                       max_output_size=None,
+                                       class_args=None,
+                                       top_k_per_class=None,
+                                       block_size=256):
+    """Greedy score ordered non-maximum suppression.
+
+    Boxes are visited by decreasing score in blocks of block_size. Every
+    block is first resolved against itself with a boolean overlap matrix
+    and the boxes it keeps then suppress all later boxes at once, so that
+    at most (num_kept, num_boxes) intersection over unions are computed.
+
+    Arguments:
+        coordinates: numpy array with shape (num_boxes, 4) indicating
+        x_min, y_min, x_max and y_max of every box.
+        scores: numpy array with shape (num_boxes) of box scores.
+        iou_threshold: Boxes with an intersection over union above this
+        value with respect to a higher scored box are suppressed.
+        max_output_size: Maximum number of selected boxes.
+        class_args: Optional numpy array with shape (num_boxes) with the
+        class of every box. If given boxes only suppress boxes of the same
+        class. Any integer grouping of the boxes can be used, e.g. the
+        image and class of every box in a batch.
+        top_k_per_class: If given only the top_k_per_class highest scored
+        boxes of every class are considered.
+        block_size: Number of boxes resolved together.
+
+    Returns:
+        selected_args: numpy array with the indices of the selected boxes
+        sorted by decreasing score.
+    """
+    coordinates = np.asarray(coordinates, dtype='float32')[:, :4]
+    scores = np.asarray(scores)
+    candidate_args = np.arange(len(scores))
+    if top_k_per_class is not None:
+        if class_args is None:
+            class_args = np.zeros(len(scores), dtype=int)
+        candidate_args = _select_top_k_per_class(scores, class_args,
+                                                 top_k_per_class)
+    if len(candidate_args) == 0 or max_output_size == 0:
+        return np.zeros(0, dtype=int)
+    candidate_args = candidate_args[np.argsort(-scores[candidate_args],
+                                                        kind='mergesort')]
+    coordinates = coordinates[candidate_args]
+    if class_args is None:
+        classes = np.zeros(len(candidate_args), dtype=int)
+    else:
+        classes = np.asarray(class_args)[candidate_args]
+
+    num_boxes = len(coordinates)
+    suppressed = np.zeros(num_boxes, dtype=bool)
+    selected_args = []
+    num_selected = 0
+    for block_start in range(0, num_boxes, block_size):
+        block_end = min(block_start + block_size, num_boxes)
+        block_args = np.arange(block_start, block_end)
+        block_args = block_args[np.logical_not(
+                                    suppressed[block_start:block_end])]
+        if len(block_args) == 0:
+            continue
+        block_coordinates = coordinates[block_args]
+        block_classes = classes[block_args]
+        overlaps = calculate_pairwise_intersection_over_union(
+                    block_coordinates, block_coordinates) > iou_threshold
+        overlaps &= block_classes[:, None] == block_classes[None, :]
+        keep_mask = np.ones(len(block_args), dtype=bool)
+        for box_arg in range(len(block_args)):
+            if keep_mask[box_arg]:
+                keep_mask[box_arg + 1:] &= np.logical_not(
+                                            overlaps[box_arg, box_arg + 1:])
+        kept_args = block_args[keep_mask]
+        selected_args.append(kept_args)
+        num_selected = num_selected + len(kept_args)
+        if max_output_size is not None and num_selected >= max_output_size:
+            break
+        remaining_args = np.arange(block_end, num_boxes)
+        remaining_args = remaining_args[np.logical_not(
+                                            suppressed[block_end:])]
+        if len(remaining_args) == 0:
+            break
+        overlaps = calculate_pairwise_intersection_over_union(
+                    coordinates[kept_args], coordinates[remaining_args])
+        overlaps = overlaps > iou_threshold
+        overlaps &= classes[kept_args, None] == classes[None, remaining_args]
+        suppressed[remaining_args[overlaps.any(axis=0)]] = True
+    selected_args = np.concatenate(selected_args)[:max_output_size]
+    return candidate_args[selected_args]
+
+def apply_non_max_suppression_batch(boxes, offsets, iou_threshold=.2,
+                                    max_output_size=None, class_aware=False,
+                                    top_k_per_class=None):
+    """Apply score ordered non-maximum suppression to the ragged boxes of
+    a batch at once. Boxes of different images never suppress each other.
+
+    Arguments:
+        boxes: numpy array with shape (num_boxes, 4 + num_classes).
+        offsets: numpy array with shape (batch_size + 1). The boxes of
+        image i are boxes[offsets[i]:offsets[i + 1]].
+        iou_threshold: Intersection over union threshold.
+        max_output_size: Maximum number of selected boxes per image.
+        class_aware: See apply_non_max_suppression.
+        top_k_per_class: If given only the top_k_per_class highest scored
+        boxes of every class of every image are considered.
+
+    Returns:
+        selected_boxes: numpy array with the selected boxes of every image
+        sorted by decreasing score.
+        selected_offsets: numpy array with shape (batch_size + 1) with the
+        offsets of selected_boxes.
+    """
+    batch_size = len(offsets) - 1
+    if len(boxes) == 0:
+        return boxes[:0], np.zeros(batch_size + 1, dtype=int)
+    classes = boxes[:, 4:]
+    num_classes = classes.shape[1]
+    scores = np.max(classes, axis=-1)
+    class_args = np.argmax(classes, axis=-1)
+    candidate_mask = np.ones(len(boxes), dtype=bool)
+    if top_k_per_class is not None:
+        image_args = np.repeat(np.arange(batch_size), np.diff(offsets))
+        candidate_mask[:] = False
+        candidate_mask[_select_top_k_per_class(scores,
+                image_args * num_classes + class_args, top_k_per_class)] = True
+    if not class_aware:
+        class_args = np.zeros_like(class_args)
+    # images are suppressed one at a time, a single pass over the whole
+    # batch would compare the kept boxes of every image with all others.
+    selected_args = []
+    for image_arg in range(batch_size):
+        start, end = offsets[image_arg], offsets[image_arg + 1]
+        candidate_args = start + np.flatnonzero(candidate_mask[start:end])
+        image_selected_args = calculate_non_max_suppression_args(
+                    boxes[candidate_args], scores[candidate_args],
+                    iou_threshold, max_output_size,
+                    class_args[candidate_args])
+        selected_args.append(candidate_args[image_selected_args])
+    counts = np.array([len(args) for args in selected_args], dtype=int)
+    selected_args = np.concatenate(selected_args)
+    return boxes[selected_args], _calculate_offsets(counts)
+
+def apply_non_max_suppression(boxes, iou_threshold=.2, max_output_size=None,
+                              class_aware=False, top_k_per_class=None):
+    """Apply score ordered non-maximum suppression to box data.
+
+    By default boxes of all classes suppress each other, as in the
+    original inference.predict. Every post-processing entry point,
+    predict, predict_batch, predict_tiled, Predictor and
+    tf_boxes.detect_boxes, shares this class_aware default.
+
+    Arguments:
+        boxes: numpy array with shape (num_boxes, 4 + num_classes).
+        The score of every box is its highest class probability.
+        iou_threshold: Intersection over union threshold.
+        max_output_size: Maximum number of selected boxes.
+        class_aware: If True boxes only suppress boxes whose highest
+        class probability belongs to the same class.
+        top_k_per_class: If given only the top_k_per_class highest scored
+        boxes of every class are considered.
+
+    Returns:
+        selected_boxes: numpy array with shape (num_selected_boxes,
+        4 + num_classes) sorted by decreasing score.
+    """
     if len(boxes) == 0:
             return []
-    selected_indices = []
-    x_min = boxes[:, 0]
-    y_min = boxes[:, 1]
-    x_max = boxes[:, 2]
-    y_max = boxes[:, 3]
     classes = boxes[:, 4:]
-    sorted_box_indices = np.argsort(y_max)
-    while len(sorted_box_indices) > 0:
-            last = len(sorted_box_indices) - 1
-            i = sorted_box_indices[last]
-            selected_indices.append(i)
-            box = [x_min[i], y_min[i], x_max[i], y_max[i]]
-            box = np.asarray(box)
-            test_boxes = [x_min[sorted_box_indices[:last], None],
-                     y_min[sorted_box_indices[:last], None],
-                     x_max[sorted_box_indices[:last], None],
-                     y_max[sorted_box_indices[:last], None]]
-            test_boxes = np.concatenate(test_boxes, axis=-1)
-            iou = calculate_intersection_over_union(box, test_boxes)
-            current_class = np.argmax(classes[i])
-            box_classes = np.argmax(classes[sorted_box_indices[:last]], axis=-1)
-            class_mask = current_class == box_classes
-            overlap_mask = iou > iou_threshold
-            delete_mask = np.logical_and(overlap_mask, class_mask)
-            sorted_box_indices = np.delete(sorted_box_indices, np.concatenate(([last],
-                    np.where(delete_mask)[0])))
-    return boxes[selected_indices]
+    scores = np.max(classes, axis=-1)
+    class_args = None
+    if class_aware or top_k_per_class is not None:
+        class_args = np.argmax(classes, axis=-1)
+    if not class_aware and top_k_per_class is not None:
+        # per class top k is still computed with the true classes
+        top_k_args = _select_top_k_per_class(scores, class_args,
+                                             top_k_per_class)
+        selected_args = calculate_non_max_suppression_args(
+                            boxes[top_k_args], scores[top_k_args],
+                            iou_threshold, max_output_size)
+        return boxes[top_k_args[selected_args]]
+    selected_args = calculate_non_max_suppression_args(boxes, scores,
+                                        iou_threshold, max_output_size,
+                                        class_args, top_k_per_class)
+    return boxes[selected_args]
+
+def denormalize_box_batch(box_data, offsets, original_image_shapes):
+    """
+    Arguments:
+        box_data: numpy array with shape (num_samples, 4) or
+        (num_samples, 4 + num_classes) with the boxes of a batch.
+        offsets: numpy array with shape (batch_size + 1). The boxes of
+        image i are box_data[offsets[i]:offsets[i + 1]].
+        original_image_shapes: numpy array with shape (batch_size, 2)
+        with the original image_shape (height, width) of every image.
+
+    Returns:
+        denormalize_box_data: A numpy array with the same shape as box_data
+        containing the original box coordinates.
+    """
+    original_image_shapes = np.asarray(original_image_shapes, dtype=float)
+    original_image_shapes = np.repeat(original_image_shapes,
+                                      np.diff(offsets), axis=0)
+    original_image_heights = original_image_shapes[:, 0]
+    original_image_widths = original_image_shapes[:, 1]
+    denormalized_box_data = np.array(box_data, dtype=float)
+    denormalized_box_data[:, 0] *= original_image_widths
+    denormalized_box_data[:, 1] *= original_image_heights
+    denormalized_box_data[:, 2] *= original_image_widths
+    denormalized_box_data[:, 3] *= original_image_heights
+    return denormalized_box_data
+
+def apply_soft_non_max_suppression(boxes, sigma=.5, score_threshold=.001,
+                                   max_output_size=None, class_aware=False):
+    """Apply Soft-NMS with a gaussian penalty: instead of removing the
+    boxes that overlap a selected box their class probabilities are
+    decayed by exp(-iou ** 2 / sigma).
+
+    Arguments:
+        boxes: numpy array with shape (num_boxes, 4 + num_classes).
+        The score of every box is its highest class probability.
+        sigma: Width of the gaussian penalty.
+        score_threshold: Boxes whose decayed score falls below this value
+        are discarded.
+        max_output_size: Maximum number of selected boxes.
+        class_aware: If True boxes only decay boxes whose highest class
+        probability belongs to the same class. See
+        apply_non_max_suppression.
+
+    Returns:
+        selected_boxes: numpy array with shape (num_selected_boxes,
+        4 + num_classes) with the decayed class probabilities.
+
+    # References
+        https://arxiv.org/abs/1704.04503
+    """
+    if len(boxes) == 0:
+        return []
+    classes = boxes[:, 4:]
+    original_scores = np.max(classes, axis=-1)
+    scores = original_scores.copy()
+    class_args = np.argmax(classes, axis=-1)
+    active_mask = scores > score_threshold
+    selected_indices = []
+    while active_mask.any():
+        if max_output_size is not None:
+            if len(selected_indices) >= max_output_size:
+                break
+        best_arg = np.argmax(np.where(active_mask, scores, -np.inf))
+        selected_indices.append(best_arg)
+        active_mask[best_arg] = False
+        active_args = np.nonzero(active_mask)[0]
+        if len(active_args) == 0:
+            break
+        ious = calculate_pairwise_intersection_over_union(
+                    boxes[best_arg:best_arg + 1], boxes[active_args])[0]
+        decay = np.exp(-(ious ** 2) / sigma)
+        if class_aware:
+            decay[class_args[active_args] != class_args[best_arg]] = 1.0
+        scores[active_args] = scores[active_args] * decay
+        active_mask[active_args] = scores[active_args] > score_threshold
+    selected_boxes = boxes[selected_indices].copy()
+    decay = scores[selected_indices] / original_scores[selected_indices]
+    selected_boxes[:, 4:] = selected_boxes[:, 4:] * decay[:, None]
+    return selected_boxes
+
+def select_top_k_boxes(boxes, top_k):
+    """Select the top_k boxes with the highest score in linear time.
+
+    Arguments:
+        boxes: numpy array with shape (num_boxes, 4 + num_classes).
+        The score of every box is its highest class probability.
+        top_k: Number of boxes to keep. If None all boxes are kept.
+
+    Returns:
+        selected_boxes: numpy array with shape (min(top_k, num_boxes),
+        4 + num_classes) in no particular order.
+    """
+    if top_k is None or len(boxes) <= top_k:
+        return boxes
+    scores = np.max(boxes[:, 4:], axis=-1)
+    top_k_args = np.argpartition(-scores, top_k - 1)[:top_k]
+    return boxes[top_k_args]
+
+def select_top_k_boxes_batch(boxes, offsets, top_k):
+    """Select the top_k boxes with the highest score of every image.
+
+    Arguments:
+        boxes: numpy array with shape (num_boxes, 4 + num_classes).
+        offsets: numpy array with shape (batch_size + 1). The boxes of
+        image i are boxes[offsets[i]:offsets[i + 1]].
+        top_k: Number of boxes to keep per image. If None all boxes are
+        kept.
+
+    Returns:
+        selected_boxes: numpy array with the selected boxes of every image
+        in no particular order, as select_top_k_boxes returns them.
+        selected_offsets: numpy array with the offsets of selected_boxes.
+    """
+    counts = np.diff(offsets)
+    if top_k is None or len(boxes) == 0 or counts.max() <= top_k:
+        return boxes, offsets
+    image_args = np.repeat(np.arange(len(counts)), counts)
+    scores = np.max(boxes[:, 4:], axis=-1)
+    sorted_args = np.lexsort((-scores, image_args))
+    ranks = np.arange(len(boxes)) - np.repeat(offsets[:-1], counts)
+    selected_args = sorted_args[ranks < top_k]
+    return boxes[selected_args], _calculate_offsets(np.minimum(counts,
+                                                               top_k))
 
 def filter_boxes(predictions, num_classes, background_index=0,
                                     lower_probability_threshold=.4):
@@ -5,7 +5,10 @@ from random import shuffle
 #from .utils import preprocess_images
 from .preprocessing import load_image
 from .preprocessing import preprocess_images
-from .boxes import assign_prior_boxes
+from .boxes import assign_prior_boxes_batch
+from .boxes import assign_prior_boxes_batch_sparse
+from .boxes import pack_sparse_targets
+from .boxes import pad_ground_truth_data
 
 class ImageGenerator(object):
     """ Image generator with saturation, brightness, lighting, contrast,
@@ -30,7 +33,9 @@ class ImageGenerator(object):
                 vertical_flip_probability=0.5,
                 do_crop=True,
                 crop_area_range=[0.75, 1.0],
-                aspect_ratio_range=[3./4., 4./3.]):
+                aspect_ratio_range=[3./4., 4./3.],
+                sparse_targets=False,
+                prior_box_index=None):
 
         self.ground_truth_data = ground_truth_data
         self.prior_boxes = prior_boxes
@@ -57,6 +62,8 @@ class ImageGenerator(object):
         self.do_crop = do_crop
         self.crop_area_range = crop_area_range
         self.aspect_ratio_range = aspect_ratio_range
+        self.sparse_targets = sparse_targets
+        self.prior_box_index = prior_box_index
 
     def _gray_scale(self, image_array):
         return image_array.dot([0.299, 0.587, 0.114])
@@ -141,15 +148,11 @@ class ImageGenerator(object):
                     if mode == 'train' or mode == 'demo':
                         image_array, box_corners = self.transform(image_array,
                                                                 box_corners)
-                    box_corners = assign_prior_boxes(self.prior_boxes,
-                                                    box_corners,
-                                                    self.num_classes,
-                                                    self.box_scale_factors)
                     inputs.append(image_array)
                     targets.append(box_corners)
                     if len(targets) == self.batch_size:
                         inputs = np.asarray(inputs)
-                        targets = np.asarray(targets)
+                        targets = self._assign_prior_boxes(targets)
                         if mode == 'train' or mode == 'val':
                             inputs = preprocess_images(inputs)
                             yield self._wrap_in_dictionary(inputs, targets)
@@ -158,6 +161,20 @@ class ImageGenerator(object):
                         inputs = []
                         targets = []
 
+    def _assign_prior_boxes(self, ground_truth_data):
+        ground_truth_data, object_mask = pad_ground_truth_data(
+                                                        ground_truth_data)
+        if self.sparse_targets:
+            class_args, regressed_boxes = assign_prior_boxes_batch_sparse(
+                                self.prior_boxes, ground_truth_data,
+                                object_mask, self.box_scale_factors,
+                                prior_box_index=self.prior_box_index)
+            return pack_sparse_targets(class_args, regressed_boxes)
+        return assign_prior_boxes_batch(self.prior_boxes, ground_truth_data,
+                                object_mask, self.num_classes,
+                                self.box_scale_factors,
+                                prior_box_index=self.prior_box_index)
+
     def _wrap_in_dictionary(self, image_array, targets):
         return [{'input_1':image_array},
                 {'predictions':targets}]
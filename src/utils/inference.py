@@ -1,32 +1,325 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-from .preprocessing import preprocess_images
-from .boxes import decode_boxes
-from .boxes import filter_boxes
-from .preprocessing import resize_image_array
+from .preprocessing import allocate_image_batch
+from .preprocessing import preprocess_image_into
+from .preprocessing import load_pil_image
+from .boxes import decode_and_filter_boxes
+from .boxes import decode_and_filter_boxes_batch
+from .boxes import denormalize_box_batch
+from .boxes import select_top_k_boxes_batch
+from .boxes import apply_non_max_suppression_batch
+from .boxes import split_boxes_batch
 from .boxes import denormalize_box
-#from .boxes import apply_non_max_suppression
+from .boxes import select_top_k_boxes
+from .boxes import calculate_box_centers
+from .boxes import apply_soft_non_max_suppression
+from .boxes import apply_non_max_suppression as \
+                                    apply_numpy_non_max_suppression
 from .tf_boxes import apply_non_max_suppression
+from .timing import null_timer
 
 def predict(model, image_array, prior_boxes, original_image_shape,
             num_classes=21, lower_probability_threshold=.1,
             iou_threshold=.5, background_index=0,
-            box_scale_factors=[.1, .1, .2, .2]):
+            box_scale_factors=[.1, .1, .2, .2],
+            pre_nms_top_k=None, keep_top_k=100, soft_nms=False,
+            soft_nms_sigma=.5, prior_box_centers=None, class_aware=False,
+            bgr=False, timer=None):
+    """Detect the boxes of a single image.
 
-    image_array = image_array.astype('float32')
+    pre_nms_top_k bounds the number of boxes that reach the non-maximum
+    suppression to the highest scored ones, keep_top_k bounds the number
+    of returned boxes and soft_nms replaces the non-maximum suppression
+    with Soft-NMS, in which case iou_threshold is not used.
+    prior_box_centers can be computed once with calculate_box_centers.
+    class_aware is described in boxes.apply_non_max_suppression.
+    bgr indicates that image_array is in BGR order, e.g. an OpenCV frame.
+    timer is an optional utils.timing.StageTimer that records the latency
+    of every stage.
+    """
+    if timer is None:
+        timer = null_timer
     input_size = model.input_shape[1:3]
-    image_array = resize_image_array(image_array, input_size)
-    image_array = np.expand_dims(image_array, axis=0)
-    image_array = preprocess_images(image_array)
-    predictions = model.predict(image_array)
+    with timer.stage('preprocess'):
+        image_arrays = allocate_image_batch(1, input_size)
+        preprocess_image_into(image_array, image_arrays[0], bgr)
+    with timer.stage('model'):
+        predictions = model.predict(image_arrays)
     predictions = np.squeeze(predictions)
-    decoded_predictions = decode_boxes(predictions, prior_boxes,
-                                              box_scale_factors)
-    selected_boxes = filter_boxes(decoded_predictions,
-                num_classes, background_index,
-                lower_probability_threshold)
+    with timer.stage('decode'):
+        selected_boxes = decode_and_filter_boxes(predictions, prior_boxes,
+                    box_scale_factors, num_classes, background_index,
+                    lower_probability_threshold, prior_box_centers)
+    if len(selected_boxes) == 0:
+        return None
+    with timer.stage('top_k'):
+        selected_boxes = select_top_k_boxes(selected_boxes, pre_nms_top_k)
+    with timer.stage('denormalize'):
+        selected_boxes = denormalize_box(selected_boxes,
+                                         original_image_shape)
+    with timer.stage('nms'):
+        if soft_nms:
+            selected_boxes = apply_soft_non_max_suppression(selected_boxes,
+                                            soft_nms_sigma,
+                                            max_output_size=keep_top_k,
+                                            class_aware=class_aware)
+        elif class_aware:
+            selected_boxes = apply_numpy_non_max_suppression(selected_boxes,
+                                            iou_threshold, keep_top_k,
+                                            class_aware)
+        else:
+            selected_boxes = apply_non_max_suppression(selected_boxes,
+                                            iou_threshold, keep_top_k)
+    return selected_boxes
+
+def detect_boxes_batch(predictions, prior_boxes, original_image_shapes,
+                       num_classes=21, lower_probability_threshold=.1,
+                       iou_threshold=.5, background_index=0,
+                       box_scale_factors=[.1, .1, .2, .2],
+                       pre_nms_top_k=None, keep_top_k=100,
+                       prior_box_centers=None, class_aware=False,
+                       timer=None):
+    """Post-process the predictions of a batch of images at once.
+
+    Returns the detected boxes of all images and their offsets, the
+    boxes of image i being boxes[offsets[i]:offsets[i + 1]].
+    """
+    if timer is None:
+        timer = null_timer
+    with timer.stage('decode'):
+        selected_boxes, offsets = decode_and_filter_boxes_batch(
+                    predictions, prior_boxes, box_scale_factors,
+                    num_classes, background_index,
+                    lower_probability_threshold, prior_box_centers)
+    with timer.stage('top_k'):
+        selected_boxes, offsets = select_top_k_boxes_batch(selected_boxes,
+                                                    offsets, pre_nms_top_k)
+    with timer.stage('denormalize'):
+        selected_boxes = denormalize_box_batch(selected_boxes, offsets,
+                                               original_image_shapes)
+    with timer.stage('nms'):
+        return apply_non_max_suppression_batch(selected_boxes, offsets,
+                                               iou_threshold, keep_top_k,
+                                               class_aware)
+
+def predict_batch(model, image_arrays, prior_boxes, original_image_shapes,
+                  num_classes=21, lower_probability_threshold=.1,
+                  iou_threshold=.5, background_index=0,
+                  box_scale_factors=[.1, .1, .2, .2],
+                  pre_nms_top_k=None, keep_top_k=100,
+                  prior_box_centers=None, class_aware=False, timer=None):
+    """Detect the boxes of a list of images with a single model call.
+
+    Returns the detected boxes of all images and their offsets, the
+    boxes of image i being boxes[offsets[i]:offsets[i + 1]].
+    """
+    if timer is None:
+        timer = null_timer
+    input_size = model.input_shape[1:3]
+    with timer.stage('preprocess'):
+        batch = allocate_image_batch(len(image_arrays), input_size)
+        for image_array, output in zip(image_arrays, batch):
+            preprocess_image_into(image_array, output)
+    with timer.stage('model'):
+        predictions = model.predict(batch)
+    return detect_boxes_batch(predictions, prior_boxes,
+                              original_image_shapes, num_classes,
+                              lower_probability_threshold, iou_threshold,
+                              background_index, box_scale_factors,
+                              pre_nms_top_k, keep_top_k, prior_box_centers,
+                              class_aware, timer)
+
+def calculate_tiles(image_shape, tile_size=(600, 600), overlap=.2):
+    """Returns the (y_min, x_min, y_max, x_max) pixel coordinates of the
+    overlapping tiles covering an image. Tiles are evenly spaced, so the
+    overlap between neighbouring tiles is at least overlap times the tile
+    size, and tiles larger than the image are clipped to it."""
+    tiles_per_axis = []
+    for image_length, tile_length in zip(image_shape[0:2], tile_size):
+        tile_length = min(tile_length, image_length)
+        stride = max(1, int(tile_length * (1 - overlap)))
+        num_tiles = int(np.ceil(max(0, image_length - tile_length) /
+                                float(stride))) + 1
+        if num_tiles == 1:
+            starts = [0]
+        else:
+            starts = np.linspace(0, image_length - tile_length, num_tiles)
+            starts = np.round(starts).astype(int).tolist()
+        tiles_per_axis.append([(start, start + tile_length)
+                               for start in starts])
+    return [(y_min, x_min, y_max, x_max)
+            for y_min, y_max in tiles_per_axis[0]
+            for x_min, x_max in tiles_per_axis[1]]
+
+def predict_tiled(model, image_array, prior_boxes, tile_size=(600, 600),
+                  overlap=.2, include_full_image=True, num_classes=21,
+                  lower_probability_threshold=.1, iou_threshold=.5,
+                  background_index=0, box_scale_factors=[.1, .1, .2, .2],
+                  pre_nms_top_k=None, keep_top_k=100,
+                  prior_box_centers=None, class_aware=False, bgr=False,
+                  timer=None):
+    """Detect the boxes of a large image on overlapping tiles.
+
+    All tiles, and the whole image if include_full_image is True, are
+    resized to the model input and run in a single model call. The
+    detections of every tile are mapped back to image coordinates and the
+    duplicates across tile seams are merged with non-maximum suppression.
+
+    # Arguments
+        tile_size: (height, width) of the tiles in image pixels.
+        overlap: Minimum overlap of neighbouring tiles as a fraction of
+            tile_size.
+        The remaining arguments are the ones of predict.
+
+    # Returns
+        numpy array with shape (num_boxes, 4 + num_classes) with the
+        boxes in image pixels, or None if no box is detected.
+    """
+    if timer is None:
+        timer = null_timer
+    image_shape = image_array.shape[0:2]
+    tiles = calculate_tiles(image_shape, tile_size, overlap)
+    if include_full_image and len(tiles) > 1:
+        tiles.append((0, 0) + tuple(image_shape))
+    input_size = model.input_shape[1:3]
+    with timer.stage('preprocess'):
+        batch = allocate_image_batch(len(tiles), input_size)
+        for (y_min, x_min, y_max, x_max), output in zip(tiles, batch):
+            preprocess_image_into(image_array[y_min:y_max, x_min:x_max],
+                                  output, bgr)
+    with timer.stage('model'):
+        predictions = model.predict(batch, batch_size=len(tiles))
+    tile_shapes = [(y_max - y_min, x_max - x_min)
+                   for y_min, x_min, y_max, x_max in tiles]
+    selected_boxes, offsets = detect_boxes_batch(predictions, prior_boxes,
+                tile_shapes, num_classes, lower_probability_threshold,
+                iou_threshold, background_index, box_scale_factors,
+                pre_nms_top_k, keep_top_k, prior_box_centers, class_aware,
+                timer)
     if len(selected_boxes) == 0:
         return None
-    selected_boxes = denormalize_box(selected_boxes, original_image_shape)
-    selected_boxes = apply_non_max_suppression(selected_boxes, iou_threshold)
+    with timer.stage('merge'):
+        tile_origins = np.asarray([(x_min, y_min, x_min, y_min)
+                                   for y_min, x_min, y_max, x_max in tiles])
+        selected_boxes[:, 0:4] += np.repeat(tile_origins, np.diff(offsets),
+                                            axis=0)
+        selected_boxes = apply_numpy_non_max_suppression(selected_boxes,
+                                iou_threshold, keep_top_k, class_aware)
     return selected_boxes
 
+class Predictor(object):
+    """Batched detector that loads and resizes the next batches of images
+    in a thread pool while the model runs on the current batch.
+
+    # Arguments
+        model: SSD model.
+        prior_boxes: numpy array with shape (num_prior_boxes, 4).
+        batch_size: Number of images per model call.
+        num_workers: Number of threads used to load and resize images.
+        num_prefetched_batches: Number of batches loaded ahead of the
+            batch the model is running on.
+        The remaining arguments are the ones of predict. The 'wait' stage
+        of timer is the time the model waits for the image loaders.
+    """
+    def __init__(self, model, prior_boxes, num_classes=21, batch_size=8,
+                 num_workers=4, num_prefetched_batches=2,
+                 lower_probability_threshold=.1, iou_threshold=.5,
+                 background_index=0, box_scale_factors=[.1, .1, .2, .2],
+                 pre_nms_top_k=None, keep_top_k=100, class_aware=False,
+                 timer=None):
+        self.model = model
+        self.prior_boxes = prior_boxes
+        self.prior_box_centers = calculate_box_centers(prior_boxes)
+        self.num_classes = num_classes
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.num_prefetched_batches = num_prefetched_batches
+        self.lower_probability_threshold = lower_probability_threshold
+        self.iou_threshold = iou_threshold
+        self.background_index = background_index
+        self.box_scale_factors = box_scale_factors
+        self.pre_nms_top_k = pre_nms_top_k
+        self.keep_top_k = keep_top_k
+        self.class_aware = class_aware
+        self.input_size = model.input_shape[1:3]
+        self.timer = timer
+        if self.timer is None:
+            self.timer = null_timer
+
+    def _load_image(self, image, output):
+        """Writes the preprocessed image of an image path or image array
+        into output and returns its original shape (height, width)."""
+        if isinstance(image, np.ndarray):
+            original_image_shape = image.shape[0:2]
+        else:
+            with self.timer.stage('load'):
+                image = load_pil_image(image)
+                image.load()
+            original_image_shape = image.size[::-1]
+        with self.timer.stage('preprocess'):
+            preprocess_image_into(image, output)
+        return original_image_shape
+
+    def _batch_images(self, images):
+        batch = []
+        for image in images:
+            batch.append(image)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    def _predict_batch(self, image_arrays, original_image_shapes):
+        with self.timer.stage('model'):
+            predictions = self.model.predict(image_arrays,
+                                             batch_size=len(image_arrays))
+        selected_boxes, offsets = detect_boxes_batch(predictions,
+                self.prior_boxes, original_image_shapes, self.num_classes,
+                self.lower_probability_threshold, self.iou_threshold,
+                self.background_index, self.box_scale_factors,
+                self.pre_nms_top_k, self.keep_top_k, self.prior_box_centers,
+                self.class_aware, self.timer)
+        return split_boxes_batch(selected_boxes, offsets)
+
+    def predict(self, images):
+        """Detect the boxes of every image.
+
+        # Arguments
+            images: Iterable of image paths or RGB image arrays.
+
+        # Returns
+            Generator of numpy arrays with shape (num_boxes, 4 + num_classes)
+            with the detected boxes of every image, in input order.
+        """
+        batches = enumerate(self._batch_images(images))
+        # the prefetched batches and the one being predicted when the next
+        # batch is submitted each hold a buffer
+        buffers = [allocate_image_batch(self.batch_size, self.input_size)
+                   for _ in range(self.num_prefetched_batches + 2)]
+        with ThreadPoolExecutor(self.num_workers) as executor:
+            pending_batches = deque()
+
+            def submit_next_batch():
+                for batch_arg, batch in batches:
+                    image_arrays = buffers[batch_arg % len(buffers)]
+                    image_arrays = image_arrays[:len(batch)]
+                    futures = [executor.submit(self._load_image, image,
+                                               output)
+                               for image, output in zip(batch, image_arrays)]
+                    pending_batches.append((image_arrays, futures))
+                    return
+
+            for batch_arg in range(self.num_prefetched_batches + 1):
+                submit_next_batch()
+            while len(pending_batches) > 0:
+                image_arrays, futures = pending_batches.popleft()
+                with self.timer.stage('wait'):
+                    original_image_shapes = [future.result()
+                                             for future in futures]
+                submit_next_batch()
+                for image_boxes in self._predict_batch(image_arrays,
+                                                original_image_shapes):
+                    yield image_boxes
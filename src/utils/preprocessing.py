@@ -3,9 +3,48 @@ from PIL import Image as pil_image
 from keras.applications.vgg16 import preprocess_input
 from keras.preprocessing import image as keras_image_preprocessor
 
+MEAN_PIXEL_BGR = np.array([103.939, 116.779, 123.68], dtype='float32')
+
 def preprocess_images(image_array):
     return preprocess_input(image_array)
 
+def allocate_image_batch(batch_size, target_size):
+    """Returns an uninitialized float32 buffer with shape
+    (batch_size, height, width, 3) to be filled by preprocess_image_into.
+    """
+    return np.empty((batch_size, target_size[0], target_size[1], 3),
+                    dtype='float32')
+
+def preprocess_image_into(image, output, bgr=False):
+    """Resize an image once and write it into output as the zero-centered
+    BGR array returned by preprocess_images.
+
+    The uint8 data is resized by PIL and the channel swap, the cast to
+    float32 and the mean subtraction are done by a single subtraction
+    into output, therefore no intermediate float32 copy is made.
+
+    Arguments:
+        image: PIL image or uint8 numpy array with shape
+        (height, width, 3). Arrays of other types are cast to uint8.
+        output: float32 numpy array with shape (target_height,
+        target_width, 3), usually an image of allocate_image_batch.
+        bgr: If True the channels of image are in BGR order, e.g.
+        OpenCV frames, and they are not swapped.
+
+    Returns:
+        output
+    """
+    if isinstance(image, np.ndarray):
+        if image.dtype != np.uint8:
+            image = image.astype('uint8')
+        # the resize does not depend on the channel order
+        image = pil_image.fromarray(image)
+    image_array = np.asarray(resize_image(image, output.shape[0:2]))
+    if not bgr:
+        image_array = image_array[:, :, ::-1]
+    np.subtract(image_array, MEAN_PIXEL_BGR, out=output)
+    return output
+
 def load_image(image_path, target_size=None, grayscale=False):
     image = keras_image_preprocessor.load_img(image_path,
                                                 grayscale,
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .boxes import calculate_box_centers
+from .boxes import create_prior_boxes_from_configurations
+from .boxes import load_model_configurations
+
+
+class PriorBoxSet(object):
+    """Prior boxes of a SSD model in corner form, center form and their
+    variances, stored as float32 and keyed by a hash of the PriorBox
+    layer configurations.
+
+    # Arguments
+        data: numpy array with shape (num_prior_boxes, 12) containing
+            x_min, y_min, x_max, y_max, center_x, center_y, width, height
+            and the four variances of every prior box.
+        key: Hash of the configurations the prior boxes were created from.
+
+    # Attributes
+        boxes: Prior boxes in corner form, shape (num_prior_boxes, 4).
+        box_centers: Prior boxes in center form, shape (num_prior_boxes, 4).
+        variances: Variances of the prior boxes, shape (num_prior_boxes, 4).
+    """
+    def __init__(self, data, key=None):
+        self.data = data
+        self.key = key
+        self.boxes = data[:, 0:4]
+        self.box_centers = data[:, 4:8]
+        self.variances = data[:, 8:12]
+
+    def __len__(self):
+        return len(self.data)
+
+    @classmethod
+    def from_configurations(cls, model_configurations, image_size):
+        boxes = create_prior_boxes_from_configurations(model_configurations,
+                                                       image_size)
+        variances = []
+        for layer_config in model_configurations:
+            num_layer_boxes = (layer_config['layer_width'] *
+                               layer_config['layer_height'] *
+                               layer_config['num_prior'])
+            layer_variances = layer_config.get('variances', [.1, .1, .2, .2])
+            if len(layer_variances) == 1:
+                layer_variances = 4 * list(layer_variances)
+            variances.append(np.tile(layer_variances, (num_layer_boxes, 1)))
+        data = np.concatenate([boxes, calculate_box_centers(boxes),
+                               np.concatenate(variances, axis=0)], axis=1)
+        key = hash_model_configurations(model_configurations, image_size)
+        return cls(data.astype('float32'), key)
+
+    @classmethod
+    def from_model(cls, model):
+        # (width, height) of the model input
+        image_size = (model.input_shape[2], model.input_shape[1])
+        return cls.from_configurations(load_model_configurations(model),
+                                       image_size)
+
+    def save(self, path):
+        """Write the prior boxes to a .npy file. The file is written next
+        to path first and then renamed so readers never see it partially.
+        """
+        temporary_path = path + '.{}.tmp.npy'.format(os.getpid())
+        np.save(temporary_path, self.data)
+        os.rename(temporary_path, path)
+
+    @classmethod
+    def load(cls, path, key=None, mmap_mode='r'):
+        return cls(np.load(path, mmap_mode=mmap_mode), key)
+
+
+def hash_model_configurations(model_configurations, image_size):
+    """Returns a hex digest that identifies the prior boxes created from
+    model_configurations for an input of image_size.
+    """
+    configurations = []
+    for layer_config in model_configurations:
+        configurations.append({
+            'layer_width': int(layer_config['layer_width']),
+            'layer_height': int(layer_config['layer_height']),
+            'min_size': float(layer_config['min_size']),
+            'max_size': (None if layer_config['max_size'] is None
+                         else float(layer_config['max_size'])),
+            'aspect_ratios': [float(aspect_ratio) for aspect_ratio
+                              in layer_config['aspect_ratios']],
+            'variances': [float(variance) for variance
+                          in layer_config.get('variances', [])],
+            'clip': bool(layer_config.get('clip', True))})
+    description = json.dumps({'image_size': [int(size) for size
+                                             in image_size],
+                              'layers': configurations}, sort_keys=True)
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()[:16]
+
+
+def load_prior_box_set(model, cache_path='../trained_models/prior_boxes/'):
+    """Load the PriorBoxSet of model from cache_path, creating and caching
+    it the first time it is requested.
+
+    # Arguments
+        model: A SSD model with PriorBox layers.
+        cache_path: Directory of the cached .npy files. If None the prior
+            boxes are created without being cached.
+
+    # Returns
+        prior_box_set: A PriorBoxSet memory mapped from the cache file.
+    """
+    # (width, height) of the model input
+    image_size = (model.input_shape[2], model.input_shape[1])
+    model_configurations = load_model_configurations(model)
+    key = hash_model_configurations(model_configurations, image_size)
+    if cache_path is None:
+        return PriorBoxSet.from_configurations(model_configurations,
+                                               image_size)
+    filename = os.path.join(cache_path, 'prior_boxes_{}.npy'.format(key))
+    if not os.path.exists(filename):
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path)
+        prior_box_set = PriorBoxSet.from_configurations(
+                                    model_configurations, image_size)
+        prior_box_set.save(filename)
+    return PriorBoxSet.load(filename, key)
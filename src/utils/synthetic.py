@@ -0,0 +1,87 @@
+import numpy as np
+
+from .boxes import create_prior_boxes_from_configurations
+
+# (layer_size, min_size, max_size, aspect_ratios) of the PriorBox layers
+# of SSD300 with the aspect ratios as expanded by the layer.
+SSD300_PRIOR_BOX_LAYERS = [
+    (38, 30., None, [1., 2., 1. / 2.]),
+    (19, 60., 114., [1., 1., 2., 1. / 2., 3., 1. / 3.]),
+    (10, 114., 168., [1., 1., 2., 1. / 2., 3., 1. / 3.]),
+    (5, 168., 222., [1., 1., 2., 1. / 2., 3., 1. / 3.]),
+    (3, 222., 276., [1., 1., 2., 1. / 2., 3., 1. / 3.]),
+    (1, 276., 330., [1., 1., 2., 1. / 2., 3., 1. / 3.])]
+
+
+def make_model_configurations():
+    """The PriorBox layer parameters of SSD300 as returned by
+    load_model_configurations."""
+    model_configurations = []
+    for layer_size, min_size, max_size, aspect_ratios in (
+                                            SSD300_PRIOR_BOX_LAYERS):
+        model_configurations.append({'layer_width': layer_size,
+                                     'layer_height': layer_size,
+                                     'min_size': min_size,
+                                     'max_size': max_size,
+                                     'aspect_ratios': aspect_ratios,
+                                     'num_prior': len(aspect_ratios)})
+    return model_configurations
+
+
+def make_prior_boxes(image_size=(300, 300)):
+    """The 7308 prior boxes of SSD300, without building the model."""
+    return create_prior_boxes_from_configurations(
+                                make_model_configurations(), image_size)
+
+
+def make_ground_truth(num_objects, num_classes=21, random_state=None):
+    """Normalized ground truth boxes with one-hot classes as returned by
+    XMLParser."""
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    centers = random_state.uniform(.1, .9, (num_objects, 2))
+    sizes = random_state.uniform(.05, .5, (num_objects, 2))
+    boxes = np.clip(np.concatenate([centers - sizes / 2,
+                                    centers + sizes / 2], axis=1), 0, 1)
+    classes = np.eye(num_classes)[random_state.randint(1, num_classes,
+                                                       num_objects)]
+    return np.concatenate([boxes, classes], axis=1)
+
+
+def make_predictions(prior_boxes, num_classes=21, random_state=None,
+                     box_scale_factors=[.1, .1, .2, .2]):
+    """Model output with shape (num_prior_boxes, 4 + num_classes + 8)."""
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    num_prior_boxes = len(prior_boxes)
+    logits = random_state.normal(0, 2, (num_prior_boxes, num_classes))
+    logits[:, 0] = logits[:, 0] + 4
+    probabilities = np.exp(logits)
+    probabilities = probabilities / probabilities.sum(axis=1, keepdims=True)
+    return np.concatenate([random_state.normal(0, 1, (num_prior_boxes, 4)),
+                           probabilities, prior_boxes,
+                           np.tile(box_scale_factors, (num_prior_boxes, 1))],
+                          axis=1).astype('float32')
+
+
+def make_detections(num_boxes, num_classes=21, image_size=(1200, 1920),
+                    random_state=None):
+    """Synthetic denormalized detections clustered around a few objects
+    as they come out of filter_boxes."""
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    image_height, image_width = image_size
+    num_objects = max(1, num_boxes // 50)
+    object_centers = random_state.uniform(0, 1, (num_objects, 2))
+    object_centers = object_centers * [image_width, image_height]
+    object_sizes = random_state.uniform(20, 300, (num_objects, 2))
+    object_args = random_state.randint(0, num_objects, num_boxes)
+    centers = (object_centers[object_args] +
+               random_state.normal(0, 10, (num_boxes, 2)))
+    sizes = (object_sizes[object_args] *
+             random_state.uniform(.8, 1.2, (num_boxes, 2)))
+    coordinates = np.concatenate([centers - sizes / 2,
+                                  centers + sizes / 2], axis=1)
+    class_probabilities = random_state.dirichlet(
+                            .3 * np.ones(num_classes), num_boxes)
+    return np.concatenate([coordinates, class_probabilities], axis=1)
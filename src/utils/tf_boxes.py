@@ -1,17 +1,198 @@
 import tensorflow as tf
 import numpy as np
 
-session = tf.Session(config=tf.ConfigProto(device_count={'GPU':0}))
+from .boxes import calculate_box_centers
+
+graph = tf.Graph()
+session = tf.Session(graph=graph,
+                     config=tf.ConfigProto(device_count={'GPU':0}))
+
+class NonMaxSuppression(object):
+    """Non-maximum suppression op that is built once and reused.
+
+    The placeholders have a dynamic number of boxes, therefore a single
+    op serves every call and the graph does not grow with the number of
+    processed images.
+
+    # Arguments
+        iou_treshold: Intersection over union threshold.
+        max_output_size: Maximum number of selected boxes.
+        session: Session used to run the op. If None a CPU session on
+            graph is created.
+        graph: Graph in which the op is built. If None the graph of
+            session is used, or a new graph if session is also None.
+    """
+    def __init__(self, iou_treshold=.5, max_output_size=100,
+                 session=None, graph=None):
+        if graph is None:
+            if session is None:
+                graph = tf.Graph()
+            else:
+                graph = session.graph
+        if session is None:
+            session = tf.Session(graph=graph,
+                        config=tf.ConfigProto(device_count={'GPU':0}))
+        if session.graph is not graph:
+            raise ValueError('session must be bound to graph')
+        self.iou_treshold = iou_treshold
+        self.max_output_size = max_output_size
+        self.session = session
+        self.graph = graph
+        with self.graph.as_default():
+            self.coordinates = tf.placeholder(dtype='float32',
+                                              shape=(None, 4))
+            self.scores = tf.placeholder(dtype='float32', shape=(None,))
+            self.selected_indices = tf.image.non_max_suppression(
+                                    self.coordinates, self.scores,
+                                    max_output_size, iou_treshold)
+
+    def __call__(self, box_data):
+        if len(box_data) == 0:
+            return box_data
+        class_prob = np.max(box_data[:, 4:], axis=-1)
+        feed_dict = {self.coordinates: box_data[:, 0:4],
+                     self.scores: class_prob}
+        indices = self.session.run(self.selected_indices,
+                                   feed_dict=feed_dict)
+        return box_data[indices]
+
+_non_max_suppression_ops = dict()
+
+def get_non_max_suppression(iou_treshold=.5, max_output_size=100):
+    """Returns the NonMaxSuppression op of the module session for the
+    given parameters, building it only the first time it is requested.
+    """
+    key = (float(iou_treshold), int(max_output_size))
+    if key not in _non_max_suppression_ops:
+        _non_max_suppression_ops[key] = NonMaxSuppression(*key,
+                                                    session=session)
+    return _non_max_suppression_ops[key]
 
 def apply_non_max_suppression(box_data, iou_treshold=.5,
                                         max_output_size=100):
-    num_boxes = len(box_data)
-    coordinates = tf.placeholder(dtype='float32', shape=(num_boxes, 4))
-    scores = tf.placeholder(dtype='float32', shape=(num_boxes))
-    class_prob = np.max(box_data[:, 4:], axis=-1)
-    feed_dict = {coordinates: box_data[:, 0:4], scores: class_prob}
-    non_maximum_supression = tf.image.non_max_suppression(coordinates,
-                                                    scores, max_output_size,
-                                                              iou_treshold)
-    indices = session.run(non_maximum_supression, feed_dict=feed_dict)
-    return box_data[indices]
+    non_max_suppression = get_non_max_suppression(iou_treshold,
+                                                  max_output_size)
+    return non_max_suppression(box_data)
+
+def _decode_box_centers(predicted_boxes, prior_box_centers,
+                        box_scale_factors):
+    """Graph version of boxes._decode_box_centers with the same order of
+    operations."""
+    prior_center_x = prior_box_centers[:, 0]
+    prior_center_y = prior_box_centers[:, 1]
+    prior_width = prior_box_centers[:, 2]
+    prior_height = prior_box_centers[:, 3]
+
+    decoded_center_x = predicted_boxes[..., 0] * prior_width
+    decoded_center_x = decoded_center_x * box_scale_factors[0]
+    decoded_center_x = decoded_center_x + prior_center_x
+    decoded_center_y = predicted_boxes[..., 1] * prior_height
+    decoded_center_y = decoded_center_y * box_scale_factors[1]
+    decoded_center_y = decoded_center_y + prior_center_y
+
+    decoded_width = tf.exp(predicted_boxes[..., 2] * box_scale_factors[2])
+    decoded_width = decoded_width * prior_width
+    decoded_height = tf.exp(predicted_boxes[..., 3] * box_scale_factors[3])
+    decoded_height = decoded_height * prior_height
+
+    decoded_boxes = tf.stack([decoded_center_x - (0.5 * decoded_width),
+                              decoded_center_y - (0.5 * decoded_height),
+                              decoded_center_x + (0.5 * decoded_width),
+                              decoded_center_y + (0.5 * decoded_height)],
+                             axis=-1)
+    return tf.clip_by_value(decoded_boxes, 0.0, 1.0)
+
+def _apply_non_max_suppression_per_class(boxes, scores, classes,
+                                         num_classes, max_output_size,
+                                         iou_threshold):
+    """Runs tf.image.non_max_suppression on the boxes of every class and
+    returns the indices of the selected boxes of all classes sorted by
+    decreasing score."""
+    selected_indices = []
+    for class_arg in range(num_classes):
+        class_indices = tf.cast(tf.where(tf.equal(classes, class_arg))[:, 0],
+                                'int32')
+        class_selected_indices = tf.image.non_max_suppression(
+                                    tf.gather(boxes, class_indices),
+                                    tf.gather(scores, class_indices),
+                                    max_output_size, iou_threshold)
+        selected_indices.append(tf.gather(class_indices,
+                                          class_selected_indices))
+    selected_indices = tf.concat(selected_indices, axis=0)
+    num_selected = tf.minimum(tf.shape(selected_indices)[0],
+                              max_output_size)
+    top_scores, top_args = tf.nn.top_k(tf.gather(scores, selected_indices),
+                                       num_selected)
+    return tf.gather(selected_indices, top_args)
+
+def detect_boxes(predictions, prior_boxes, image_shapes, num_classes=21,
+                 lower_probability_threshold=.1, iou_threshold=.5,
+                 background_index=0, box_scale_factors=[.1, .1, .2, .2],
+                 keep_top_k=100, class_aware=False):
+    """Graph version of the post-processing of inference.predict: decodes
+    the boxes against constant prior boxes, keeps the ones whose best
+    class is not the background and passes lower_probability_threshold,
+    denormalizes them and applies non-maximum suppression.
+
+    As in predict, boxes of all classes suppress each other unless
+    class_aware, in which case the suppression runs on the boxes of every
+    class separately. Boxes with tied scores may be visited in a
+    different order than in predict.
+
+    # Arguments
+        predictions: Tensor with shape (batch_size, num_prior_boxes,
+            4 + num_classes + ...), the output of the SSD model.
+        prior_boxes: numpy array with shape (num_prior_boxes, 4).
+        image_shapes: Tensor with shape (batch_size, 2) with the original
+            (height, width) of every image.
+        class_aware: See boxes.apply_non_max_suppression.
+        The remaining arguments are the ones of inference.predict.
+
+    # Returns
+        detections: Tensor with shape (batch_size, keep_top_k,
+            4 + num_classes) with the boxes of every image as returned by
+            predict, padded with zeros.
+        num_detections: int32 tensor with shape (batch_size) with the
+            number of detected boxes of every image.
+    """
+    prior_box_centers = tf.constant(calculate_box_centers(prior_boxes),
+                                    dtype='float32')
+    decoded_boxes = _decode_box_centers(predictions[..., 0:4],
+                                        prior_box_centers,
+                                        box_scale_factors)
+    box_classes = predictions[..., 4:(4 + num_classes)]
+    image_shapes = tf.cast(image_shapes, 'float32')
+
+    def detect_image_boxes(image_tensors):
+        image_boxes, image_classes, image_shape = image_tensors
+        best_classes = tf.cast(tf.argmax(image_classes, axis=-1), 'int32')
+        best_probabilities = tf.reduce_max(image_classes, axis=-1)
+        mask = tf.logical_and(
+                tf.not_equal(best_classes, background_index),
+                tf.greater(best_probabilities, lower_probability_threshold))
+        # (height, width) -> (width, height, width, height)
+        image_scale = tf.tile(tf.reverse(image_shape, [0]), [2])
+        image_boxes = tf.boolean_mask(image_boxes, mask) * image_scale
+        image_classes = tf.boolean_mask(image_classes, mask)
+        scores = tf.boolean_mask(best_probabilities, mask)
+        if class_aware:
+            selected_indices = _apply_non_max_suppression_per_class(
+                        image_boxes, scores,
+                        tf.boolean_mask(best_classes, mask), num_classes,
+                        keep_top_k, iou_threshold)
+        else:
+            selected_indices = tf.image.non_max_suppression(image_boxes,
+                                        scores, keep_top_k, iou_threshold)
+        image_detections = tf.concat([
+                            tf.gather(image_boxes, selected_indices),
+                            tf.gather(image_classes, selected_indices)],
+                            axis=-1)
+        num_detections = tf.shape(selected_indices)[0]
+        image_detections = tf.pad(image_detections,
+                                  [[0, keep_top_k - num_detections], [0, 0]])
+        image_detections.set_shape((keep_top_k, 4 + num_classes))
+        return image_detections, num_detections
+
+    return tf.map_fn(detect_image_boxes,
+                     (decoded_boxes, box_classes, image_shapes),
+                     dtype=('float32', 'int32'), back_prop=False)
@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# upper edges in milliseconds of the histogram buckets of every stage,
+# the last bucket counts the timings above the last edge.
+HISTOGRAM_EDGES = [.1, .2, .5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+class _StageContext(object):
+    def __init__(self, timer, stage_name):
+        self.timer = timer
+        self.stage_name = stage_name
+
+    def __enter__(self):
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.timer.record(self.stage_name, time.time() - self.start_time)
+
+
+class _NullContext(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        pass
+
+
+class StageTimer(object):
+    """Records the latency of the stages of the inference path in rolling
+    windows, from which percentiles and histograms are computed.
+
+    Stages are timed with
+        with timer.stage('model'):
+            predictions = model.predict(image_array)
+    and can be recorded from several threads.
+
+    # Arguments
+        window_size: Number of latest timings kept for every stage.
+    """
+    def __init__(self, window_size=1000):
+        self.window_size = window_size
+        self.timings = dict()
+        self.counts = dict()
+        self._lock = threading.Lock()
+
+    def stage(self, stage_name):
+        return _StageContext(self, stage_name)
+
+    def record(self, stage_name, elapsed_time):
+        """Adds an elapsed time in seconds to the window of a stage."""
+        with self._lock:
+            if stage_name not in self.timings:
+                self.timings[stage_name] = deque(maxlen=self.window_size)
+                self.counts[stage_name] = 0
+            self.timings[stage_name].append(elapsed_time)
+            self.counts[stage_name] += 1
+
+    def reset(self):
+        with self._lock:
+            self.timings = dict()
+            self.counts = dict()
+
+    def summary(self):
+        """Returns a dictionary with the total count and the mean, p50,
+        p90, p99 and max latency in milliseconds of the rolling window
+        of every stage, and its histogram over HISTOGRAM_EDGES."""
+        with self._lock:
+            timings = dict((stage_name, np.asarray(stage_timings) * 1000)
+                           for stage_name, stage_timings
+                           in self.timings.items())
+            counts = dict(self.counts)
+        summary = dict()
+        for stage_name, stage_timings in timings.items():
+            p50, p90, p99 = np.percentile(stage_timings, [50, 90, 99])
+            histogram = np.bincount(np.searchsorted(HISTOGRAM_EDGES,
+                                                    stage_timings),
+                                    minlength=len(HISTOGRAM_EDGES) + 1)
+            summary[stage_name] = {'count': counts[stage_name],
+                                   'window_count': len(stage_timings),
+                                   'mean': float(np.mean(stage_timings)),
+                                   'p50': float(p50),
+                                   'p90': float(p90),
+                                   'p99': float(p99),
+                                   'max': float(np.max(stage_timings)),
+                                   'histogram': histogram.tolist()}
+        return summary
+
+    def to_json(self, file_path=None):
+        """Returns the summary as a JSON string, also written to file_path
+        if given."""
+        data = {'histogram_edges': HISTOGRAM_EDGES,
+                'stages': self.summary()}
+        json_string = json.dumps(data, indent=2, sort_keys=True)
+        if file_path is not None:
+            with open(file_path, 'w') as json_file:
+                json_file.write(json_string)
+        return json_string
+
+    def __str__(self):
+        lines = ['{:<14} {:>8} {:>9} {:>9} {:>9} {:>9}'.format(
+                 'stage', 'count', 'mean', 'p50', 'p99', 'max [ms]')]
+        for stage_name, stage in sorted(self.summary().items()):
+            lines.append('{:<14} {:>8} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}'
+                         .format(stage_name, stage['count'], stage['mean'],
+                                 stage['p50'], stage['p99'], stage['max']))
+        return '\n'.join(lines)
+
+
+class NullTimer(object):
+    """Timer with the interface of StageTimer that records nothing, used
+    when the instrumentation is disabled."""
+    _context = _NullContext()
+
+    def stage(self, stage_name):
+        return self._context
+
+    def record(self, stage_name, elapsed_time):
+        pass
+
+null_timer = NullTimer()
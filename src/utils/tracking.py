@@ -0,0 +1,258 @@
+import numpy as np
+from .boxes import calculate_pairwise_intersection_over_union
+
+
+def match_boxes(boxes_a, boxes_b, iou_threshold=.3, class_aware=True):
+    """Greedily matches the pairs of boxes with the highest intersection
+    over union above iou_threshold.
+
+    Arguments:
+        boxes_a: numpy array with shape (num_boxes_a, 4 + num_classes).
+        boxes_b: numpy array with shape (num_boxes_b, 4 + num_classes).
+        iou_threshold: Minimum intersection over union of a match.
+        class_aware: Only boxes of the same most probable class are
+        matched.
+
+    Returns:
+        matches: list of (arg_a, arg_b) pairs.
+        ious: numpy array with the intersection over union of every match.
+    """
+    ious = calculate_pairwise_intersection_over_union(boxes_a, boxes_b)
+    if ious.size == 0:
+        return [], np.zeros(0, dtype='float32')
+    if class_aware:
+        class_args_a = np.argmax(boxes_a[:, 4:], axis=1)
+        class_args_b = np.argmax(boxes_b[:, 4:], axis=1)
+        ious[class_args_a[:, None] != class_args_b[None, :]] = 0
+    matches, matched_ious = [], []
+    used_a, used_b = set(), set()
+    for flat_arg in np.argsort(-ious, axis=None):
+        arg_a, arg_b = np.unravel_index(flat_arg, ious.shape)
+        iou = ious[arg_a, arg_b]
+        if iou < iou_threshold:
+            break
+        if arg_a in used_a or arg_b in used_b:
+            continue
+        used_a.add(arg_a)
+        used_b.add(arg_b)
+        matches.append((int(arg_a), int(arg_b)))
+        matched_ious.append(iou)
+    return matches, np.asarray(matched_ious, dtype='float32')
+
+
+def _box_to_state(box):
+    width = box[2] - box[0]
+    height = box[3] - box[1]
+    return np.array([box[0] + width / 2., box[1] + height / 2.,
+                     width * height, width / max(height, 1e-6)])
+
+
+def _state_to_box(state):
+    area = max(state[2], 0.)
+    width = np.sqrt(area * state[3])
+    height = area / max(width, 1e-6)
+    return np.array([state[0] - width / 2., state[1] - height / 2.,
+                     state[0] + width / 2., state[1] + height / 2.])
+
+
+class KalmanBoxFilter(object):
+    """Constant velocity Kalman filter of the center, area and aspect ratio
+    of a box, whose aspect ratio is assumed constant, as in SORT.
+
+    # References
+        https://arxiv.org/abs/1602.00763
+    """
+    # state: center x, center y, area, aspect ratio and the velocities
+    # of the center and area
+    transition = np.eye(7)
+    transition[0, 4] = transition[1, 5] = transition[2, 6] = 1
+    observation = np.eye(4, 7)
+    measurement_noise = np.diag([1., 1., 10., 10.])
+    process_noise = np.diag([1., 1., 1., 1., .01, .01, .0001])
+
+    def __init__(self, box):
+        self.state = np.zeros(7)
+        self.state[:4] = _box_to_state(box)
+        self.covariance = np.diag([10., 10., 10., 10., 1e4, 1e4, 1e4])
+
+    def predict(self):
+        if self.state[2] + self.state[6] <= 0:
+            self.state[6] = 0
+        self.state = np.dot(self.transition, self.state)
+        self.covariance = np.dot(np.dot(self.transition, self.covariance),
+                                 self.transition.T) + self.process_noise
+        return self.box
+
+    def update(self, box):
+        residual = _box_to_state(box) - np.dot(self.observation, self.state)
+        residual_covariance = np.dot(np.dot(self.observation,
+                                            self.covariance),
+                                     self.observation.T)
+        residual_covariance = residual_covariance + self.measurement_noise
+        gain = np.dot(np.dot(self.covariance, self.observation.T),
+                      np.linalg.inv(residual_covariance))
+        self.state = self.state + np.dot(gain, residual)
+        self.covariance = np.dot(np.eye(7) - np.dot(gain, self.observation),
+                                 self.covariance)
+        return self.box
+
+    @property
+    def box(self):
+        return _state_to_box(self.state)
+
+
+class Track(object):
+    def __init__(self, track_id, box, use_kalman=True):
+        self.track_id = track_id
+        self.box = np.array(box, dtype='float32')
+        self.filter = None
+        if use_kalman:
+            self.filter = KalmanBoxFilter(box)
+        self.num_hits = 1
+        self.num_misses = 0
+
+    def predict(self):
+        if self.filter is not None:
+            self.box[:4] = self.filter.predict()
+
+    def update(self, box):
+        self.box = np.array(box, dtype='float32')
+        if self.filter is not None:
+            self.filter.update(box)
+        self.num_hits = self.num_hits + 1
+        self.num_misses = 0
+
+
+class BoxTracker(object):
+    """Assigns stable track ids to detected boxes and propagates them
+    between the frames in which the detector is not run.
+
+    predict is called once on every frame and update with the detections
+    of the frames in which the detector runs. Boxes are rows of
+    (x_min, y_min, x_max, y_max, class probabilities...) as returned by
+    utils.inference.predict.
+
+    # Arguments
+        iou_threshold: Minimum intersection over union between a track
+            and a detection to be matched.
+        max_misses: Number of consecutive detections in which a track is
+            not matched before it is removed.
+        use_kalman: Propagates the boxes with a KalmanBoxFilter, else the
+            boxes are kept at their last detection.
+        class_aware: Only matches detections of the class of the track.
+    """
+    def __init__(self, iou_threshold=.3, max_misses=1, use_kalman=True,
+                 class_aware=True):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.use_kalman = use_kalman
+        self.class_aware = class_aware
+        self.tracks = []
+        self.agreement = None
+        self._next_track_id = 0
+
+    def predict(self):
+        """Propagates the tracks to the next frame and returns their boxes
+        and track ids."""
+        for track in self.tracks:
+            track.predict()
+        return self.boxes, self.track_ids
+
+    def update(self, boxes):
+        """Matches the detected boxes of the current frame with the
+        tracks and returns the boxes and track ids of the tracks.
+
+        The agreement of the propagated tracks with the detections, the
+        sum of the intersection over union of the matches divided by the
+        number of tracks or detections, is kept in agreement."""
+        if boxes is None:
+            boxes = np.zeros((0, 4 + 1), dtype='float32')
+        matches, ious = match_boxes(self.boxes, boxes, self.iou_threshold,
+                                    self.class_aware)
+        num_boxes = max(len(self.tracks), len(boxes))
+        self.agreement = 1.
+        if num_boxes > 0:
+            self.agreement = float(np.sum(ious)) / num_boxes
+        matched_track_args = set()
+        matched_box_args = set()
+        for track_arg, box_arg in matches:
+            self.tracks[track_arg].update(boxes[box_arg])
+            matched_track_args.add(track_arg)
+            matched_box_args.add(box_arg)
+        tracks = []
+        for track_arg, track in enumerate(self.tracks):
+            if track_arg not in matched_track_args:
+                track.num_misses = track.num_misses + 1
+                if track.num_misses > self.max_misses:
+                    continue
+            tracks.append(track)
+        for box_arg, box in enumerate(boxes):
+            if box_arg not in matched_box_args:
+                tracks.append(Track(self._next_track_id, box,
+                                    self.use_kalman))
+                self._next_track_id = self._next_track_id + 1
+        self.tracks = tracks
+        return self.boxes, self.track_ids
+
+    @property
+    def boxes(self):
+        if len(self.tracks) == 0:
+            return np.zeros((0, 4 + 1), dtype='float32')
+        return np.array([track.box for track in self.tracks])
+
+    @property
+    def track_ids(self):
+        return np.array([track.track_id for track in self.tracks],
+                        dtype='int64')
+
+
+class DetectionScheduler(object):
+    """Decides in which frames the detector runs, every stride frames or,
+    if adaptive, with a stride that grows while the tracks agree with
+    the detections and shrinks when they do not.
+
+    # Arguments
+        stride: Number of frames between detections, the initial one if
+            adaptive.
+        adaptive: Adapts the stride to the agreement of the tracker.
+        min_stride: Minimum adaptive stride.
+        max_stride: Maximum adaptive stride.
+        low_agreement: The stride is halved below this agreement.
+        high_agreement: The stride is increased by one above this
+            agreement.
+    """
+    def __init__(self, stride=5, adaptive=False, min_stride=1,
+                 max_stride=15, low_agreement=.5, high_agreement=.8):
+        self.stride = stride
+        self.adaptive = adaptive
+        self.min_stride = min_stride
+        self.max_stride = max_stride
+        self.low_agreement = low_agreement
+        self.high_agreement = high_agreement
+        self.num_frames = 0
+        self.num_detections = 0
+        self._frames_since_detection = None
+
+    def should_detect(self):
+        """Returns True if the detector runs on the next frame."""
+        self.num_frames = self.num_frames + 1
+        if (self._frames_since_detection is None or
+                self._frames_since_detection + 1 >= self.stride):
+            self._frames_since_detection = 0
+            self.num_detections = self.num_detections + 1
+            return True
+        self._frames_since_detection = self._frames_since_detection + 1
+        return False
+
+    def report_agreement(self, agreement):
+        if not self.adaptive or agreement is None:
+            return
+        if agreement < self.low_agreement:
+            self.stride = max(self.min_stride, self.stride // 2)
+        elif agreement > self.high_agreement:
+            self.stride = min(self.max_stride, self.stride + 1)
+
+    @property
+    def detection_rate(self):
+        """Fraction of the frames in which the detector ran."""
+        return self.num_detections / float(max(self.num_frames, 1))
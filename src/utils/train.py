@@ -5,12 +5,14 @@ class MultiboxLoss(object):
     
     
     def __init__(self, num_classes, alpha=1.0, neg_pos_ratio=3.0,
-                 background_id=0, negatives_for_hard=100.0):
+                 background_id=0, negatives_for_hard=100.0,
+                 sparse_labels=False):
         self.num_classes = num_classes
         self.alpha = alpha
         self.neg_pos_ratio = neg_pos_ratio
         self.background_id = background_id
         self.negatives_for_hard = negatives_for_hard
+        self.sparse_labels = sparse_labels
         
         '''Multibox loss with some helper functions.
         # Arguments
@@ -20,6 +22,10 @@ class MultiboxLoss(object):
         background_label_id: Id of background label.
         negatives_for_hard: Number of negative boxes to consider
             it there is no positive boxes in batch.
+        sparse_labels: If True y_true is expected in the packed sparse
+            format of utils.boxes.pack_sparse_targets, i.e. tensor of
+            shape (?, num_boxes, 5) with the class index in the last
+            channel instead of a one-hot vector.
         # References
         https://arxiv.org/abs/1512.02325'''
         
@@ -59,6 +65,25 @@ class MultiboxLoss(object):
         softmax_loss = - K.sum(y_true * K.log(y_pred), axis=-1)
         return softmax_loss
 
+    def _sparse_softmax_loss(self, y_true, y_pred):
+        
+        """Compute softmax loss from class indices.
+        # Arguments
+            y_true: Ground truth class indices,
+                int tensor of shape (?, num_boxes).
+            y_pred: Predicted logits,
+                tensor of shape (?, num_boxes, num_classes).
+        # Returns
+            softmax_loss: Softmax loss, tensor of shape (?, num_boxes).
+        """
+        num_samples = K.shape(y_true)[0] * K.shape(y_true)[1]
+        flat_indices = (K.arange(0, num_samples) * self.num_classes +
+                                                    K.flatten(y_true))
+        y_pred = K.gather(K.flatten(y_pred), flat_indices)
+        y_pred = K.maximum(K.minimum(y_pred, 1 - 1e-15), 1e-15)
+        softmax_loss = - K.reshape(K.log(y_pred), K.shape(y_true))
+        return softmax_loss
+
     def compute_loss(self, y_true, y_pred):
         """Compute mutlibox loss.
         # Arguments
@@ -68,6 +93,8 @@ class MultiboxLoss(object):
                 y_true[:, :, -8] has 1 if prior should be penalized
                     or in other words is assigned to some ground truth box,
                 y_true[:, :, -7:] are all 0.
+                If sparse_labels is True y_true has shape (?, num_boxes, 5)
+                and y_true[:, :, 4] contains the class index of every prior.
             y_pred: Predicted logits,
                 tensor of shape (?, num_boxes, 4 + num_classes + 8).
         # Returns
@@ -79,14 +106,22 @@ class MultiboxLoss(object):
         y_pred_localization = y_pred[:, :, :4]
         y_true_localization = y_true[:, :, :4]
         y_pred_classification = y_pred[:, :, 4:(4 + self.num_classes)]
-        y_true_classification = y_true[:, :, 4:(4 + self.num_classes)]
 
         localization_loss = self._l1_smooth_loss(y_true_localization,
                                                  y_pred_localization)
-        classification_loss = self._softmax_loss(y_true_classification,
-                                                 y_pred_classification)
+        if self.sparse_labels:
+            y_true_class_args = K.cast(y_true[:, :, 4], 'int32')
+            classification_loss = self._sparse_softmax_loss(
+                                y_true_class_args, y_pred_classification)
+            int_negatives_mask = K.cast(K.equal(y_true_class_args,
+                                        self.background_id), 'float32')
+        else:
+            y_true_classification = y_true[:, :, 4:(4 + self.num_classes)]
+            classification_loss = self._softmax_loss(y_true_classification,
+                                                     y_pred_classification)
+            int_negatives_mask = y_true[:, :, 4 + self.background_id]
 
-        int_positive_mask = 1 - y_true[:, :, 4 + self.background_id]
+        int_positive_mask = 1 - int_negatives_mask
         num_positives = tf.reduce_sum(int_positive_mask, axis=-1)
         positive_localization_losses = (localization_loss * int_positive_mask)
         positive_classification_losses = (classification_loss *
@@ -108,7 +143,6 @@ class MultiboxLoss(object):
         num_neg_batch = tf.to_int32(num_neg_batch)
 
         pred_class_values = K.max(y_pred_classification[:, :, 1:], axis=2)
-        int_negatives_mask = y_true[:, :, 4 + self.background_id]
         pred_negative_class_values = pred_class_values * int_negatives_mask
         top_k_negative_indices = tf.nn.top_k(pred_negative_class_values,
                                                     k=num_neg_batch)[1]
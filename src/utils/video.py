@@ -0,0 +1,322 @@
+import json
+import threading
+from collections import deque
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+import numpy as np
+from .preprocessing import allocate_image_batch
+from .preprocessing import preprocess_image_into
+
+# policies of the bounded queues between the stages of a video pipeline:
+# 'latest' drops the oldest frame of a full queue so that the newest frame
+# is always processed, 'block' waits for space and keeps every frame.
+DROP_POLICIES = ('latest', 'block')
+
+
+def put_frame(frame_queue, item, drop_policy='latest', stop_event=None):
+    """Puts item in a bounded frame_queue following drop_policy.
+
+    Returns the number of frames dropped to make space, or None if
+    stop_event was set while waiting for space.
+    """
+    if drop_policy == 'latest':
+        num_dropped = 0
+        while True:
+            try:
+                frame_queue.put_nowait(item)
+                return num_dropped
+            except queue.Full:
+                try:
+                    frame_queue.get_nowait()
+                    num_dropped = num_dropped + 1
+                except queue.Empty:
+                    pass
+    while stop_event is None or not stop_event.is_set():
+        try:
+            frame_queue.put(item, timeout=.1)
+            return 0
+        except queue.Full:
+            pass
+    return None
+
+
+def read_timestamp(camera, frame_index, frames_per_second=None):
+    """Returns the timestamp in seconds of the frame last read from
+    camera, computed from frame_index and frames_per_second when the
+    capture does not report positions, e.g. for some devices and streams.
+    """
+    timestamp = camera.get(cv2.CAP_PROP_POS_MSEC) / 1000.
+    if timestamp <= 0 and frames_per_second is not None:
+        timestamp = frame_index / frames_per_second
+    return timestamp
+
+
+def read_frames_per_second(camera):
+    """Returns the frame rate of camera or None if it is unknown."""
+    frames_per_second = camera.get(cv2.CAP_PROP_FPS)
+    if frames_per_second > 0:
+        return frames_per_second
+    return None
+
+
+class FrameDecoder(object):
+    """Decodes and preprocesses the frames of a video file in a background
+    thread and yields them in batches ready for the model.
+
+    Every batch is a tuple (frame_indices, timestamps, image_arrays,
+    original_image_shapes) where timestamps are in seconds. The
+    image_arrays are views of a ring of preallocated buffers that is
+    reused once the next batches have been requested.
+
+    # Arguments
+        video_path: Path of the video file, or a device index.
+        input_size: (height, width) of the model input.
+        batch_size: Maximum number of frames per batch.
+        queue_size: Number of decoded batches waiting for the model.
+    """
+    def __init__(self, video_path, input_size, batch_size=16, queue_size=2):
+        self.video_path = video_path
+        self.input_size = input_size
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.num_frames = 0
+        self.frames_per_second = None
+
+    def _decode(self, batches, stop_event):
+        self.num_frames = 0
+        camera = None
+        try:
+            camera = cv2.VideoCapture(self.video_path)
+            self.frames_per_second = read_frames_per_second(camera)
+            buffers = [allocate_image_batch(self.batch_size, self.input_size)
+                       for buffer_arg in range(self.queue_size + 2)]
+            buffer_arg = 0
+            grabbed = True
+            while grabbed and not stop_event.is_set():
+                image_arrays = buffers[buffer_arg]
+                buffer_arg = (buffer_arg + 1) % len(buffers)
+                frame_indices, timestamps, original_image_shapes = [], [], []
+                while len(frame_indices) < self.batch_size:
+                    grabbed, frame = camera.read()
+                    if not grabbed:
+                        break
+                    timestamp = read_timestamp(camera, self.num_frames,
+                                               self.frames_per_second)
+                    preprocess_image_into(
+                            frame, image_arrays[len(frame_indices)], True)
+                    frame_indices.append(self.num_frames)
+                    timestamps.append(timestamp)
+                    original_image_shapes.append(frame.shape[0:2])
+                    self.num_frames = self.num_frames + 1
+                if len(frame_indices) > 0:
+                    batch = (np.asarray(frame_indices),
+                             np.asarray(timestamps),
+                             image_arrays[:len(frame_indices)],
+                             original_image_shapes)
+                    if put_frame(batches, batch, 'block',
+                                 stop_event) is None:
+                        return
+            put_frame(batches, None, 'block', stop_event)
+        except Exception as error:
+            put_frame(batches, error, 'block', stop_event)
+        finally:
+            if camera is not None:
+                camera.release()
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.queue_size)
+        # set when the consumer stops early, so that the decoding thread
+        # does not wait forever for space in batches
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self._decode,
+                                  args=(batches, stop_event))
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop_event.set()
+            thread.join()
+
+
+class DetectionWriter(object):
+    """Writes the detections of consecutive frames of a video in a
+    columnar format, either as JSON lines with one frame per line or as
+    compressed npz shards of frames_per_shard frames.
+
+    Every npz shard contains the arrays frame_indices, timestamps, the
+    offsets of the boxes of every frame, the boxes as
+    (x_min, y_min, x_max, y_max) in pixels, their classes and scores,
+    the boxes of frame i being boxes[offsets[i]:offsets[i + 1]].
+
+    # Arguments
+        output_prefix: Path of the output files without extension.
+        output_format: 'npz' or 'jsonl'.
+        frames_per_shard: Number of frames of every npz shard.
+    """
+    def __init__(self, output_prefix, output_format='npz',
+                 frames_per_shard=10000):
+        if output_format not in ('npz', 'jsonl'):
+            raise ValueError('Invalid output format: {}'.format(
+                                                        output_format))
+        self.output_prefix = output_prefix
+        self.output_format = output_format
+        self.frames_per_shard = frames_per_shard
+        self.filenames = []
+        self._json_file = None
+        self._reset_shard()
+
+    def _reset_shard(self):
+        self._frame_indices = []
+        self._timestamps = []
+        self._num_boxes = []
+        self._boxes = []
+
+    def write(self, frame_indices, timestamps, boxes, offsets):
+        """Writes the ragged detections of a batch of frames as returned
+        by utils.inference.detect_boxes_batch."""
+        for frame_arg, (frame_index, timestamp) in enumerate(
+                                        zip(frame_indices, timestamps)):
+            frame_boxes = boxes[offsets[frame_arg]:offsets[frame_arg + 1]]
+            if self.output_format == 'jsonl':
+                self._write_line(frame_index, timestamp, frame_boxes)
+                continue
+            self._frame_indices.append(frame_index)
+            self._timestamps.append(timestamp)
+            self._num_boxes.append(len(frame_boxes))
+            self._boxes.append(frame_boxes)
+            if len(self._frame_indices) == self.frames_per_shard:
+                self._write_shard()
+
+    def _write_line(self, frame_index, timestamp, boxes):
+        if self._json_file is None:
+            filename = self.output_prefix + '.jsonl'
+            self._json_file = open(filename, 'w')
+            self.filenames.append(filename)
+        class_args = np.argmax(boxes[:, 4:], axis=1)
+        scores = boxes[np.arange(len(boxes)), 4 + class_args]
+        self._json_file.write(json.dumps({
+                'frame': int(frame_index), 'timestamp': float(timestamp),
+                'boxes': np.round(boxes[:, :4], 1).tolist(),
+                'classes': class_args.tolist(),
+                'scores': np.round(scores, 4).tolist()}) + '\n')
+
+    def _write_shard(self):
+        if len(self._frame_indices) == 0:
+            return
+        boxes = np.concatenate(self._boxes, axis=0)
+        class_args = np.argmax(boxes[:, 4:], axis=1)
+        filename = '{}_{:05d}.npz'.format(self.output_prefix,
+                                          len(self.filenames))
+        np.savez_compressed(filename,
+                frame_indices=np.asarray(self._frame_indices, 'int64'),
+                timestamps=np.asarray(self._timestamps, 'float64'),
+                offsets=np.concatenate([[0], np.cumsum(self._num_boxes)]),
+                boxes=boxes[:, :4].astype('float32'),
+                classes=class_args.astype('int16'),
+                scores=boxes[np.arange(len(boxes)),
+                             4 + class_args].astype('float32'))
+        self.filenames.append(filename)
+        self._reset_shard()
+
+    def close(self):
+        if self.output_format == 'jsonl':
+            if self._json_file is not None:
+                self._json_file.close()
+                self._json_file = None
+        else:
+            self._write_shard()
+
+
+class MotionGate(object):
+    """Decides whether a frame has changed enough since the last frame
+    passed to the detector for the detector to run on it.
+
+    The change score is the mean absolute difference of grayscale
+    versions of both frames, subsampled to about downsampled_size and
+    scaled to [0, 1]. Frames are gated, i.e. the previous detections are
+    reused, while their score is below threshold and less than
+    max_stale_frames frames have been gated in a row.
+
+    # Arguments
+        threshold: Minimum change score for which the detector runs.
+        max_stale_frames: Maximum number of consecutive gated frames.
+        downsampled_size: (height, width) of the compared frames.
+        window_size: Number of latest scores kept to tune threshold.
+    """
+    def __init__(self, threshold=.02, max_stale_frames=30,
+                 downsampled_size=(36, 64), window_size=1000):
+        self.threshold = threshold
+        self.max_stale_frames = max_stale_frames
+        self.downsampled_size = downsampled_size
+        self.scores = deque(maxlen=window_size)
+        self.reset()
+
+    def reset(self):
+        self.num_frames = 0
+        self.num_gated = 0
+        self.num_stale = 0
+        self._stale_frames = 0
+        self._reference = None
+
+    def _downsample(self, frame):
+        row_step = max(1, frame.shape[0] // self.downsampled_size[0])
+        column_step = max(1, frame.shape[1] // self.downsampled_size[1])
+        frame = frame[::row_step, ::column_step]
+        if frame.ndim == 3:
+            frame = frame.mean(axis=2, dtype='float32')
+        return frame.astype('float32')
+
+    def should_run(self, frame):
+        """Returns True if the detector has to run on frame."""
+        self.num_frames = self.num_frames + 1
+        downsampled_frame = self._downsample(frame)
+        if (self._reference is None or
+                self._reference.shape != downsampled_frame.shape):
+            self._reference = downsampled_frame
+            self._stale_frames = 0
+            return True
+        score = float(np.mean(np.abs(downsampled_frame -
+                                     self._reference))) / 255.
+        self.scores.append(score)
+        if score < self.threshold:
+            if self._stale_frames < self.max_stale_frames:
+                self._stale_frames = self._stale_frames + 1
+                self.num_gated = self.num_gated + 1
+                return False
+            self.num_stale = self.num_stale + 1
+        self._reference = downsampled_frame
+        self._stale_frames = 0
+        return True
+
+    @property
+    def hit_rate(self):
+        """Fraction of the frames whose detections were reused."""
+        return self.num_gated / float(max(self.num_frames, 1))
+
+    def summary(self):
+        """Returns the gate hit rate, the fraction of the frames run only
+        because of max_stale_frames and the percentiles of the scores."""
+        summary = {'frames': self.num_frames,
+                   'hit_rate': self.hit_rate,
+                   'stale_rate': self.num_stale /
+                                 float(max(self.num_frames, 1))}
+        if len(self.scores) > 0:
+            percentiles = np.percentile(self.scores, [10, 50, 90, 99])
+            for percentile, score in zip([10, 50, 90, 99], percentiles):
+                summary['score_p{}'.format(percentile)] = float(score)
+        return summary
@@ -1,22 +1,51 @@
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 import matplotlib.pyplot as plt
 import numpy as np
+import tensorflow as tf
 import cv2
 
 from utils.datasets import get_class_names
 from utils.inference import predict
+from utils.boxes import calculate_box_centers
 from utils.visualizer import draw_video_boxes
+from utils.timing import null_timer
+from utils.tracking import BoxTracker
+from utils.tracking import DetectionScheduler
+from utils.video import DROP_POLICIES
+from utils.video import MotionGate
+from utils.video import put_frame
+
 
 class VideoTest(object):
     def __init__(self, prior_boxes, dataset_name='VOC2007',
             box_scale_factors=[.1, .1, .2, .2],
             background_index=0, lower_probability_threshold=.1,
-            iou_threshold=.2, class_names=None):
+            iou_threshold=.2, class_names=None, pre_nms_top_k=None,
+            keep_top_k=100, soft_nms=False, timer=None, motion_gate=None):
 
         self.prior_boxes = prior_boxes
+        self.prior_box_centers = calculate_box_centers(prior_boxes)
         self.box_scale_factors = box_scale_factors
         self.background_index = background_index
         self.iou_threshold = iou_threshold
         self.lower_probability_threshold = lower_probability_threshold
+        self.pre_nms_top_k = pre_nms_top_k
+        self.keep_top_k = keep_top_k
+        self.soft_nms = soft_nms
+        # optional utils.timing.StageTimer of the video loop
+        self.timer = timer
+        if self.timer is None:
+            self.timer = null_timer
+        # optional utils.video.MotionGate, reuses the last detections for
+        # frames that did not change
+        self.motion_gate = motion_gate
+        self._gated_boxes = None
         self.class_names = class_names
         if self.class_names is None:
             self.class_names = get_class_names(dataset_name)
@@ -27,39 +56,261 @@ class VideoTest(object):
                                                 self.class_names))
         self.font = cv2.FONT_HERSHEY_SIMPLEX
 
-    def start_video(self, model):
-        camera = cv2.VideoCapture(0)
-        while True:
-            frame = camera.read()[1]
-            if frame is None:
-                continue
-            image_array = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            selected_boxes = predict(model, image_array, prior_boxes,
-                                    frame.shape[0:2], self.num_classes,
-                                    self.lower_probability_threshold,
-                                    self.iou_threshold,
-                                    self.background_index,
-                                    self.box_scale_factors)
-            if selected_boxes is None:
-                continue
-            draw_video_boxes(selected_boxes, frame, self.arg_to_class,
-                                        self.colors, self.font)
-
-            cv2.imshow('webcam', frame)
-            if cv2.waitKey(1)&0xFF == ord('q'):
-                break
+    def _predict(self, model, frame):
+        if self.motion_gate is not None:
+            with self.timer.stage('gate'):
+                run_detector = self.motion_gate.should_run(frame)
+            if not run_detector:
+                return self._gated_boxes
+        selected_boxes = predict(model, frame, self.prior_boxes,
+                                 frame.shape[0:2], self.num_classes,
+                                 self.lower_probability_threshold,
+                                 self.iou_threshold, self.background_index,
+                                 self.box_scale_factors, self.pre_nms_top_k,
+                                 self.keep_top_k, self.soft_nms,
+                                 prior_box_centers=self.prior_box_centers,
+                                 bgr=True, timer=self.timer)
+        self._gated_boxes = selected_boxes
+        return selected_boxes
+
+    def _release(self, camera):
         camera.release()
         cv2.destroyAllWindows()
+        if self.motion_gate is not None:
+            summary = self.motion_gate.summary()
+            print('Motion gate reused the detections of {:.1%} of {} '
+                  'frames, {:.1%} run for staleness'.format(
+                      summary['hit_rate'], summary['frames'],
+                      summary['stale_rate']))
+
+    def start_video(self, model, video_source=0):
+        camera = cv2.VideoCapture(video_source)
+        while True:
+            frame_start_time = time.time()
+            with self.timer.stage('capture'):
+                grabbed, frame = camera.read()
+            if not grabbed:
+                # end of a video file
+                break
+            selected_boxes = self._predict(model, frame)
+            if selected_boxes is not None:
+                with self.timer.stage('draw'):
+                    draw_video_boxes(selected_boxes, frame,
+                                     self.arg_to_class, self.colors,
+                                     self.font)
+
+            with self.timer.stage('display'):
+                cv2.imshow('webcam', frame)
+                key = cv2.waitKey(1)
+            self.timer.record('frame', time.time() - frame_start_time)
+            if key&0xFF == ord('q'):
+                break
+        self._release(camera)
+
+    def start_tracked_video(self, model, video_source=0, detection_stride=5,
+                            adaptive=False, tracker=None):
+        """Runs the detector every detection_stride frames, or with an
+        adaptive stride, and propagates the boxes in between with a
+        tracker that assigns them stable track ids. The effective frame
+        rate of the detector is kept in detector_frame_rate.
+
+        # Arguments
+            model: SSD model.
+            video_source: Device index or path of a video file.
+            detection_stride: Number of frames between detections.
+            adaptive: Adapts the stride to the agreement of the tracks
+                with the detections, see utils.tracking.DetectionScheduler.
+            tracker: utils.tracking.BoxTracker, a Kalman tracker if None.
+        """
+        if tracker is None:
+            tracker = BoxTracker()
+        scheduler = DetectionScheduler(detection_stride, adaptive)
+        camera = cv2.VideoCapture(video_source)
+        start_time = time.time()
+        while True:
+            frame_start_time = time.time()
+            with self.timer.stage('capture'):
+                grabbed, frame = camera.read()
+            if not grabbed:
+                break
+            with self.timer.stage('track'):
+                boxes, track_ids = tracker.predict()
+            if scheduler.should_detect():
+                selected_boxes = self._predict(model, frame)
+                with self.timer.stage('track'):
+                    boxes, track_ids = tracker.update(selected_boxes)
+                scheduler.report_agreement(tracker.agreement)
+            with self.timer.stage('draw'):
+                draw_video_boxes(boxes, frame, self.arg_to_class,
+                                 self.colors, self.font)
+                for box, track_id in zip(boxes, track_ids):
+                    cv2.putText(frame, str(track_id),
+                                (int(box[0]), int(box[3]) - 5), self.font,
+                                .7, (255, 255, 255), 1, cv2.LINE_AA)
+            with self.timer.stage('display'):
+                cv2.imshow('webcam', frame)
+                key = cv2.waitKey(1)
+            self.timer.record('frame', time.time() - frame_start_time)
+            if key & 0xFF == ord('q'):
+                break
+        self.detection_rate = scheduler.detection_rate
+        self.detector_frame_rate = (scheduler.num_detections /
+                                    max(time.time() - start_time, 1e-9))
+        print('Detector ran on {:.1%} of {} frames, {:.1f} frames/s'.format(
+              self.detection_rate, scheduler.num_frames,
+              self.detector_frame_rate))
+        self._release(camera)
+
+    def _put(self, stage_queue, item, stage_name, drop_policy=None):
+        """Puts item in a bounded stage queue following the drop policy,
+        returns False if the pipeline was stopped while waiting."""
+        if drop_policy is None:
+            drop_policy = self.drop_policy
+        num_dropped = put_frame(stage_queue, item, drop_policy,
+                                self._stop_event)
+        if num_dropped is None:
+            return False
+        self.dropped_frames[stage_name] += num_dropped
+        return True
+
+    def _get(self, stage_queue):
+        """Returns the next item of a stage queue, None once the pipeline
+        is stopped."""
+        while not self._stop_event.is_set():
+            try:
+                return stage_queue.get(timeout=.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def _capture(self, camera, frame_queue):
+        try:
+            while not self._stop_event.is_set():
+                with self.timer.stage('capture'):
+                    grabbed, frame = camera.read()
+                if not grabbed:
+                    break
+                if not self._put(frame_queue, (time.time(), frame),
+                                 'capture'):
+                    break
+        finally:
+            # the end of the stream, or an error, is passed downstream
+            self._put(frame_queue, None, 'capture', 'block')
+
+    def _infer(self, model, graph, frame_queue, render_queue):
+        try:
+            while True:
+                item = self._get(frame_queue)
+                if item is None:
+                    break
+                capture_time, frame = item
+                with graph.as_default():
+                    selected_boxes = self._predict(model, frame)
+                if not self._put(render_queue,
+                                 (capture_time, frame, selected_boxes),
+                                 'inference'):
+                    break
+        finally:
+            self._put(render_queue, None, 'inference', 'block')
+
+    def start_pipelined_video(self, model, video_source=0, queue_size=1,
+                              drop_policy='latest'):
+        """Runs the video with capture, inference and rendering in
+        separate stages connected by bounded queues, so that the camera
+        is read while the model runs. With the 'latest' drop_policy the
+        end-to-end latency stays bounded when inference is slower than
+        the camera; the frames dropped by every stage are counted in
+        dropped_frames.
+
+        # Arguments
+            model: SSD model, called from the inference thread.
+            video_source: Device index or path of a video file.
+            queue_size: Maximum number of frames waiting between stages.
+            drop_policy: One of DROP_POLICIES.
+        """
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError('Invalid drop policy: {}'.format(drop_policy))
+        self.drop_policy = drop_policy
+        self.dropped_frames = {'capture': 0, 'inference': 0}
+        self._stop_event = threading.Event()
+        frame_queue = queue.Queue(maxsize=queue_size)
+        render_queue = queue.Queue(maxsize=queue_size)
+        camera = cv2.VideoCapture(video_source)
+        # the model is called from the inference thread
+        model._make_predict_function()
+        graph = tf.get_default_graph()
+        threads = [threading.Thread(target=self._capture,
+                                    args=(camera, frame_queue)),
+                   threading.Thread(target=self._infer,
+                                    args=(model, graph, frame_queue,
+                                          render_queue))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # rendering stays in the main thread for the GUI
+        while True:
+            item = self._get(render_queue)
+            if item is None:
+                break
+            capture_time, frame, selected_boxes = item
+            if selected_boxes is not None:
+                with self.timer.stage('draw'):
+                    draw_video_boxes(selected_boxes, frame,
+                                     self.arg_to_class, self.colors,
+                                     self.font)
+            with self.timer.stage('display'):
+                cv2.imshow('webcam', frame)
+                key = cv2.waitKey(1)
+            self.timer.record('latency', time.time() - capture_time)
+            if key & 0xFF == ord('q'):
+                break
+        self._stop_event.set()
+        for thread in threads:
+            thread.join()
+        self._release(camera)
 
 if __name__ == "__main__":
+    import argparse
     from models.ssd import SSD300
-    from utils.boxes import create_prior_boxes
+    from utils.prior_boxes import load_prior_box_set
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pipelined', action='store_true',
+                        help='capture, infer and render in separate stages')
+    parser.add_argument('--video_source', default='0',
+                        help='device index or video file')
+    parser.add_argument('--drop_policy', default='latest',
+                        choices=DROP_POLICIES)
+    parser.add_argument('--detection_stride', type=int, default=None,
+                        help='run the detector every N frames and track '
+                        'the boxes in between')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='adapt the detection stride to the tracker')
+    parser.add_argument('--motion_threshold', type=float, default=None,
+                        help='reuse the detections of frames whose change '
+                        'score is below this threshold')
+    parser.add_argument('--max_stale_frames', type=int, default=30)
+    args = parser.parse_args()
     num_classes = 21
     dataset_name = 'VOC2007'
     weights_filename = '../trained_models/weights_SSD300.hdf5'
     model = SSD300(num_classes=num_classes)
-    prior_boxes = create_prior_boxes(model)
+    prior_boxes = load_prior_box_set(model).boxes
     model.load_weights(weights_filename)
-    video = VideoTest(prior_boxes, dataset_name)
-    video.start_video(model)
+    motion_gate = None
+    if args.motion_threshold is not None:
+        motion_gate = MotionGate(args.motion_threshold,
+                                 args.max_stale_frames)
+    video = VideoTest(prior_boxes, dataset_name, motion_gate=motion_gate)
+    video_source = args.video_source
+    if video_source.isdigit():
+        video_source = int(video_source)
+    if args.detection_stride is not None or args.adaptive:
+        video.start_tracked_video(model, video_source,
+                                  args.detection_stride or 5, args.adaptive)
+    elif args.pipelined:
+        video.start_pipelined_video(model, video_source,
+                                    drop_policy=args.drop_policy)
+    else:
+        video.start_video(model, video_source)
 
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+# the modules of src are imported as in the scripts run from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+                                    os.path.abspath(__file__))), 'src'))
+
+from utils import synthetic  # noqa: E402
+from utils.boxes import create_prior_boxes_from_configurations  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def model_configurations():
+    """The PriorBox layer parameters of SSD300 as returned by
+    load_model_configurations."""
+    return synthetic.make_model_configurations()
+
+
+@pytest.fixture(scope='session')
+def prior_boxes(model_configurations):
+    """The 7308 prior boxes of SSD300 as returned by create_prior_boxes."""
+    return create_prior_boxes_from_configurations(model_configurations,
+                                                  (300, 300))
+
+
+@pytest.fixture(scope='session')
+def make_ground_truth():
+    """Factory of normalized ground truth boxes with one-hot classes."""
+    return synthetic.make_ground_truth
+
+
+@pytest.fixture(scope='session')
+def make_predictions():
+    """Factory of model outputs for the given prior boxes."""
+    return synthetic.make_predictions
+
+
+@pytest.fixture(scope='session')
+def make_detections():
+    """Factory of denormalized detections clustered around a few
+    objects."""
+    return synthetic.make_detections
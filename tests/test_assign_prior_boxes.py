@@ -0,0 +1,99 @@
+import numpy as np
+
+from utils.boxes import PriorBoxIndex
+from utils.boxes import assign_prior_boxes
+from utils.boxes import assign_prior_boxes_batch
+from utils.boxes import assign_prior_boxes_to_ground_truth
+from utils.boxes import pad_ground_truth_data
+
+BOX_SCALE_FACTORS = [.1, .1, .2, .2]
+
+
+def legacy_assign_prior_boxes(prior_boxes, ground_truth_data, num_classes,
+                              box_scale_factors, overlap_threshold=.5):
+    """The per-image float64 encoder that assign_prior_boxes replaced."""
+    assignments = np.zeros((len(prior_boxes), 4 + num_classes))
+    assignments[:, 4] = 1.0
+    if len(ground_truth_data) == 0:
+        return assignments
+    encoded_boxes = np.apply_along_axis(assign_prior_boxes_to_ground_truth,
+                                        1, ground_truth_data[:, :4],
+                                        prior_boxes, box_scale_factors,
+                                        True, overlap_threshold)
+    encoded_boxes = encoded_boxes.reshape(-1, len(prior_boxes), 5)
+    best_iou = encoded_boxes[:, :, -1].max(axis=0)
+    best_iou_indices = encoded_boxes[:, :, -1].argmax(axis=0)
+    best_iou_mask = best_iou > 0
+    best_iou_indices = best_iou_indices[best_iou_mask]
+    encoded_boxes = encoded_boxes[:, best_iou_mask, :]
+    assignments[best_iou_mask, :4] = encoded_boxes[best_iou_indices,
+                                    np.arange(len(best_iou_indices)), :4]
+    assignments[:, 4][best_iou_mask] = 0
+    assignments[:, 5:][best_iou_mask] = ground_truth_data[
+                                                    best_iou_indices, 5:]
+    return assignments
+
+
+def test_assign_prior_boxes_equals_legacy(prior_boxes, make_ground_truth):
+    for seed in range(200):
+        random_state = np.random.RandomState(seed)
+        ground_truth_data = make_ground_truth(random_state.randint(1, 10),
+                                              random_state=random_state)
+        expected = legacy_assign_prior_boxes(prior_boxes, ground_truth_data,
+                                             21, BOX_SCALE_FACTORS)
+        assignments = assign_prior_boxes(prior_boxes, ground_truth_data, 21,
+                                         BOX_SCALE_FACTORS)
+        np.testing.assert_array_equal(assignments[:, 4:], expected[:, 4:])
+        np.testing.assert_allclose(assignments[:, :4], expected[:, :4],
+                                   atol=1e-5)
+
+
+def test_assign_prior_boxes_batch_equals_per_image(prior_boxes,
+                                                   make_ground_truth):
+    random_state = np.random.RandomState(0)
+    ground_truth_data = [make_ground_truth(num_objects,
+                                           random_state=random_state)
+                         for num_objects in [3, 1, 0, 7]]
+    padded_data, object_mask = pad_ground_truth_data(ground_truth_data)
+    assignments = assign_prior_boxes_batch(prior_boxes, padded_data,
+                                           object_mask, 21,
+                                           BOX_SCALE_FACTORS)
+    for sample, sample_assignments in zip(ground_truth_data, assignments):
+        expected = legacy_assign_prior_boxes(prior_boxes,
+                                             np.reshape(sample, (-1, 25)),
+                                             21, BOX_SCALE_FACTORS)
+        np.testing.assert_array_equal(sample_assignments[:, 4:],
+                                      expected[:, 4:])
+        np.testing.assert_allclose(sample_assignments[:, :4],
+                                   expected[:, :4], atol=1e-5)
+
+
+def make_threshold_ground_truth(prior_boxes, random_state):
+    """Boxes covering half of random prior boxes, so that their overlap with
+    them is .5 up to the rounding of the coordinates."""
+    prior_args = random_state.choice(len(prior_boxes), 8, replace=False)
+    x_min, y_min, x_max, y_max = prior_boxes[prior_args, :4].T
+    offsets = random_state.choice([-2e-9, -1e-9, 0, 1e-9, 2e-9], 8)
+    boxes = np.stack([x_min, y_min, x_min + (x_max - x_min) * .5 + offsets,
+                      y_max], axis=1)
+    classes = np.eye(21)[random_state.randint(1, 21, len(boxes))]
+    return np.concatenate([boxes, classes], axis=1)
+
+
+def test_assign_prior_boxes_at_threshold_equals_legacy(model_configurations,
+                                                       prior_boxes):
+    prior_box_index = PriorBoxIndex(model_configurations, (300, 300))
+    for seed in range(50):
+        random_state = np.random.RandomState(seed)
+        ground_truth_data = make_threshold_ground_truth(prior_boxes,
+                                                        random_state)
+        expected = legacy_assign_prior_boxes(prior_boxes, ground_truth_data,
+                                             21, BOX_SCALE_FACTORS)
+        assignments = assign_prior_boxes(prior_boxes, ground_truth_data, 21,
+                                         BOX_SCALE_FACTORS)
+        np.testing.assert_array_equal(assignments[:, 4:], expected[:, 4:])
+        padded_data, object_mask = pad_ground_truth_data([ground_truth_data])
+        assignments = assign_prior_boxes_batch(
+                        prior_boxes, padded_data, object_mask, 21,
+                        BOX_SCALE_FACTORS, prior_box_index=prior_box_index)
+        np.testing.assert_array_equal(assignments[0, :, 4:], expected[:, 4:])
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from utils.boxes import apply_non_max_suppression
+from utils.boxes import apply_non_max_suppression_batch
+from utils.boxes import decode_and_filter_boxes
+from utils.boxes import decode_and_filter_boxes_batch
+from utils.boxes import denormalize_box
+from utils.boxes import denormalize_box_batch
+from utils.boxes import select_top_k_boxes
+from utils.boxes import select_top_k_boxes_batch
+from utils.boxes import split_boxes_batch
+
+BOX_SCALE_FACTORS = [.1, .1, .2, .2]
+NUM_CLASSES = 21
+
+
+def make_ragged_predictions(make_predictions, prior_boxes, seed):
+    """Batch of predictions with a different number of boxes passing the
+    filter in every image, one of them without any."""
+    random_state = np.random.RandomState(seed)
+    predictions = []
+    for image_arg in range(5):
+        image_predictions = make_predictions(prior_boxes, NUM_CLASSES,
+                                             random_state)
+        keep_probability = random_state.uniform(0, .2)
+        if image_arg == 2:
+            keep_probability = 0
+        background_mask = random_state.uniform(
+                        0, 1, len(prior_boxes)) > keep_probability
+        classes = image_predictions[:, 4:(4 + NUM_CLASSES)]
+        classes[background_mask] = 0
+        classes[background_mask, 0] = 1
+        predictions.append(image_predictions)
+    return np.stack(predictions)
+
+
+def sort_rows(boxes):
+    boxes = np.asarray(boxes)
+    if len(boxes) == 0:
+        return boxes
+    return boxes[np.lexsort(boxes.T[::-1])]
+
+
+def decode_batch(prior_boxes, predictions):
+    return decode_and_filter_boxes_batch(predictions, prior_boxes,
+                                         BOX_SCALE_FACTORS, NUM_CLASSES,
+                                         lower_probability_threshold=.1)
+
+
+def decode_images(prior_boxes, predictions):
+    return [decode_and_filter_boxes(image_predictions, prior_boxes,
+                                    BOX_SCALE_FACTORS, NUM_CLASSES,
+                                    lower_probability_threshold=.1)
+            for image_predictions in predictions]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_decode_and_filter_batch_equals_per_image(prior_boxes,
+                                                  make_predictions, seed):
+    predictions = make_ragged_predictions(make_predictions, prior_boxes, seed)
+    boxes, offsets = decode_batch(prior_boxes, predictions)
+    image_boxes = decode_images(prior_boxes, predictions)
+    assert len(np.unique(np.diff(offsets))) > 1
+    assert np.diff(offsets)[2] == 0
+    for batch_image_boxes, expected in zip(
+                    split_boxes_batch(boxes, offsets), image_boxes):
+        np.testing.assert_array_equal(batch_image_boxes, expected)
+
+
+@pytest.mark.parametrize('top_k', [None, 1, 50, 100000])
+def test_select_top_k_batch_equals_per_image(prior_boxes, make_predictions,
+                                             top_k):
+    predictions = make_ragged_predictions(make_predictions, prior_boxes, 0)
+    boxes, offsets = decode_batch(prior_boxes, predictions)
+    selected_boxes, selected_offsets = select_top_k_boxes_batch(
+                                                boxes, offsets, top_k)
+    image_boxes = split_boxes_batch(boxes, offsets)
+    for batch_image_boxes, boxes in zip(
+            split_boxes_batch(selected_boxes, selected_offsets),
+            image_boxes):
+        expected = select_top_k_boxes(boxes, top_k)
+        np.testing.assert_array_equal(sort_rows(batch_image_boxes),
+                                      sort_rows(expected))
+
+
+def test_denormalize_box_batch_equals_per_image(prior_boxes,
+                                                make_predictions):
+    predictions = make_ragged_predictions(make_predictions, prior_boxes, 1)
+    boxes, offsets = decode_batch(prior_boxes, predictions)
+    image_shapes = [(480, 640), (300, 300), (720, 1280), (1, 2), (600, 400)]
+    denormalized_boxes = denormalize_box_batch(boxes, offsets, image_shapes)
+    for batch_image_boxes, boxes, image_shape in zip(
+            split_boxes_batch(denormalized_boxes, offsets),
+            split_boxes_batch(boxes, offsets), image_shapes):
+        np.testing.assert_allclose(batch_image_boxes,
+                                   denormalize_box(boxes, image_shape),
+                                   rtol=1e-6)
+
+
+@pytest.mark.parametrize('class_aware', [True, False])
+@pytest.mark.parametrize('max_output_size', [None, 5])
+@pytest.mark.parametrize('top_k_per_class', [None, 3])
+def test_non_max_suppression_batch_equals_per_image(
+            prior_boxes, make_predictions, class_aware, max_output_size,
+            top_k_per_class):
+    predictions = make_ragged_predictions(make_predictions, prior_boxes, 2)
+    boxes, offsets = decode_batch(prior_boxes, predictions)
+    selected_boxes, selected_offsets = apply_non_max_suppression_batch(
+                    boxes, offsets, .45, max_output_size, class_aware,
+                    top_k_per_class)
+    for batch_image_boxes, boxes in zip(
+            split_boxes_batch(selected_boxes, selected_offsets),
+            split_boxes_batch(boxes, offsets)):
+        expected = apply_non_max_suppression(boxes, .45, max_output_size,
+                                             class_aware, top_k_per_class)
+        if len(expected) == 0:
+            assert len(batch_image_boxes) == 0
+            continue
+        np.testing.assert_array_equal(batch_image_boxes, expected)
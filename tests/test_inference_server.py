@@ -0,0 +1,107 @@
+import json
+import threading
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+pytest.importorskip('keras')
+
+from PIL import Image as pil_image
+
+import inference_server
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+
+class EmptyBatcher(object):
+    def detect(self, image):
+        return np.zeros((0, 4 + 21))
+
+
+class FailingBatcher(object):
+    def detect(self, image):
+        raise RuntimeError('model failed')
+
+
+def serve(batcher):
+    handler = type('Handler', (inference_server.DetectionRequestHandler,),
+                   {'batcher': batcher, 'arg_to_class': dict()})
+    server = inference_server.ThreadedHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = serve(EmptyBatcher())
+    yield server
+    server.shutdown()
+
+
+def encode_image(image_format='PNG'):
+    image_array = np.random.RandomState(0).randint(0, 256, (24, 32, 3))
+    image_file = BytesIO()
+    pil_image.fromarray(image_array.astype('uint8')).save(image_file,
+                                                          image_format)
+    return image_file.getvalue()
+
+
+def post(server, body, headers):
+    connection = HTTPConnection(*server.server_address)
+    connection.putrequest('POST', '/detect')
+    for name, value in headers.items():
+        connection.putheader(name, value)
+    connection.endheaders()
+    if len(body) > 0:
+        connection.send(body)
+    response = connection.getresponse()
+    data = json.loads(response.read().decode('utf-8'))
+    connection.close()
+    return response.status, data
+
+
+def test_valid_image(server):
+    body = encode_image()
+    status, data = post(server, body, {'Content-Length': str(len(body))})
+    assert status == 200
+    assert data == {'detections': []}
+
+
+@pytest.mark.parametrize('headers, expected_status', [
+        ({}, 411),
+        ({'Content-Length': 'abc'}, 400),
+        ({'Content-Length': '-5'}, 400),
+        ({'Content-Length': '0'}, 400)])
+def test_bad_content_length(server, headers, expected_status):
+    status, data = post(server, b'', headers)
+    assert status == expected_status
+    assert 'error' in data
+
+
+@pytest.mark.parametrize('body', [
+        b'junk',
+        encode_image('JPEG')[:len(encode_image('JPEG')) // 2],
+        encode_image('PNG')[:len(encode_image('PNG')) // 2]])
+def test_invalid_image(server, body):
+    status, data = post(server, body, {'Content-Length': str(len(body))})
+    assert status == 400
+    assert data == {'error': 'invalid image'}
+
+
+def test_failed_detection():
+    server = serve(FailingBatcher())
+    try:
+        body = encode_image()
+        status, data = post(server, body,
+                            {'Content-Length': str(len(body))})
+    finally:
+        server.shutdown()
+    assert status == 500
+    assert 'model failed' in data['error']
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from utils.boxes import apply_non_max_suppression
+from utils.boxes import apply_non_max_suppression_batch
+from utils.boxes import calculate_non_max_suppression_args
+from utils.boxes import calculate_pairwise_intersection_over_union
+
+
+def reference_non_max_suppression(boxes, iou_threshold, max_output_size=None,
+                                  class_aware=True, top_k_per_class=None):
+    """One box at a time greedy suppression in decreasing score order,
+    ties visited in the order of the boxes."""
+    scores = np.max(boxes[:, 4:], axis=-1)
+    class_args = np.argmax(boxes[:, 4:], axis=-1)
+    candidate_args = np.arange(len(boxes))
+    if top_k_per_class is not None:
+        candidate_args = []
+        for class_arg in np.unique(class_args):
+            class_box_args = np.flatnonzero(class_args == class_arg)
+            class_box_args = class_box_args[np.argsort(
+                    -scores[class_box_args], kind='mergesort')]
+            candidate_args.extend(class_box_args[:top_k_per_class])
+        candidate_args = np.sort(candidate_args)
+    candidate_args = candidate_args[np.argsort(-scores[candidate_args],
+                                               kind='mergesort')]
+    selected_args = []
+    for box_arg in candidate_args:
+        if (max_output_size is not None and
+                len(selected_args) >= max_output_size):
+            break
+        suppressed = False
+        for selected_arg in selected_args:
+            if class_aware and class_args[box_arg] != class_args[selected_arg]:
+                continue
+            iou = calculate_pairwise_intersection_over_union(
+                    boxes[None, box_arg], boxes[None, selected_arg])
+            if iou[0, 0] > iou_threshold:
+                suppressed = True
+                break
+        if not suppressed:
+            selected_args.append(box_arg)
+    return np.asarray(selected_args, dtype=int)
+
+
+def make_tied_detections(make_detections, num_boxes, num_classes,
+                         random_state):
+    """Detections whose scores are rounded so that many of them tie."""
+    boxes = make_detections(num_boxes, num_classes, (300, 400), random_state)
+    class_args = np.argmax(boxes[:, 4:], axis=-1)
+    scores = np.round(random_state.uniform(.3, 1., num_boxes), 1)
+    boxes[:, 4:] = 0
+    boxes[np.arange(num_boxes), 4 + class_args] = scores
+    return boxes
+
+
+@pytest.mark.parametrize('class_aware', [True, False])
+@pytest.mark.parametrize('max_output_size', [None, 1, 7, 40])
+def test_non_max_suppression_equals_reference(make_detections, class_aware,
+                                              max_output_size):
+    for seed in range(20):
+        random_state = np.random.RandomState(seed)
+        boxes = make_detections(random_state.randint(1, 300), 5,
+                                (300, 400), random_state)
+        expected = reference_non_max_suppression(boxes, .45, max_output_size,
+                                                 class_aware)
+        selected_boxes = apply_non_max_suppression(boxes, .45,
+                                                   max_output_size,
+                                                   class_aware)
+        np.testing.assert_array_equal(selected_boxes, boxes[expected])
+
+
+@pytest.mark.parametrize('class_aware', [True, False])
+def test_non_max_suppression_score_ties(make_detections, class_aware):
+    for seed in range(20):
+        random_state = np.random.RandomState(seed)
+        boxes = make_tied_detections(make_detections, 200, 4,
+                                     random_state)
+        expected = reference_non_max_suppression(boxes, .3, 25, class_aware)
+        selected_boxes = apply_non_max_suppression(boxes, .3, 25,
+                                                   class_aware)
+        np.testing.assert_array_equal(selected_boxes, boxes[expected])
+
+
+@pytest.mark.parametrize('class_aware', [True, False])
+def test_non_max_suppression_top_k_per_class(make_detections, class_aware):
+    for seed in range(20):
+        random_state = np.random.RandomState(seed)
+        boxes = make_tied_detections(make_detections, 150, 3,
+                                     random_state)
+        expected = reference_non_max_suppression(boxes, .45, None,
+                                                 class_aware, 10)
+        selected_boxes = apply_non_max_suppression(boxes, .45, None,
+                                                   class_aware, 10)
+        np.testing.assert_array_equal(selected_boxes, boxes[expected])
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 16])
+def test_non_max_suppression_block_boundaries(make_detections, block_size):
+    for seed in range(10):
+        random_state = np.random.RandomState(seed)
+        boxes = make_tied_detections(make_detections, 100, 3,
+                                     random_state)
+        scores = np.max(boxes[:, 4:], axis=-1)
+        class_args = np.argmax(boxes[:, 4:], axis=-1)
+        expected = reference_non_max_suppression(boxes, .45, 30)
+        selected_args = calculate_non_max_suppression_args(
+                boxes, scores, .45, 30, class_args, block_size=block_size)
+        np.testing.assert_array_equal(selected_args, expected)
+
+
+def test_non_max_suppression_is_class_agnostic_by_default(make_detections):
+    random_state = np.random.RandomState(0)
+    boxes = make_detections(200, 5, (300, 400), random_state)
+    expected = reference_non_max_suppression(boxes, .45, class_aware=False)
+    np.testing.assert_array_equal(apply_non_max_suppression(boxes, .45),
+                                  boxes[expected])
+    selected_boxes, selected_offsets = apply_non_max_suppression_batch(
+                                boxes, np.array([0, len(boxes)]), .45)
+    np.testing.assert_array_equal(selected_boxes, boxes[expected])
@@ -0,0 +1,67 @@
+import numpy as np
+
+from utils.boxes import PriorBoxIndex
+from utils.boxes import assign_prior_boxes_batch
+from utils.boxes import pad_ground_truth_data
+
+BOX_SCALE_FACTORS = [.1, .1, .2, .2]
+
+
+def with_classes(boxes, random_state, num_classes=21):
+    classes = np.eye(num_classes)[random_state.randint(1, num_classes,
+                                                       len(boxes))]
+    return np.concatenate([boxes, classes], axis=1)
+
+
+def make_edge_case_ground_truth(random_state):
+    """Boxes touching the image borders, tiny, huge and degenerate."""
+    boxes = np.array([[0., 0., .3, .2],
+                      [.7, .8, 1., 1.],
+                      [0., .4, .05, .6],
+                      [.95, 0., 1., 1.],
+                      [.5, .5, .502, .503],
+                      [.001, .998, .002, 1.],
+                      [0., 0., 1., 1.],
+                      [.02, .01, .99, .97],
+                      [.3, .3, .3, .6]])
+    return with_classes(boxes, random_state)
+
+
+def assert_same_assignments(prior_boxes, prior_box_index, ground_truth_data):
+    padded_data, object_mask = pad_ground_truth_data(ground_truth_data)
+    expected = assign_prior_boxes_batch(prior_boxes, padded_data,
+                                        object_mask, 21, BOX_SCALE_FACTORS)
+    assignments = assign_prior_boxes_batch(prior_boxes, padded_data,
+                                           object_mask, 21,
+                                           BOX_SCALE_FACTORS,
+                                           prior_box_index=prior_box_index)
+    np.testing.assert_array_equal(assignments[:, :, 4:], expected[:, :, 4:])
+    np.testing.assert_array_equal(assignments[:, :, :4], expected[:, :, :4])
+
+
+def test_indexed_matching_equals_dense_matching(model_configurations,
+                                                prior_boxes,
+                                                make_ground_truth):
+    prior_box_index = PriorBoxIndex(model_configurations, (300, 300))
+    assert prior_box_index.num_prior_boxes == len(prior_boxes)
+    for seed in range(100):
+        random_state = np.random.RandomState(seed)
+        ground_truth_data = [make_ground_truth(random_state.randint(0, 12),
+                                               random_state=random_state)
+                             for sample_arg in range(4)]
+        assert_same_assignments(prior_boxes, prior_box_index,
+                                ground_truth_data)
+
+
+def test_indexed_matching_edge_cases(model_configurations, prior_boxes,
+                                     make_ground_truth):
+    prior_box_index = PriorBoxIndex(model_configurations, (300, 300))
+    random_state = np.random.RandomState(0)
+    edge_cases = make_edge_case_ground_truth(random_state)
+    assert_same_assignments(prior_boxes, prior_box_index, [edge_cases])
+    # every edge case on its own and next to a random object
+    for edge_case in edge_cases:
+        assert_same_assignments(prior_boxes, prior_box_index,
+                                [edge_case[None],
+                                 np.concatenate([edge_case[None],
+                                                 make_ground_truth(1)])])
@@ -0,0 +1,25 @@
+import numpy as np
+
+from utils.boxes import create_prior_boxes_from_configurations
+from utils.prior_boxes import hash_model_configurations
+
+
+def test_clip_is_applied_and_hashed(model_configurations):
+    image_size = (300, 300)
+    clipped_configurations = [dict(layer_config, clip=True)
+                              for layer_config in model_configurations]
+    unclipped_configurations = [dict(layer_config, clip=False)
+                                for layer_config in model_configurations]
+    clipped_boxes = create_prior_boxes_from_configurations(
+                                    clipped_configurations, image_size)
+    unclipped_boxes = create_prior_boxes_from_configurations(
+                                    unclipped_configurations, image_size)
+    assert clipped_boxes.min() >= 0 and clipped_boxes.max() <= 1
+    assert unclipped_boxes.min() < 0 and unclipped_boxes.max() > 1
+    np.testing.assert_array_equal(np.clip(unclipped_boxes, 0, 1),
+                                  clipped_boxes)
+    key = hash_model_configurations(model_configurations, image_size)
+    assert hash_model_configurations(clipped_configurations,
+                                     image_size) == key
+    assert hash_model_configurations(unclipped_configurations,
+                                     image_size) != key
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from utils.boxes import assign_prior_boxes_batch
+from utils.boxes import assign_prior_boxes_batch_sparse
+from utils.boxes import pack_sparse_targets
+from utils.boxes import pad_ground_truth_data
+
+BOX_SCALE_FACTORS = [.1, .1, .2, .2]
+
+
+def make_batch(make_ground_truth, num_classes=21, background_id=0, seed=0):
+    random_state = np.random.RandomState(seed)
+    ground_truth_data = []
+    for num_objects in [2, 0, 5, 1]:
+        sample = make_ground_truth(num_objects, num_classes, random_state)
+        # move the one-hot of the background class to background_id
+        classes = np.roll(sample[:, 4:], background_id, axis=1)
+        ground_truth_data.append(np.concatenate([sample[:, :4], classes],
+                                                axis=1))
+    return pad_ground_truth_data(ground_truth_data)
+
+
+def dense_and_sparse_targets(prior_boxes, make_ground_truth, num_classes,
+                             background_id):
+    ground_truth_data, object_mask = make_batch(make_ground_truth,
+                                                num_classes, background_id)
+    dense_targets = assign_prior_boxes_batch(prior_boxes, ground_truth_data,
+                                             object_mask, num_classes,
+                                             BOX_SCALE_FACTORS,
+                                             background_id=background_id)
+    class_args, regressed_boxes = assign_prior_boxes_batch_sparse(
+                                prior_boxes, ground_truth_data, object_mask,
+                                BOX_SCALE_FACTORS,
+                                background_id=background_id)
+    sparse_targets = pack_sparse_targets(class_args, regressed_boxes,
+                                         background_id)
+    return dense_targets, sparse_targets
+
+
+@pytest.mark.parametrize('background_id', [0, 20])
+def test_sparse_targets_equal_dense_targets(prior_boxes, make_ground_truth,
+                                            background_id):
+    dense_targets, sparse_targets = dense_and_sparse_targets(
+                        prior_boxes, make_ground_truth, 21, background_id)
+    np.testing.assert_array_equal(sparse_targets[:, :, 4],
+                                  np.argmax(dense_targets[:, :, 4:], -1))
+    assert (sparse_targets[:, :, 4] != background_id).sum() > 0
+    np.testing.assert_allclose(sparse_targets[:, :, :4],
+                               dense_targets[:, :, :4], atol=1e-5)
+
+
+def test_sparse_multibox_loss_equals_dense_loss(prior_boxes,
+                                                make_ground_truth):
+    pytest.importorskip('tensorflow')
+    K = pytest.importorskip('keras.backend')
+    from utils.train import MultiboxLoss
+    num_classes = 21
+    dense_targets, sparse_targets = dense_and_sparse_targets(
+                        prior_boxes, make_ground_truth, num_classes, 0)
+    random_state = np.random.RandomState(0)
+    logits = random_state.normal(0, 1, dense_targets.shape[:2] +
+                                 (num_classes,))
+    probabilities = np.exp(logits) / np.exp(logits).sum(-1, keepdims=True)
+    predictions = np.concatenate([
+                random_state.normal(0, 1, dense_targets.shape[:2] + (4,)),
+                probabilities,
+                np.zeros(dense_targets.shape[:2] + (8,))], axis=-1)
+    predictions = K.constant(predictions.astype('float32'))
+    dense_loss = MultiboxLoss(num_classes).compute_loss(
+                            K.constant(dense_targets.astype('float32')),
+                            predictions)
+    sparse_loss = MultiboxLoss(num_classes, sparse_labels=True).compute_loss(
+                            K.constant(sparse_targets), predictions)
+    np.testing.assert_allclose(K.eval(sparse_loss), K.eval(dense_loss),
+                               rtol=1e-5)
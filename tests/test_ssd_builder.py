@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+pytest.importorskip('keras')
+pytest.importorskip('h5py')
+
+from models.ssd_builder import PRESETS
+from models.ssd_builder import build_preset
+from models.ssd_builder import load_matching_weights
+
+
+@pytest.fixture(scope='module')
+def SSD300_weights(tmpdir_factory):
+    """Weights with the SSD300 layer names and shapes."""
+    model = build_preset('SSD300')
+    weights_path = str(tmpdir_factory.mktemp('weights').join('SSD300.hdf5'))
+    model.save_weights(weights_path)
+    weights = dict((layer.name, layer.get_weights())
+                   for layer in model.layers)
+    return weights_path, weights
+
+
+@pytest.mark.parametrize('preset_name', sorted(PRESETS))
+def test_presets_load_SSD300_weights(SSD300_weights, preset_name):
+    weights_path, weights = SSD300_weights
+    model = build_preset(preset_name, weights_path=weights_path)
+    skipped_layer_names = load_matching_weights(model, weights_path)
+    if preset_name == 'SSD300':
+        assert skipped_layer_names == []
+    if preset_name == 'SSD300_lite_small':
+        assert 'fc6' in skipped_layer_names
+    for layer in model.layers:
+        if (layer.name not in weights or layer.name in skipped_layer_names
+                or len(layer.get_weights()) == 0):
+            continue
+        for weight, expected in zip(layer.get_weights(),
+                                    weights[layer.name]):
+            np.testing.assert_array_equal(weight, expected)
+    np.testing.assert_array_equal(
+                model.get_layer('conv1_1').get_weights()[0],
+                weights['conv1_1'][0])
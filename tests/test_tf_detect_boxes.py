@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from utils import tf_boxes
+from utils.boxes import apply_non_max_suppression
+from utils.boxes import decode_and_filter_boxes
+from utils.boxes import denormalize_box
+from utils.tf_boxes import detect_boxes
+
+BOX_SCALE_FACTORS = [.1, .1, .2, .2]
+NUM_CLASSES = 21
+IMAGE_SHAPES = [(480, 640), (300, 300), (720, 1280)]
+
+
+def predict_boxes(predictions, prior_boxes, image_shape, class_aware):
+    """The post-processing of inference.predict, which suppresses the
+    boxes of all classes with tf_boxes.apply_non_max_suppression, or of
+    inference.predict_batch if class_aware."""
+    boxes = decode_and_filter_boxes(predictions, prior_boxes,
+                                    BOX_SCALE_FACTORS, NUM_CLASSES, 0, .1)
+    if len(boxes) == 0:
+        return np.zeros((0, 4 + NUM_CLASSES))
+    boxes = denormalize_box(boxes, image_shape)
+    if class_aware:
+        return apply_non_max_suppression(boxes, .45, 100, class_aware)
+    return tf_boxes.apply_non_max_suppression(boxes, .45, 100)
+
+
+@pytest.mark.parametrize('class_aware', [True, False])
+def test_detect_boxes_equals_predict(prior_boxes, make_predictions,
+                                     class_aware):
+    random_state = np.random.RandomState(0)
+    predictions = np.stack([make_predictions(prior_boxes, NUM_CLASSES,
+                                             random_state)
+                            for image_shape in IMAGE_SHAPES])
+    graph = tf.Graph()
+    with graph.as_default():
+        predictions_tensor = tf.placeholder('float32', predictions.shape)
+        image_shapes_tensor = tf.placeholder('float32', (None, 2))
+        detections_tensor, num_detections_tensor = detect_boxes(
+                    predictions_tensor, prior_boxes, image_shapes_tensor,
+                    NUM_CLASSES, .1, .45, 0, BOX_SCALE_FACTORS, 100,
+                    class_aware)
+    with tf.Session(graph=graph) as session:
+        detections, num_detections = session.run(
+                    [detections_tensor, num_detections_tensor],
+                    feed_dict={predictions_tensor: predictions,
+                               image_shapes_tensor: IMAGE_SHAPES})
+    for image_predictions, image_shape, image_detections, num_boxes in zip(
+            predictions, IMAGE_SHAPES, detections, num_detections):
+        expected = predict_boxes(image_predictions, prior_boxes,
+                                 image_shape, class_aware)
+        assert num_boxes == len(expected)
+        np.testing.assert_array_equal(image_detections[num_boxes:], 0)
+        np.testing.assert_allclose(image_detections[:num_boxes, 4:],
+                                   expected[:, 4:], atol=1e-6)
+        np.testing.assert_allclose(image_detections[:num_boxes, :4],
+                                   expected[:, :4], atol=1e-2)
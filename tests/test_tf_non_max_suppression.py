@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from utils import tf_boxes
+
+
+def count_operations(graph):
+    return len(graph.get_operations())
+
+
+def count_op_set_operations(iou_treshold, max_output_size):
+    """Number of operations of a single NonMaxSuppression op set."""
+    non_max_suppression = tf_boxes.NonMaxSuppression(iou_treshold,
+                                                     max_output_size)
+    return count_operations(non_max_suppression.graph)
+
+
+def test_repeated_calls_do_not_grow_graph(make_detections):
+    random_state = np.random.RandomState(0)
+    tf_boxes.apply_non_max_suppression(make_detections(10), .37, 17)
+    num_operations = count_operations(tf_boxes.graph)
+    for call_arg in range(50):
+        num_boxes = random_state.randint(0, 500)
+        detections = make_detections(num_boxes, random_state=random_state)
+        tf_boxes.apply_non_max_suppression(detections, .37, 17)
+        assert count_operations(tf_boxes.graph) == num_operations
+
+
+def test_new_key_adds_one_op_set(make_detections):
+    op_set_size = count_op_set_operations(.41, 23)
+    tf_boxes.apply_non_max_suppression(make_detections(10), .41, 23)
+    num_operations = count_operations(tf_boxes.graph)
+    tf_boxes.apply_non_max_suppression(make_detections(10), .41, 24)
+    assert count_operations(tf_boxes.graph) == num_operations + op_set_size
+    tf_boxes.apply_non_max_suppression(make_detections(300), .41, 24)
+    tf_boxes.apply_non_max_suppression(make_detections(20), .41, 23)
+    assert count_operations(tf_boxes.graph) == num_operations + op_set_size
+
+
+def test_get_non_max_suppression_reuses_op():
+    non_max_suppression = tf_boxes.get_non_max_suppression(.43, 11)
+    assert tf_boxes.get_non_max_suppression(.43, 11) is non_max_suppression
+    assert tf_boxes.get_non_max_suppression(.43, 12) is not (
+                                                    non_max_suppression)